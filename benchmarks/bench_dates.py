@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of the date parsers used on ``maj``, ``debut`` and ``fin`` attributes.
+
+Compares the former ``strptime`` path with ``models.parse_iso_datetime()``
+and ``models.parse_iso_timestamp()``, with and without their cache.
+
+Usage: ``python3 benchmarks/bench_dates.py [-n NUMBER] [--distinct DISTINCT]``
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prixcarburants import models  # pylint: disable=wrong-import-position
+
+
+def strptime_parser(date_str: str) -> datetime:
+    """Former implementation of ``models.parse_iso_datetime()``"""
+    if "T" in date_str:
+        return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
+    return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+
+
+def build_dates(number: int, distinct: int):
+    """
+    Build ``number`` date strings with ``distinct`` different values,
+    mixing both separators used by the feed
+    """
+    randomizer = random.Random(42)
+    start = datetime(2022, 1, 1)
+    values = []
+    for index in range(distinct):
+        date = start + timedelta(seconds=randomizer.randrange(365 * 24 * 3600))
+        values.append(date.isoformat(sep="T" if index % 2 else " "))
+    return [values[randomizer.randrange(distinct)] for _ in range(number)]
+
+
+def main():
+    """Run the benchmark and print the time per call of each parser"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=200000, help="dates to parse")
+    parser.add_argument("--distinct", type=int, default=20000, help="distinct dates")
+    arguments = parser.parse_args()
+    dates = build_dates(arguments.number, arguments.distinct)
+    for date_str in dates[:1000]:
+        assert models.parse_iso_datetime(date_str) == strptime_parser(date_str)
+        assert models.from_epoch(models.parse_iso_timestamp(date_str)) == strptime_parser(date_str)
+
+    candidates = {
+        "strptime": strptime_parser,
+        "fromisoformat (no cache)": models.parse_iso_datetime.__wrapped__,
+        "parse_iso_datetime": models.parse_iso_datetime,
+        "parse_iso_timestamp": models.parse_iso_timestamp,
+    }
+    reference = None
+    for name, function in candidates.items():
+        if hasattr(function, "cache_clear"):
+            function.cache_clear()
+        duration = timeit.timeit(lambda f=function: [f(date) for date in dates], number=1)
+        reference = reference or duration
+        print(
+            f"{name:<26} {duration / len(dates) * 1e9:8.0f} ns/call"
+            f"  x{reference / duration:6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
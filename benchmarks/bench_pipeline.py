@@ -0,0 +1,228 @@
+"""
+Benchmark of the transform pipeline over synthetic feeds.
+
+For each scale, a feed is generated once (see ``feed.py``), then the pipeline runs
+in a fresh process: parsing, degradation to latest, metrics, price distributions,
+and JSON output of both.
+Per-stage timings, throughput and peak RSS are printed, appended to a JSONL results file,
+and compared with the previous result of the same scale in that file:
+the exit status is 1 when a stage is slower than the threshold allows.
+
+The XML parser is chosen with ``--parser``, results being only compared with the same parser.
+
+Usage: ``python3 benchmarks/bench_pipeline.py [-s {now,day,year}]... [--parser NAME] [--repeat N]
+[--threshold T]``
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import feed  # pylint: disable=wrong-import-position
+
+from prixcarburants import backends, distribution, parse  # pylint: disable=wrong-import-position
+
+DATA_DIRECTORY = os.path.join(ROOT, ".cache", "bench")
+RESULTS_FILE = os.path.join(ROOT, ".cache", "bench", "results.jsonl")
+NOISE = 0.01  # Slowdowns below this number of seconds are never reported as regressions
+
+
+def run_pipeline(path: str, parser: str) -> dict:
+    """
+    Run each stage of the pipeline on the feed at ``path``, in the current process,
+    parsing it with the XML ``parser``
+    :return: Timings of the stages, in seconds, counts and peak RSS, in kilobytes
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        sale_points = parse.build_sale_points(path, parser)
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        degraded = parse.degrade_to_latest(sale_points)
+        timings["degrade"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parse.build_metrics(degraded)
+        timings["metrics"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        distribution.build_distributions(degraded)
+        timings["distributions"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parse.save_as_json(sale_points, os.path.join(directory, "full.json"))
+        timings["save_full"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parse.save_as_json(degraded, os.path.join(directory, "latest.json"))
+        timings["save_latest"] = time.perf_counter() - start
+    return {
+        "timings": timings,
+        "sale_points": len(sale_points),
+        "prices": sum(len(prices) for point in sale_points for prices in point.prices.values()),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def measure(path: str, parser: str, repeat: int) -> dict:
+    """
+    Run the pipeline ``repeat`` times, each in a fresh process so that peak RSS is its own
+    :return: Measures of the fastest run, per stage, and the highest peak RSS
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", path, "--parser", parser],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output))
+    result = runs[0]
+    result["timings"] = {
+        stage: min(run["timings"][stage] for run in runs) for stage in result["timings"]
+    }
+    result["peak_rss_kb"] = max(run["peak_rss_kb"] for run in runs)
+    return result
+
+
+def feed_path(scale: str, stations: Optional[int], seed: int) -> str:
+    """Return the path to the feed of ``scale``, generating it if needed"""
+    count, per_fuel = feed.SCALES[scale]
+    count = stations or count
+    path = os.path.join(DATA_DIRECTORY, f"{scale}-{count}-{seed}.xml")
+    if not os.path.isfile(path):
+        os.makedirs(DATA_DIRECTORY, exist_ok=True)
+        print(f"Generating {path}", file=sys.stderr)
+        feed.generate(path, count, per_fuel, seed)
+    return path
+
+
+def git_revision() -> Optional[str]:
+    """Return the current commit of the repository, if any"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_result(results_file: str, scale: str, stations: int, parser: str) -> Optional[dict]:
+    """Return the last result of the same scale, size and parser in ``results_file``"""
+    if not os.path.isfile(results_file):
+        return None
+    previous = None
+    with open(results_file, "r", encoding="utf8") as stream:
+        for line in stream:
+            result = json.loads(line)
+            if (
+                result["scale"] == scale
+                and result["sale_points"] == stations
+                and result.get("parser", backends.DEFAULT) == parser
+            ):
+                previous = result
+    return previous
+
+
+def report(result: dict, previous: Optional[dict], threshold: float) -> List[str]:
+    """
+    Print ``result`` compared with the ``previous`` one
+    :return: Names of the stages slower than ``previous`` by more than ``threshold``
+    """
+    regressions = []
+    size = result["size_mb"]
+    print(
+        f"\n{result['scale']} ({result['parser']}): {result['sale_points']} sale points,"
+        f" {result['prices']} prices,"
+        f" {size:.1f} MB, peak RSS {result['peak_rss_kb'] / 1024:.0f} MB"
+    )
+    for stage, duration in result["timings"].items():
+        line = f"  {stage:<13} {duration:8.3f} s"
+        if stage == "parse":
+            line += f"  {result['sale_points'] / duration:9.0f} sale points/s"
+            line += f" {size / duration:6.1f} MB/s"
+        if previous is not None and stage in previous["timings"]:
+            reference = previous["timings"][stage]
+            ratio = duration / reference
+            line += f"  x{ratio:.2f} vs {previous.get('revision')}"
+            if ratio > 1 + threshold and duration - reference > NOISE:
+                line += "  REGRESSION"
+                regressions.append(stage)
+        print(line)
+    total = sum(result["timings"].values())
+    print(f"  {'total':<13} {total:8.3f} s  {result['sale_points'] / total:9.0f} sale points/s")
+    return regressions
+
+
+def main():
+    """Run the benchmark of the scales given in command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-s",
+        "--scale",
+        dest="scales",
+        action="append",
+        choices=tuple(feed.SCALES),
+        help="scale to run, can be repeated. Default to now and day.",
+    )
+    parser.add_argument(
+        "--stations", type=int, help="number of sale points, instead of the scale's"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="seed of the synthetic feeds")
+    parser.add_argument(
+        "--parser", choices=tuple(backends.PARSERS), default=backends.DEFAULT, help="XML parser"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scale, the fastest is kept")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSONL file of the results")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="slowdown ratio reported as a regression"
+    )
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.run is not None:
+        print(json.dumps(run_pipeline(arguments.run, arguments.parser)))
+        return
+
+    regressions: Dict[str, List[str]] = {}
+    for scale in arguments.scales or ("now", "day"):
+        path = feed_path(scale, arguments.stations, arguments.seed)
+        result = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "scale": scale,
+            "parser": arguments.parser,
+            "size_mb": os.path.getsize(path) / 1e6,
+        }
+        result.update(measure(path, arguments.parser, arguments.repeat))
+        previous = previous_result(
+            arguments.results, scale, result["sale_points"], arguments.parser
+        )
+        regressions[scale] = report(result, previous, arguments.threshold)
+        os.makedirs(os.path.dirname(os.path.abspath(arguments.results)), exist_ok=True)
+        with open(arguments.results, "a", encoding="utf8") as stream:
+            stream.write(json.dumps(result) + "\n")
+    if any(regressions.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the startup of the command line interface.
+
+Runs ``python -X importtime -m prixcarburants -h`` several times and sums the time spent
+importing modules after the interpreter started, keeping the fastest run.
+The exit status is 1 when this time exceeds the budget, or when a module only needed by
+some commands, such as ``requests`` or ``numpy``, is imported at startup.
+A plain ``transform`` of a tiny local feed is also run, which must not import the modules
+only needed by downloads or by its optional outputs either.
+
+Usage: ``python3 benchmarks/bench_startup.py [--budget MS] [--repeat N]``
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, Tuple
+
+import feed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that must only be imported by the commands using them
+LAZY_MODULES = (
+    "requests",
+    "numpy",
+    "asyncio",
+    "cProfile",
+    "xml.etree.ElementTree",
+    "prixcarburants.parse",
+)
+# Modules that a plain transform of a local file must not import
+TRANSFORM_LAZY_MODULES = ("requests", "numpy", "asyncio", "cProfile")
+SLOWEST = 5  # Number of slowest imports reported
+# Maximal import time, in milliseconds. About 80 ms are measured with Python 3.8, as run by CI,
+# where argparse, runpy and logging alone take about 45 ms.
+BUDGET = 100.0
+
+
+def import_times(arguments: List[str]) -> List[Tuple[str, int, int]]:
+    """
+    Run the command line interface with ``arguments``, recording the imports
+    :return: Name, depth and cumulative time in microseconds of each module imported
+        after the interpreter started, in order
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "prixcarburants", *arguments],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    imports, started = [], False
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if started:
+            imports.append((name, depth, int(cumulative)))
+        elif name == "site" and depth == 0:  # Last import of the interpreter startup
+            started = True
+    return imports
+
+
+def transform_imports() -> List[str]:
+    """Return the names of the modules imported by a plain transform of a tiny local feed"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "feed.xml")
+        feed.generate(path, 10, 1)
+        imports = import_times(["transform", path, "-o", os.path.join(directory, "feed.json")])
+    return [name for name, _, _ in imports]
+
+
+def main():
+    """Measure the startup and check it against the budget given in command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--budget", type=float, default=BUDGET, help="maximal import time, in milliseconds"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest is kept")
+    arguments = parser.parse_args()
+
+    runs = [import_times(["-h"]) for _ in range(arguments.repeat)]
+    totals = [sum(time for _, depth, time in run if depth == 0) for run in runs]
+    fastest = runs[totals.index(min(totals))]
+    total = min(totals) / 1000
+    print(
+        f"Imports at startup: {len(fastest)} modules, {total:.1f} ms (budget {arguments.budget} ms)"
+    )
+    for name, _, time in sorted(
+        (entry for entry in fastest if entry[1] == 0), key=lambda entry: -entry[2]
+    )[:SLOWEST]:
+        print(f"  {name:<30} {time / 1000:6.1f} ms")
+    failed = total > arguments.budget
+    if failed:
+        print("OVER BUDGET")
+    eager = [module for module in LAZY_MODULES if module in {name for name, _, _ in fastest}]
+    if eager:
+        print(f"Imported at startup, should be lazy: {', '.join(eager)}")
+        failed = True
+    imported = set(transform_imports())
+    eager = [module for module in TRANSFORM_LAZY_MODULES if module in imported]
+    if eager:
+        print(f"Imported by a local transform, should be lazy: {', '.join(eager)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
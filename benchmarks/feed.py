@@ -0,0 +1,158 @@
+"""
+Synthetic generator of the fuel prices feed.
+
+Writes windows-1252 XML in the schema of the french Open Data files
+(``pdv``, ``adresse``, ``ville``, ``horaires``, ``services``, ``prix``, ``rupture``, ``fermeture``),
+at the scale of the instantaneous, day or year files. Output is deterministic for a given seed.
+
+Usage: ``python3 benchmarks/feed.py {now,day,year} OUTPUT [--stations N] [--seed SEED]``
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from typing import IO, List
+
+# Number of sale points, and of prices per fuel sold by a sale point, of each scale
+SCALES = {
+    "now": (10000, 1),
+    "day": (10000, 3),
+    "year": (10000, 60),
+}
+FUEL_NAMES = ("Gazole", "SP95", "E85", "GPLc", "E10", "SP98")
+SERVICES = (
+    "Lavage automatique",
+    "Boutique alimentaire",
+    "Station de gonflage",
+    "Vente de gaz domestique (Butane, Propane)",
+    "Toilettes publiques",
+    "Automate CB 24/24",
+    "DAB (Distributeur automatique de billets)",
+)
+CITIES = ("Saint-Étienne", "Besançon", "Orléans", "Évry", "Nîmes", "Béziers", "Périgueux")
+POSTCODES = ("01000", "13012", "20090", "20200", "33000", "59780", "69003", "75015", "95000")
+START = datetime(2022, 1, 1)
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+def _date(moment: datetime, randomizer: random.Random) -> str:
+    """Format a date like the feed does, with either separator"""
+    return moment.isoformat(sep="T" if randomizer.random() < 0.5 else " ")
+
+
+def _write_opening_days(write, randomizer: random.Random):
+    """Write the ``horaires`` element of a sale point, most of them having one"""
+    if randomizer.random() >= 0.8:
+        return
+    automaton = "1" if randomizer.random() < 0.3 else ""
+    write(f'    <horaires automate-24-24="{automaton}">\n')
+    for day in range(1, 8):
+        closed = "1" if day == 7 and randomizer.random() < 0.4 else ""
+        write(f'      <jour id="{day}" nom="Jour{day}" ferme="{closed}">\n')
+        if not closed:
+            write('        <horaire ouverture="07.00" fermeture="12.30"/>\n')
+            write('        <horaire ouverture="13.30" fermeture="19.45"/>\n')
+        write("      </jour>\n")
+    write("    </horaires>\n")
+
+
+def _write_services(write, randomizer: random.Random):
+    """Write the ``services`` element of a sale point"""
+    services = randomizer.sample(SERVICES, randomizer.randrange(len(SERVICES)))
+    if not services:
+        write("    <services/>\n")
+        return
+    write("    <services>\n")
+    for service in services:
+        write(f"      <service>{service}</service>\n")
+    write("    </services>\n")
+
+
+def _write_prices(write, fuels: List[int], per_fuel: int, randomizer: random.Random):
+    """Write the ``prix`` elements of a sale point, ``per_fuel`` for each of its ``fuels``"""
+    if not fuels:
+        write("    <prix/>\n")
+    for fuel in sorted(fuels):
+        price = randomizer.uniform(1.5, 2.2)
+        for moment in sorted(randomizer.randrange(YEAR_SECONDS) for _ in range(per_fuel)):
+            price = max(0.5, price + randomizer.uniform(-0.03, 0.03))
+            write(
+                f'    <prix nom="{FUEL_NAMES[fuel]}" id="{fuel + 1}"'
+                f' maj="{_date(START + timedelta(seconds=moment), randomizer)}"'
+                f' valeur="{price:.3f}"/>\n'
+            )
+
+
+def _write_events(write, fuels: List[int], randomizer: random.Random):
+    """Write the ``rupture`` elements of fuels not in ``fuels`` and the ``fermeture`` element"""
+    for fuel, name in enumerate(FUEL_NAMES):
+        if fuel not in fuels and randomizer.random() < 0.1:
+            start = START + timedelta(seconds=randomizer.randrange(YEAR_SECONDS))
+            write(
+                f'    <rupture id="{fuel + 1}" nom="{name}"'
+                f' debut="{_date(start, randomizer)}" fin="" type="temporaire"/>\n'
+            )
+    if randomizer.random() < 0.05:
+        start = START + timedelta(seconds=randomizer.randrange(YEAR_SECONDS))
+        end = start + timedelta(days=randomizer.randint(1, 30))
+        write(
+            f'    <fermeture type="T" debut="{_date(start, randomizer)}"'
+            f' fin="{_date(end, randomizer)}"/>\n'
+        )
+
+
+def write_sale_point(stream: IO[str], index: int, per_fuel: int, randomizer: random.Random):
+    """Write the ``pdv`` element of the sale point at ``index``"""
+    write = stream.write
+    postcode = randomizer.choice(POSTCODES)
+    identifier = int(postcode[:2]) * 1000000 + index
+    latitude = randomizer.uniform(4200000, 5100000)
+    longitude = randomizer.uniform(-450000, 820000)
+    write(
+        f'  <pdv id="{identifier}" latitude="{latitude:.0f}" longitude="{longitude:.5f}"'
+        f' cp="{postcode}" pop="{randomizer.choice("RA")}">\n'
+    )
+    write(f"    <adresse>{index} route de l'Église</adresse>\n")
+    write(f"    <ville>{randomizer.choice(CITIES)}</ville>\n")
+    _write_opening_days(write, randomizer)
+    _write_services(write, randomizer)
+    count = 0 if randomizer.random() < 0.03 else randomizer.randint(1, 4)
+    fuels = randomizer.sample(range(len(FUEL_NAMES)), count)
+    _write_prices(write, fuels, per_fuel, randomizer)
+    _write_events(write, fuels, randomizer)
+    write("  </pdv>\n")
+
+
+def generate(path: str, stations: int, per_fuel: int, seed: int = 42):
+    """
+    Write a synthetic feed at ``path``
+    :param path: Path to the XML file to write
+    :param stations: Number of sale points
+    :param per_fuel: Number of prices per fuel sold by a sale point
+    :param seed: Seed of the random generator
+    """
+    randomizer = random.Random(seed)
+    with open(path, "w", encoding="windows-1252", newline="\n") as stream:
+        stream.write('<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>\n<pdv_liste>\n')
+        for index in range(stations):
+            write_sale_point(stream, index, per_fuel, randomizer)
+        stream.write("</pdv_liste>\n")
+
+
+def main():
+    """Generate a feed from command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scale", choices=tuple(SCALES), help="scale of the feed")
+    parser.add_argument("output", help="XML file to write")
+    parser.add_argument(
+        "--stations", type=int, help="number of sale points, instead of the scale's"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="seed of the random generator")
+    arguments = parser.parse_args()
+    stations, per_fuel = SCALES[arguments.scale]
+    generate(arguments.output, arguments.stations or stations, per_fuel, arguments.seed)
+    print(arguments.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+/**
+ * Decoder of the compact binary format, written by ``prixcarburants/output.py``
+ */
+
+const MAGIC = "PCBF"
+const VERSION = 1
+// Layout of data degraded to latest
+export const LAYOUT_LATEST = 0
+// Scale of the prices, stored as integers
+const PRICE_SCALE = 1000.0
+// Size in bytes of each column type
+const ITEM_SIZES = { d: 8, i: 4, q: 8, b: 1, s: 4, p: 4 }
+// First five keys of the rows of data degraded to latest, before the prices
+const LATEST_KEYS = ["latitude", "longitude", "address", "postcode", "city"]
+
+/**
+ * Read an item of a column
+ * @param {DataView} view View on the content
+ * @param {string} type Type code of the column
+ * @param {number} offset Offset of the item
+ * @returns {number} Value of the item
+ */
+function readItem(view, type, offset) {
+  switch (type) {
+    case "d":
+      return view.getFloat64(offset, true)
+    case "q":
+      return Number(view.getBigInt64(offset, true))
+    case "b":
+      return view.getInt8(offset)
+    case "s":
+      return view.getUint32(offset, true)
+    default:
+      return view.getInt32(offset, true)
+  }
+}
+
+/**
+ * Decode binary content
+ * @param {ArrayBuffer} buffer Content, such as ``await response.arrayBuffer()``
+ * @returns {object} ``layout`` of the content, and ``columns`` values by name
+ */
+export function decode(buffer) {
+  const view = new DataView(buffer)
+  const bytes = new Uint8Array(buffer)
+  const text = new TextDecoder("utf-8")
+  if (
+    text.decode(bytes.subarray(0, 4)) !== MAGIC ||
+    view.getUint16(4, true) !== VERSION
+  ) {
+    throw new Error("Content is not in binary format of version " + VERSION)
+  }
+  const layout = view.getUint16(6, true)
+  const stringCount = view.getUint32(8, true)
+  const columnCount = view.getUint32(12, true)
+  let offset = 16
+  let strings = new Array(stringCount)
+  for (let i = 0; i < stringCount; i++) {
+    const length = view.getUint16(offset, true)
+    strings[i] = text.decode(bytes.subarray(offset + 2, offset + 2 + length))
+    offset += 2 + length
+  }
+  let columns = {}
+  for (let c = 0; c < columnCount; c++) {
+    const nameLength = view.getUint16(offset, true)
+    const type = String.fromCharCode(view.getUint8(offset + 2))
+    const count = view.getUint32(offset + 3, true)
+    offset += 7
+    const name = text.decode(bytes.subarray(offset, offset + nameLength))
+    offset += nameLength
+    let values = new Array(count)
+    for (let i = 0; i < count; i++) {
+      const value = readItem(view, type, offset)
+      offset += ITEM_SIZES[type]
+      if (type === "s") {
+        values[i] = strings[value]
+      } else if (type === "p") {
+        values[i] = value === -1 ? -1 : value / PRICE_SCALE
+      } else {
+        values[i] = value
+      }
+    }
+    columns[name] = values
+  }
+  return { layout, columns }
+}
+
+/**
+ * Convert decoded data degraded to latest back to the JSON structure
+ * @param {object} decoded Result of ``decode()``, of layout ``LAYOUT_LATEST``
+ * @param {Array<string>} fuelNames Names of the fuel types, in the order of the rows
+ * @returns {object} ``keys``, ``data`` rows and ``ids``, as in the JSON output
+ */
+export function toLatest(decoded, fuelNames) {
+  const keys = LATEST_KEYS.concat(fuelNames)
+  const columns = keys.map((key) => decoded.columns[key])
+  const data = decoded.columns.id.map((_, row) =>
+    columns.map((column) => column[row])
+  )
+  return { keys, data, ids: decoded.columns.id.map(String) }
+}
+
+export default { decode, toLatest, LAYOUT_LATEST }
@@ -0,0 +1,50 @@
+/**
+ * Patch of a snapshot of latest data with a diff, written by ``prixcarburants/diff.py``
+ */
+
+/**
+ * Apply a diff on a snapshot.
+ * The snapshot must be the one the diff was computed from, i.e. the one identified by
+ * ``patch.from``. Keep ``patch.to`` as the identifier of the patched snapshot,
+ * to know which diff applies next.
+ * @param {object} snapshot Snapshot, with ``keys``, ``data`` and ``ids``
+ * @param {object} patch Diff, with ``keys``, ``added``, ``removed``, ``changed``,
+ *  and optionally ``order``
+ * @returns {object} Patched snapshot
+ */
+export function applyDiff(snapshot, patch) {
+  if (snapshot.keys.join() !== patch.keys.join()) {
+    throw new Error("Snapshot and diff have different keys")
+  }
+  const positions = {}
+  patch.keys.forEach((key, position) => {
+    positions[key] = position
+  })
+  const removed = new Set(patch.removed)
+  let rows = new Map()
+  snapshot.ids.forEach((id, index) => {
+    if (removed.has(id)) {
+      return
+    }
+    let row = snapshot.data[index]
+    const changes = patch.changed[id]
+    if (changes !== undefined) {
+      row = row.slice()
+      for (const [key, value] of Object.entries(changes)) {
+        row[positions[key]] = value
+      }
+    }
+    rows.set(id, row)
+  })
+  for (const [id, row] of patch.added) {
+    rows.set(id, row)
+  }
+  const ids = patch.order !== undefined ? patch.order : Array.from(rows.keys())
+  return {
+    keys: snapshot.keys,
+    data: ids.map((id) => rows.get(id)),
+    ids: ids,
+  }
+}
+
+export default { applyDiff }
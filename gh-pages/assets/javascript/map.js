@@ -84,12 +84,48 @@ export class Map extends BaseMap {
     this.info.addTo(this.map)
     this.markersDisplayed = false
     this.popupsDisplayed = false
+    this.viewChangeCallbacks = []
     this.map.on("zoomend", () => {
       this.onZoom(this.map.getZoom())
     })
     this.map.on("dragend", () => {
       this.onDrag()
     })
+    this.map.on("moveend", () => {
+      for (const callback of this.viewChangeCallbacks) {
+        callback()
+      }
+    })
+  }
+
+  /**
+   * Register a function to call whenever the visible area changes
+   * @param {function} callback Function to call
+   */
+  onViewChange(callback) {
+    this.viewChangeCallbacks.push(callback)
+  }
+
+  /**
+   * Return whether the current zoom is enough to display markers
+   * @returns {boolean} Whether markers are displayed
+   */
+  displaysMarkers() {
+    return this.map.getZoom() >= MAP_CONSTANTS.markersZoom
+  }
+
+  /**
+   * Return the visible area
+   * @returns {Array<number>} Bounds, as ``[south, west, north, east]`` in degrees
+   */
+  getBounds() {
+    const bounds = this.map.getBounds()
+    return [
+      bounds.getSouth(),
+      bounds.getWest(),
+      bounds.getNorth(),
+      bounds.getEast(),
+    ]
   }
 
   /**
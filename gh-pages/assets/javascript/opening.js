@@ -0,0 +1,55 @@
+/**
+ * Opening hours of the sale points, written by ``prixcarburants/opening.py``
+ */
+
+const MINUTES_PER_DAY = 24 * 60
+
+/**
+ * Minutes between the Monday before a date and this date, in local time
+ * @param {Date} date Date
+ * @returns {number} Minute of the week
+ */
+export function minuteOfWeek(date) {
+  const day = (date.getDay() + 6) % 7 // Monday first
+  return day * MINUTES_PER_DAY + date.getHours() * 60 + date.getMinutes()
+}
+
+/**
+ * Whether a sale point is open at a date
+ * @param {object} opening Opening hours, with ``schedules`` and ``stations``
+ * @param {number} position Position of the sale point in ``opening.ids``
+ * @param {Date} date Date
+ * @returns {boolean|null} Whether the sale point is open, or null if its hours are unknown
+ */
+export function isOpen(opening, position, date) {
+  const schedule = opening.stations[position]
+  if (schedule < 0) {
+    return null
+  }
+  const minute = minuteOfWeek(date)
+  const intervals = opening.schedules[schedule]
+  for (let index = 0; index < intervals.length; index += 2) {
+    if (intervals[index] <= minute && minute < intervals[index + 1]) {
+      return true
+    }
+  }
+  return false
+}
+
+/**
+ * Ids of the sale points open at a date
+ * @param {object} opening Opening hours, with ``ids``, ``schedules``, ``stations``,
+ *  ``fuels`` and ``fuel_types``
+ * @param {Date} date Date
+ * @param {string} fuelType Only keep the sale points selling this fuel type, if given
+ * @returns {Array<string>} Ids of the sale points open
+ */
+export function openStations(opening, date, fuelType) {
+  const fuelBit = fuelType === undefined ? 0 : 1 << opening.fuel_types.indexOf(fuelType)
+  return opening.ids.filter(
+    (_, position) =>
+      (opening.fuels[position] & fuelBit) === fuelBit && isOpen(opening, position, date) === true
+  )
+}
+
+export default { minuteOfWeek, isOpen, openStations }
@@ -1,33 +1,90 @@
 import utils from "./utils.js"
 import { Map } from "./map.js"
 
+// Directory of the tiles of sale points, one per department
+const TILES_URL = "./assets/data/tiles/"
+// Scale of the coordinates of the sale points
+const COORDINATE_SCALE = 100000.0
+
+/**
+ * Return whether two bounding boxes intersect
+ * @param {Array<number>} first Bounds, as ``[south, west, north, east]``
+ * @param {Array<number>} second Bounds, as ``[south, west, north, east]``
+ * @returns {boolean} Whether the bounding boxes intersect
+ */
+function intersects(first, second) {
+  return (
+    first[0] <= second[2] &&
+    second[0] <= first[2] &&
+    first[1] <= second[3] &&
+    second[1] <= first[3]
+  )
+}
+
 /**
- * Build and display the map of sale points, as well as the fuel type selector
+ * Add the markers of sale points to the map
+ * @param {Map} map Map to add the markers to
  * @param {Array<object>} salePoints List of sale points
+ * @param {number} fuelType Index of the price to display in a sale point
+ */
+function addMarkers(map, salePoints, fuelType) {
+  for (let salePoint of salePoints) {
+    const price = salePoint[fuelType]
+    if (price < 0) {
+      continue
+    }
+    const shortInfo = "<b>" + price.toFixed(2) + "€</b>"
+    const longInfo =
+      shortInfo +
+      "<br />" +
+      [salePoint[2], salePoint[3], salePoint[4]].join(", ")
+    map.addMarker(
+      salePoint[0] / COORDINATE_SCALE,
+      salePoint[1] / COORDINATE_SCALE,
+      shortInfo,
+      longInfo
+    )
+  }
+}
+
+/**
+ * Build and display the map of sale points, as well as the fuel type selector.
+ * Tiles of sale points are only fetched once visible and zoomed in enough.
+ * @param {object} manifest Manifest of the tiles
  */
-function buildMap(salePoints, fuelNames) {
+function buildMap(manifest) {
+  const fuelNames = manifest.keys.slice(5)
   let map = new Map("sale-points-map")
+  let fuelType = 5
+  // Sale points of each tile, by name, once fetched
+  let loaded = {}
+
+  const loadVisibleTiles = async () => {
+    if (!map.displaysMarkers()) {
+      return
+    }
+    const bounds = map.getBounds().map((value) => value * COORDINATE_SCALE)
+    for (const tile of manifest.tiles) {
+      if (tile.name in loaded || !intersects(bounds, tile.bounds)) {
+        continue
+      }
+      loaded[tile.name] = []
+      const response = await fetch(TILES_URL + tile.file)
+      const data = await response.json()
+      loaded[tile.name] = data.data
+      addMarkers(map, data.data, fuelType)
+      map.invalidate()
+    }
+  }
+
+  map.onViewChange(loadVisibleTiles)
   map.locate()
   utils.buildSelector("#sale-points-selector", fuelNames, (e) => {
     const fuelName = e.target.innerText
-    const fuelType = fuelNames.indexOf(fuelName) + 5
+    fuelType = fuelNames.indexOf(fuelName) + 5
     map.clearMarkers()
-    for (let salePoint of salePoints) {
-      const price = salePoint[fuelType]
-      if (price < 0) {
-        continue
-      }
-      const shortInfo = "<b>" + price.toFixed(2) + "€</b>"
-      const longInfo =
-        shortInfo +
-        "<br />" +
-        [salePoint[2], salePoint[3], salePoint[4]].join(", ")
-      map.addMarker(
-        salePoint[0] / 100000.0,
-        salePoint[1] / 100000.0,
-        shortInfo,
-        longInfo
-      )
+    for (const salePoints of Object.values(loaded)) {
+      addMarkers(map, salePoints, fuelType)
     }
     map.invalidate()
   })
@@ -39,9 +96,9 @@ function buildMap(salePoints, fuelNames) {
  * Main function for ``sale_points.md`` file
  */
 async function main() {
-  const response = await fetch("./assets/data/latest.json")
-  const data = await response.json()
-  buildMap(data.data, data.keys.splice(5))
+  const response = await fetch(TILES_URL + "manifest.json")
+  const manifest = await response.json()
+  buildMap(manifest)
 }
 
 main()
@@ -0,0 +1,54 @@
+/**
+ * Services of the sale points, written by ``prixcarburants/services.py``
+ */
+
+/**
+ * Whether a bit is set in a mask.
+ * Masks may exceed 32 bits, beyond the bitwise operators of JavaScript.
+ * @param {number} mask Mask
+ * @param {number} bit Position of the bit
+ * @returns {boolean} Whether the bit is set
+ */
+function hasBit(mask, bit) {
+  return Math.floor(mask / 2 ** bit) % 2 === 1
+}
+
+/**
+ * Names of the services offered by a sale point
+ * @param {object} services Services, with ``services`` and ``service_names``
+ * @param {number} position Position of the sale point in ``services.ids``
+ * @returns {Array<string>} Names of the services
+ */
+export function serviceNames(services, position) {
+  return services.service_names.filter((_, bit) => hasBit(services.services[position], bit))
+}
+
+/**
+ * Ids of the sale points matching every filter given
+ * @param {object} services Services, as exported
+ * @param {object} filters Filters
+ * @param {Array<string>} filters.names Names of the services offered, if given
+ * @param {string} filters.fuelType Fuel type sold, if given
+ * @param {string} filters.department Department, such as "2A" or "75", if given
+ * @returns {Array<string>} Ids of the sale points matching
+ */
+export function filterStations(
+  services,
+  { names = [], fuelType, department } = {}
+) {
+  const bits = names.map((name) => services.service_names.indexOf(name))
+  if (bits.includes(-1)) {
+    return []
+  }
+  const fuelBit = fuelType === undefined ? -1 : services.fuel_types.indexOf(fuelType)
+  const departmentIndex =
+    department === undefined ? -1 : services.department_names.indexOf(department)
+  return services.ids.filter(
+    (_, position) =>
+      bits.every((bit) => hasBit(services.services[position], bit)) &&
+      (fuelBit === -1 || hasBit(services.fuels[position], fuelBit)) &&
+      (departmentIndex === -1 || services.departments[position] === departmentIndex)
+  )
+}
+
+export default { serviceNames, filterStations }
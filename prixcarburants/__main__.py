@@ -1,14 +1,20 @@
 """
 Main entrypoint
+
+Modules of the commands are only imported when the command runs,
+so that short invocations do not pay for the imports of the others.
 """
+# pylint: disable=import-outside-toplevel
 
 import argparse
+import json
 import logging
 import os
+from datetime import date, datetime
 from typing import List, Optional
 
-from . import parse
-from .fetch import DataFechter
+from . import instrument
+from .models import FuelType
 
 LOGGER = logging.getLogger(os.path.basename(__file__))
 
@@ -24,6 +30,18 @@ def dir_path(path: str) -> str:
     raise NotADirectoryError(path)
 
 
+def positive_int(value: str) -> int:
+    """
+    Parse ``value`` as a strictly positive integer.
+    Raise an exception otherwise.
+    :return: given value, as an integer
+    """
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
 def build_cli_parser() -> argparse.ArgumentParser:
     """Build and return Command Line Interface parser"""
     parser = argparse.ArgumentParser(
@@ -39,6 +57,25 @@ def build_cli_parser() -> argparse.ArgumentParser:
         choices=("debug", "info", "warning", "error"),
         default="warning",
     )
+    parser.add_argument(
+        "--stats",
+        help="file to save the timings of the stages and the counters of the run in",
+        default=None,
+    )
+    parser.add_argument(
+        "--stats-format",
+        help="format of --stats. [jsonl]: one JSON line appended per run, "
+        "[prometheus]: Prometheus text format, overwritten at each run.",
+        choices=instrument.FORMATS,
+        default="jsonl",
+    )
+    parser.add_argument(
+        "--profile",
+        help="profile the run, with cProfile (time) or tracemalloc (memory), "
+        "and write the report next to the output",
+        choices=instrument.PROFILERS,
+        default=None,
+    )
     subparsers = parser.add_subparsers(
         title="command", description="Program command", dest="command"
     )
@@ -62,6 +99,19 @@ def build_cli_parser() -> argparse.ArgumentParser:
         type=dir_path,
         default=".tmp",
     )
+    download_subparser.add_argument(
+        "-c",
+        "--cache",
+        help="path to a cache manifest. When given, the data is only downloaded "
+        "if it changed since the previous download, otherwise nothing is printed.",
+        default=None,
+    )
+    download_subparser.add_argument(
+        "--cache-pending",
+        help="path to save the updated cache manifest to, instead of --cache, "
+        "to be moved over it once the data downloaded is processed",
+        default=None,
+    )
     transform_subparser = subparsers.add_parser(
         "transform",
         help="Transform data from raw XML to JSON",
@@ -69,15 +119,39 @@ def build_cli_parser() -> argparse.ArgumentParser:
     transform_subparser.add_argument(
         "file",
         help="XML file to parse and transform",
+        nargs="?",
+    )
+    transform_subparser.add_argument(
+        "-d",
+        "--download",
+        help="stream data of this type straight from french Open Data instead of reading a file. "
+        "The XML is decompressed on the fly and never written on disk.",
+        choices=("now", "day", "year"),
     )
     transform_subparser.add_argument(
         "-o",
         "--output",
         help="output file to save the data in. "
         "Default will save the data in the same directory as the input file, "
-        "with the same name but as a JSON file.",
+        "with the same name but with the extension of the format.",
         default=None,
     )
+    transform_subparser.add_argument(
+        "-f",
+        "--format",
+        help="format of the output. [json]: JSON, [bin]: compact binary, see output module. "
+        "Without --latest, [bin] stores the sale points as a table of their prices: "
+        "services, opening days, out of orders and closures are dropped.",
+        choices=("json", "bin"),
+        default="json",
+    )
+    transform_subparser.add_argument(
+        "-z",
+        "--compress",
+        help="also write pre-compressed variants of the output next to it: "
+        "gzip, and brotli if installed",
+        action="store_true",
+    )
     transform_subparser.add_argument(
         "-l",
         "--latest",
@@ -87,12 +161,450 @@ def build_cli_parser() -> argparse.ArgumentParser:
     transform_subparser.add_argument(
         "-m",
         "--metrics",
-        help="build metrics from transformed data",
+        help="build metrics from transformed data. Requires --latest.",
         action="store_true",
     )
+    transform_subparser.add_argument(
+        "--metrics-state",
+        help="state file of the metrics, to only apply changes since --previous snapshot. "
+        "Requires --latest and --metrics.",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "-p",
+        "--previous",
+        help="previous output of the transformation with --latest, used as a base for changes",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--diff",
+        help="file to save the changes since --previous snapshot in, for clients to patch it. "
+        "Requires --latest and --previous.",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--registry",
+        help="station registry to update with the sale points, created if needed. "
+        "With --latest, the index of each sale point in the registry is saved as stations.",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--history",
+        help="history store to fill with the daily averages of the price histories, "
+        "such as the ones of the year file",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--history-overwrite",
+        help="replace the days already in the history store, instead of keeping them, "
+        "such as to rebuild them from the complete prices of the year file",
+        action="store_true",
+    )
+    transform_subparser.add_argument(
+        "--opening-hours",
+        help="file to save the opening hours and fuel types of the sale points in, "
+        "to be used by open command",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--shortages",
+        help="file to save the share of sale points out of each fuel type or closed "
+        "per department in, at the latest time of the data and over the days before",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--shortages-days",
+        help="number of days of the timeline of --shortages",
+        type=int,
+        default=30,
+    )
+    transform_subparser.add_argument(
+        "--anomalies",
+        help="file to save the anomalies of the price changes in, such as the ones of the year "
+        "file: jumps beyond --anomaly-sigma standard deviations of the variations of the "
+        "department, and prices not updated for more than --stale-days",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--anomaly-sigma",
+        help="standard deviations of a jump, for --anomalies",
+        type=float,
+        default=3.0,
+    )
+    transform_subparser.add_argument(
+        "--stale-days",
+        help="days without update of a stale price, for --anomalies",
+        type=float,
+        default=7,
+    )
+    transform_subparser.add_argument(
+        "--services",
+        help="file to save the services, fuel types and departments of the sale points in, "
+        "as bitmasks, to be used by services command",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--spatial-index",
+        help="file to save a spatial index of the sale points in, to be used by query command. "
+        "Requires --latest.",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "--tiles",
+        help="directory to save the sale points in, split in one tile per department, "
+        "along with a manifest of the tiles. Requires --latest.",
+        default=None,
+    )
+    transform_subparser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of processes parsing the file in parallel. Only for local files.",
+        type=positive_int,
+        default=1,
+    )
+    transform_subparser.add_argument(
+        "--parser",
+        help="XML parser to use. [etree]: ElementTree, "
+        "[expat]: expat callbacks building the sale points without element tree, "
+        "[lxml]: lxml, if installed. All of them give the same results.",
+        choices=("etree", "expat", "lxml"),
+        default="etree",
+    )
+    add_history_commands(subparsers)
+    add_query_commands(subparsers)
     return parser
 
 
+def add_history_commands(subparsers):
+    """Add the commands filling and reading history stores to the ``subparsers`` of the CLI"""
+    history_subparser = subparsers.add_parser(
+        "history",
+        help="Read daily average prices from a history store, as JSON",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    history_subparser.add_argument("store", help="history store filled by transform --history")
+    history_subparser.add_argument(
+        "--from", dest="start", help="first day, as YYYY-MM-DD", type=date.fromisoformat
+    )
+    history_subparser.add_argument(
+        "--to", dest="end", help="last day, as YYYY-MM-DD", type=date.fromisoformat
+    )
+    history_subparser.add_argument(
+        "-f", "--fuel", help="only read this fuel type", choices=[fuel.name for fuel in FuelType]
+    )
+    history_subparser.add_argument(
+        "-d", "--department", help="only read this department code, or FR for national averages"
+    )
+    history_subparser.add_argument(
+        "-s", "--step", help="number of days averaged together", type=positive_int, default=1
+    )
+    history_subparser.add_argument(
+        "-o", "--output", help="output file to save the data in. Default to standard output."
+    )
+    backfill_subparser = subparsers.add_parser(
+        "backfill",
+        help="Fill a history store with the daily averages of past years, from annual archives",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    backfill_subparser.add_argument("store", help="history store to fill, created if needed")
+    backfill_subparser.add_argument(
+        "--from", dest="first_year", help="first year", type=int, required=True
+    )
+    backfill_subparser.add_argument(
+        "--to", dest="last_year", help="last year, included", type=int, required=True
+    )
+    backfill_subparser.add_argument(
+        "-a",
+        "--archives",
+        help="directory of the annual ZIP archives, one per year with the year in its name. "
+        "Default to downloading them.",
+        type=dir_path,
+        default=None,
+    )
+    backfill_subparser.add_argument(
+        "-j", "--jobs", help="number of years parsed in parallel", type=positive_int, default=1
+    )
+
+
+def add_query_commands(subparsers):
+    """Add the commands querying and serving the latest data to the ``subparsers`` of the CLI"""
+    open_subparser = subparsers.add_parser(
+        "open",
+        help="List the ids of the sale points open at a given time, as JSON",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    open_subparser.add_argument(
+        "opening_hours", help="opening hours saved by transform --opening-hours"
+    )
+    open_subparser.add_argument(
+        "--at",
+        help="local time, as YYYY-MM-DDTHH:MM. Default to now.",
+        type=datetime.fromisoformat,
+        default=None,
+    )
+    open_subparser.add_argument(
+        "-f",
+        "--fuel",
+        help="only list sale points selling this fuel type",
+        choices=[fuel.name for fuel in FuelType],
+    )
+    services_subparser = subparsers.add_parser(
+        "services",
+        help="List the ids of the sale points offering services, as JSON",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    services_subparser.add_argument("services", help="services saved by transform --services")
+    services_subparser.add_argument(
+        "-s",
+        "--service",
+        help="only list sale points offering this service, can be repeated",
+        dest="names",
+        action="append",
+        default=[],
+    )
+    services_subparser.add_argument(
+        "-f",
+        "--fuel",
+        help="only list sale points selling this fuel type",
+        choices=[fuel.name for fuel in FuelType],
+    )
+    services_subparser.add_argument(
+        "-d", "--department", help="only list sale points of this department, such as 2A or 75"
+    )
+    query_subparser = subparsers.add_parser(
+        "query",
+        help="Query sale points from a spatial index, as JSON",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    query_subparser.add_argument("index", help="spatial index saved by transform --spatial-index")
+    query_subparsers = query_subparser.add_subparsers(
+        title="query", description="Type of query", dest="query", required=True
+    )
+    nearest_subparser = query_subparsers.add_parser(
+        "nearest",
+        help="cheapest sale points of a fuel type around a point",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    nearest_subparser.add_argument("latitude", help="latitude, in degrees", type=float)
+    nearest_subparser.add_argument("longitude", help="longitude, in degrees", type=float)
+    nearest_subparser.add_argument(
+        "-f", "--fuel", help="fuel type", choices=[fuel.name for fuel in FuelType], required=True
+    )
+    nearest_subparser.add_argument(
+        "-r", "--radius", help="maximal distance, in kilometers", type=float, default=10.0
+    )
+    nearest_subparser.add_argument(
+        "-n", "--count", help="maximal number of sale points", type=int, default=10
+    )
+    bbox_subparser = query_subparsers.add_parser(
+        "bbox",
+        help="sale points inside a bounding box",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    for name in ("south", "west", "north", "east"):
+        bbox_subparser.add_argument(name, help=f"{name} edge, in degrees", type=float)
+    serve_subparser = subparsers.add_parser(
+        "serve",
+        help="Keep the latest data in memory, refresh it periodically and serve it over HTTP",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    serve_subparser.add_argument("--host", help="address to listen on", default="127.0.0.1")
+    serve_subparser.add_argument("-p", "--port", help="port to listen on", type=int, default=8080)
+    serve_subparser.add_argument(
+        "-i", "--interval", help="seconds between refreshes", type=float, default=600.0
+    )
+    serve_subparser.add_argument(
+        "-f",
+        "--file",
+        help="XML file to serve, reloaded when modified, instead of the instantaneous data",
+        default=None,
+    )
+
+
+def download(arguments: argparse.Namespace) -> Optional[str]:
+    """
+    Run the ``download`` command
+    :param arguments: Parsed command line arguments
+    :return: Path to the file downloaded, if any
+    """
+    LOGGER.debug("'download' command")
+    from .fetch import DataFechter
+
+    data_fetcher = DataFechter(arguments.output, arguments.cache)
+    functions = {
+        "now": data_fetcher.download_instantaneous_data,
+        "day": data_fetcher.download_day_data,
+        "year": data_fetcher.download_year_data,
+    }
+    result = functions[arguments.type]()
+    if result is None:
+        LOGGER.info("Data unchanged since last download")
+    else:
+        data_fetcher.save_manifest(arguments.cache_pending)
+        print(result)
+    return result
+
+
+def read_history(parser: argparse.ArgumentParser, arguments: argparse.Namespace) -> Optional[str]:
+    """
+    Run the ``history`` command
+    :param parser: Parser of the command line arguments, to report errors
+    :param arguments: Parsed command line arguments
+    :return: Path to the output file, if any
+    """
+    from . import history, parse
+
+    if arguments.department is not None and arguments.department not in history.COLUMNS:
+        parser.error(f"unknown department {arguments.department}")
+    store = history.HistoryStore(arguments.store)
+    exported = history.export(
+        store,
+        start=None if arguments.start is None else history.to_day(arguments.start),
+        end=None if arguments.end is None else history.to_day(arguments.end),
+        fuel_type=None if arguments.fuel is None else FuelType[arguments.fuel],
+        column=arguments.department,
+        step=arguments.step,
+    )
+    if arguments.output is None:
+        print(json.dumps(exported))
+    else:
+        parse.save_as_json(exported, arguments.output)
+        print(arguments.output)
+    return arguments.output
+
+
+def list_stations(parser: argparse.ArgumentParser, arguments: argparse.Namespace):
+    """
+    Run the ``open`` or ``services`` command, listing the ids of the sale points matching
+    :param parser: Parser of the command line arguments, to report errors
+    :param arguments: Parsed command line arguments
+    """
+    fuel_type = None if arguments.fuel is None else FuelType[arguments.fuel]
+    if arguments.command == "open":
+        from . import opening
+
+        index = opening.OpeningIndex.load(arguments.opening_hours)
+        moment = datetime.now() if arguments.at is None else arguments.at
+        print(json.dumps(index.open_stations(moment, fuel_type)))
+        return
+    from . import services
+    from .parse import DEPARTMENTS
+
+    if arguments.department is not None and arguments.department not in DEPARTMENTS:
+        parser.error(f"unknown department {arguments.department}")
+    index = services.ServiceIndex.load(arguments.services)
+    print(json.dumps(index.stations(arguments.names, fuel_type, arguments.department)))
+
+
+def query(arguments: argparse.Namespace):
+    """
+    Run the ``query`` command
+    :param arguments: Parsed command line arguments
+    """
+    from . import spatial
+
+    index = spatial.SpatialIndex.load(arguments.index)
+    if arguments.query == "nearest":
+        results = []
+        for position, _, kilometers in index.nearest_cheapest(
+            arguments.latitude,
+            arguments.longitude,
+            FuelType[arguments.fuel],
+            arguments.radius,
+            arguments.count,
+        ):
+            station = index.station(position)
+            station["distance"] = round(kilometers, 3)
+            results.append(station)
+    else:
+        positions = index.within_bbox(
+            arguments.south, arguments.west, arguments.north, arguments.east
+        )
+        results = [index.station(position) for position in positions]
+    print(json.dumps(results))
+
+
+def run_transform(parser: argparse.ArgumentParser, arguments: argparse.Namespace) -> str:
+    """
+    Run the ``transform`` command, on a local file or on a feed downloaded on the fly
+    :param parser: Parser of the command line arguments, to report errors
+    :param arguments: Parsed command line arguments
+    :return: Path to the output file
+    """
+    if (arguments.file is None) == (arguments.download is None):
+        parser.error("transform expects either a file or --download")
+    if arguments.metrics and not arguments.latest:
+        parser.error("transform --metrics requires --latest")
+    from .transform import transform
+
+    if arguments.download is None:
+        return transform(arguments, arguments.file, arguments.file)
+    from . import fetch
+
+    with fetch.open_zip_member(fetch.DATA_URLS[arguments.download]) as member:
+        return transform(arguments, member, os.path.basename(member.name))
+
+
+def run_backfill(parser: argparse.ArgumentParser, arguments: argparse.Namespace) -> str:
+    """
+    Run the ``backfill`` command, reporting a missing archive as a usage error
+    :param parser: Parser of the command line arguments, to report errors
+    :param arguments: Parsed command line arguments
+    :return: Path to the history store
+    """
+    if arguments.first_year > arguments.last_year:
+        parser.error("backfill expects --from to be before --to")
+    from . import backfill
+
+    try:
+        backfill.backfill(
+            arguments.store,
+            arguments.first_year,
+            arguments.last_year,
+            arguments.archives,
+            arguments.jobs,
+        )
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    print(arguments.store)
+    return arguments.store
+
+
+def run(parser: argparse.ArgumentParser, arguments: argparse.Namespace) -> Optional[str]:
+    """
+    Run the command of ``arguments``
+    :param parser: Parser of the command line arguments, to report errors
+    :param arguments: Parsed command line arguments
+    :return: Path to the output of the command, if any
+    """
+    if arguments.command == "download":
+        return download(arguments)
+    if arguments.command == "transform":
+        return run_transform(parser, arguments)
+    if arguments.command == "history":
+        return read_history(parser, arguments)
+    if arguments.command == "backfill":
+        return run_backfill(parser, arguments)
+    if arguments.command in ("open", "services"):
+        list_stations(parser, arguments)
+    elif arguments.command == "query":
+        query(arguments)
+    elif arguments.command == "serve":
+        import asyncio
+
+        from . import serve
+
+        try:
+            asyncio.run(
+                serve.serve(arguments.host, arguments.port, arguments.interval, arguments.file)
+            )
+        except KeyboardInterrupt:
+            LOGGER.info("Server stopped")
+    else:
+        parser.print_help()
+    return None
+
+
 def main(cli: Optional[List[str]] = None):
     """
     Main entrypoint
@@ -101,34 +613,14 @@ def main(cli: Optional[List[str]] = None):
     parser = build_cli_parser()
     arguments = parser.parse_args(cli)
     logging.basicConfig(level=logging.getLevelName(arguments.level.upper()))
-    if arguments.command == "download":
-        LOGGER.debug("'download' command")
-        data_fetcher = DataFechter(arguments.output)
-        functions = {
-            "now": data_fetcher.download_instantaneous_data,
-            "day": data_fetcher.download_day_data,
-            "year": data_fetcher.download_year_data,
-        }
-        result = functions[arguments.type]()
-        print(result)
-    elif arguments.command == "transform":
-        sale_points = parse.build_sale_points(arguments.file)
-        output = arguments.output
-        if output is None:
-            directory = os.path.dirname(arguments.file)
-            filename = os.path.splitext(os.path.basename(arguments.file))[0]
-            output = os.path.join(directory, filename + ".json")
-        else:
-            directory = os.path.dirname(output)
-        if arguments.latest:
-            sale_points = parse.degrade_to_latest(sale_points)
-        if arguments.metrics:
-            metrics = parse.build_metrics(sale_points)
-            parse.save_as_json(metrics, os.path.join(directory, "metrics.json"))
-        parse.save_as_json(sale_points, output)
-        print(output)
-    else:
-        parser.print_help()
+    profiler = None if arguments.profile is None else instrument.Profiler(arguments.profile)
+    if profiler is not None:
+        profiler.start()
+    output_file = run(parser, arguments)
+    if profiler is not None:
+        profiler.save(profiler.stop(), output_file)
+    if arguments.stats is not None:
+        instrument.save(arguments.stats, arguments.stats_format, arguments.command)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""
+Anomalies of the price changes: jumps and stale prices.
+
+Detected in a single pass over the price changes sorted by time (see ``events``),
+keeping only the latest price of each sale point and fuel type, and rolling statistics
+of the price variations of each department and fuel type:
+
+- a jump is a variation further than ``sigma`` standard deviations from the mean variation
+  of the department and fuel type, once enough variations were seen there;
+- a stale price is one not updated for more than ``stale_days`` days, reported when it is
+  finally updated or, for the ones still stale, at the end of the stream.
+
+Rolling statistics decay exponentially with time, so that recent variations weigh more.
+Updates repeating the same price refresh it, but are not variations.
+"""
+
+import logging
+import math
+import os
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from .events import PriceChange
+from .history import SECONDS_PER_DAY
+from .models import FuelType, from_epoch
+from .parse import DEPARTMENTS, PRICE_SCALE
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+JUMP = "jump"
+STALE = "stale"
+# Names of the fields of the anomalies exported by ``export()``
+KEYS = ("kind", "time", "station", "fuel_type", "department", "price", "value")
+
+
+class Anomaly(NamedTuple):
+    """Anomaly of the price of a fuel type at a sale point"""
+
+    kind: str  # ``JUMP`` or ``STALE``
+    event: PriceChange  # Change of the jump, or last update of the stale price
+    value: float  # Standard deviations of the jump, or days without update
+
+
+class RollingStatistics:
+    """Mean and standard deviation of values, weighted by an exponential decay with time"""
+
+    __slots__ = ("time", "count", "weight", "total", "squares")
+
+    def __init__(self):
+        self.time: Optional[int] = None
+        self.count = 0
+        self.weight = 0.0
+        self.total = 0.0
+        self.squares = 0.0
+
+    def decay(self, time: int, half_life: float):
+        """Decay the weights of the values added until ``time``, halved every ``half_life``"""
+        if self.time is not None and time > self.time:
+            factor = 0.5 ** ((time - self.time) / half_life)
+            self.weight *= factor
+            self.total *= factor
+            self.squares *= factor
+        self.time = time if self.time is None else max(self.time, time)
+
+    def add(self, value: float):
+        """Add ``value``, with a weight of 1"""
+        self.count += 1
+        self.weight += 1
+        self.total += value
+        self.squares += value * value
+
+    @property
+    def mean(self) -> float:
+        """Weighted mean of the values"""
+        return self.total / self.weight
+
+    @property
+    def deviation(self) -> float:
+        """Weighted standard deviation of the values"""
+        return math.sqrt(max(self.squares / self.weight - self.mean**2, 0.0))
+
+
+class AnomalyDetector:
+    """
+    Detect the anomalies of price changes given in order of time, with ``detect()``.
+    Memory is bounded by the number of sale points and fuel types.
+    """
+
+    def __init__(
+        self,
+        sigma: float = 3.0,
+        stale_days: float = 7,
+        half_life_days: float = 7,
+        min_samples: int = 30,
+    ):
+        """
+        :param sigma: Standard deviations from the mean variation beyond which it is a jump
+        :param stale_days: Days without update after which a price is stale
+        :param half_life_days: Days after which the weight of a variation is halved
+        :param min_samples: Variations of a department and fuel type before detecting jumps
+        """
+        self.sigma = sigma
+        self.stale_days = stale_days
+        self.half_life = half_life_days * SECONDS_PER_DAY
+        self.min_samples = min_samples
+        # (station, fuel type) -> latest update
+        self.latest: Dict[Tuple[int, int], PriceChange] = {}
+        # (department, fuel type) -> statistics of the variations
+        self.statistics: Dict[Tuple[int, int], RollingStatistics] = {}
+        self.time: Optional[int] = None
+
+    def _stale(self, latest: PriceChange, time: int) -> Optional[Anomaly]:
+        """Return the stale anomaly of the price updated by ``latest`` if it is stale at ``time``"""
+        days = (time - latest.time) / SECONDS_PER_DAY
+        if days <= self.stale_days:
+            return None
+        return Anomaly(STALE, latest, round(days, 2))
+
+    def check(self, event: PriceChange) -> Iterator[Anomaly]:
+        """Check ``event``, given after every event of an earlier time, for anomalies"""
+        self.time = event.time
+        key = (event.station, event.fuel_type)
+        previous = self.latest.get(key)
+        self.latest[key] = event
+        if previous is None:
+            return
+        stale = self._stale(previous, event.time)
+        if stale is not None:
+            yield stale
+        if event.price == previous.price:
+            return
+        variation = event.price - previous.price
+        statistics = self.statistics.setdefault(
+            (event.department, event.fuel_type), RollingStatistics()
+        )
+        statistics.decay(event.time, self.half_life)
+        if statistics.count >= self.min_samples and statistics.deviation > 0:
+            deviations = (variation - statistics.mean) / statistics.deviation
+            if abs(deviations) > self.sigma:
+                yield Anomaly(JUMP, event, round(deviations, 2))
+        statistics.add(variation)
+
+    def finish(self) -> Iterator[Anomaly]:
+        """Return the prices still stale at the time of the last event, by sale point"""
+        if self.time is None:
+            return
+        for _, latest in sorted(self.latest.items()):
+            stale = self._stale(latest, self.time)
+            if stale is not None:
+                yield stale
+
+    def detect(self, events: Iterable[PriceChange]) -> Iterator[Anomaly]:
+        """Detect the anomalies of ``events``, sorted by time such as ``EventSorter.events()``"""
+        for event in events:
+            yield from self.check(event)
+        yield from self.finish()
+
+
+def export(anomalies: Iterable[Anomaly], detector: AnomalyDetector) -> dict:
+    """
+    Export ``anomalies`` as a JSON-serializable dictionary
+    :param anomalies: Anomalies, such as the ones of ``detector.detect()``
+    :param detector: Detector of the anomalies, for its parameters
+    :return: Dictionary with the ``keys`` of the fields of the anomalies, their ``data``
+        as lists, their ``counts`` per kind and the ``parameters`` of the detection
+    """
+    data = []
+    counts = {JUMP: 0, STALE: 0}
+    for kind, event, value in anomalies:
+        counts[kind] += 1
+        data.append(
+            [
+                kind,
+                from_epoch(event.time).isoformat(),
+                str(event.station),
+                FuelType(event.fuel_type).name,
+                DEPARTMENTS[event.department],
+                event.price / PRICE_SCALE,
+                value,
+            ]
+        )
+    LOGGER.debug("Anomalies: %s", counts)
+    return {
+        "keys": KEYS,
+        "data": data,
+        "counts": counts,
+        "parameters": {
+            "sigma": detector.sigma,
+            "stale_days": detector.stale_days,
+            "half_life_days": detector.half_life / SECONDS_PER_DAY,
+            "min_samples": detector.min_samples,
+        },
+    }
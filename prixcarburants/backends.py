@@ -0,0 +1,215 @@
+"""
+XML parsers building sale points from the raw bytes of the feed.
+
+The feed declares ISO-8859-1 but is actually encoded in windows-1252: every backend
+parses the raw bytes with the encoding overridden, rather than decoding them in Python first.
+
+- ``etree``: ``xml.etree.ElementTree.iterparse()``, building and clearing one ``<pdv>``
+  element tree at a time, then ``SalePoint.build()`` from it.
+- ``expat``: expat callbacks building the sale points straight from the tags, attributes
+  and texts, without any element tree.
+- ``lxml``: ``lxml.etree.iterparse()``, like ``etree``. Only when lxml is installed.
+
+Every backend builds the same sale points.
+"""
+
+import logging
+import os
+import xml.etree.ElementTree as ET
+from typing import IO, Callable, Dict, Iterator, List, Optional
+from xml.parsers import expat
+
+from .models import (
+    Address,
+    ClosingTime,
+    FuelType,
+    Location,
+    OutOfOrder,
+    SalePoint,
+    WeekDay,
+    WorkDay,
+    hour,
+    intern_service,
+    parse_price,
+)
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # Optional dependency
+    lxml_etree = None
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+ENCODING = "windows-1252"
+CHUNK_SIZE = 1 << 20  # Bytes read at once by the expat backend
+DEFAULT = "etree"
+
+
+def iter_etree(stream: IO[bytes], epoch: bool = False) -> Iterator[SalePoint]:
+    """
+    Lazily build sale points with ElementTree.
+    Finished elements are cleared so memory stays flat whatever the file size.
+    :param stream: Binary stream of the XML file
+    :param epoch: Whether to keep dates as seconds since epoch rather than datetime objects
+    """
+    root = None
+    parser = ET.XMLParser(encoding=ENCODING)
+    for event, element in ET.iterparse(stream, events=("start", "end"), parser=parser):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+        if element.tag != "pdv":
+            continue
+        yield SalePoint.build(element, epoch)
+        root.clear()
+
+
+def iter_lxml(stream: IO[bytes], epoch: bool = False) -> Iterator[SalePoint]:
+    """
+    Lazily build sale points with lxml, see ``iter_etree()``
+    :raise ImportError: When lxml is not installed
+    """
+    if lxml_etree is None:
+        raise ImportError("lxml is required to parse with the lxml backend")
+    for _, element in lxml_etree.iterparse(
+        stream, events=("end",), tag="pdv", encoding=ENCODING, remove_comments=True
+    ):
+        yield SalePoint.build(element, epoch)
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+class SalePointHandler:  # pylint: disable=too-many-instance-attributes
+    """
+    Expat callbacks building sale points, in ``ready``, as their ``</pdv>`` tag is parsed.
+    Attributes are given as dictionaries, which the ``build()`` methods of the models
+    read like elements.
+    Character data is only handled inside the elements whose text is kept, so that
+    the indentation between tags costs no callback.
+    """
+
+    def __init__(self, parser, epoch: bool = False):
+        """
+        :param parser: Expat parser calling the handler
+        :param epoch: Whether to keep dates as seconds since epoch rather than datetime objects
+        """
+        self.parser = parser
+        self.epoch = epoch
+        self.ready: List[SalePoint] = []
+        self.text: Optional[List[str]] = None  # Text of the current leaf element, if kept
+        self.sale_point: Dict[str, str] = {}
+        self.address: Optional[str] = None
+        self.city: Optional[str] = None
+        self.prices: Dict[int, list] = {}
+        self.services: Optional[set] = None
+        self.automate_24h = False
+        self.opening_days: Optional[List[WorkDay]] = None
+        self.work_day: Dict[str, str] = {}
+        self.opening_hours: list = []
+        self.out_of_orders: List[OutOfOrder] = []
+        self.closing_times: List[ClosingTime] = []
+
+    def start(self, tag: str, attributes: Dict[str, str]):  # pylint: disable=too-many-branches
+        """Handle an opening ``tag``, most frequent tags first"""
+        if tag == "prix":
+            if len(attributes) > 0:
+                fuel_type, date, price = parse_price(attributes, self.epoch)
+                self.prices[fuel_type.value].append((date, price))
+        elif tag == "horaire":
+            self.opening_hours.append(
+                (hour(attributes.get("ouverture")), hour(attributes.get("fermeture")))
+            )
+        elif tag == "jour":
+            self.work_day = attributes
+            self.opening_hours = []
+        elif tag in ("service", "adresse", "ville"):
+            self.text = []
+            self.parser.CharacterDataHandler = self.text.append
+        elif tag == "pdv":
+            self.sale_point = attributes
+            self.address = self.city = self.services = self.opening_days = None
+            self.prices = {fuel_type.value: [] for fuel_type in FuelType}
+            self.automate_24h = False
+            self.out_of_orders = []
+            self.closing_times = []
+        elif tag == "services":
+            self.services = set()
+        elif tag == "horaires":
+            self.automate_24h = attributes.get("automate-24-24", "") == "1"
+            self.opening_days = []
+        elif tag == "rupture":
+            if len(attributes) > 0:
+                self.out_of_orders.append(OutOfOrder.build(attributes, self.epoch))
+        elif tag == "fermeture":
+            if len(attributes) > 0:
+                self.closing_times.append(ClosingTime.build(attributes, self.epoch))
+        elif tag != "pdv_liste":
+            raise ValueError(f"Unhandled tag {tag} in sale point {self.sale_point.get('id')}")
+
+    def end(self, tag: str):
+        """Handle a closing ``tag``"""
+        if self.text is not None:
+            text = "".join(self.text) if len(self.text) > 0 else None
+            self.text = None
+            self.parser.CharacterDataHandler = None
+            if tag == "service":
+                self.services.add(intern_service(text))
+            elif tag == "adresse":
+                self.address = text
+            else:
+                self.city = text
+        elif tag == "jour":
+            self.opening_days.append(
+                WorkDay(
+                    WeekDay(int(self.work_day.get("id"))),
+                    self.work_day.get("ferme", "") == "1",
+                    self.opening_hours,
+                )
+            )
+        elif tag == "pdv":
+            self.ready.append(self.build())
+
+    def build(self) -> SalePoint:
+        """Build the sale point whose tags were handled"""
+        sale_point = self.sale_point
+        return SalePoint(
+            id=sale_point.get("id"),
+            location=Location(sale_point.get("latitude"), sale_point.get("longitude")),
+            address=Address(sale_point.get("cp"), self.address, self.city),
+            prices=self.prices,
+            out_of_orders=self.out_of_orders,
+            closing_times=self.closing_times,
+            services=self.services,
+            automate_24h=self.automate_24h,
+            opening_days=self.opening_days,
+        )
+
+
+def iter_expat(stream: IO[bytes], epoch: bool = False) -> Iterator[SalePoint]:
+    """
+    Lazily build sale points with expat, reading ``stream`` by chunks of ``CHUNK_SIZE`` bytes.
+    Only the sale points of the chunk being parsed are held in memory.
+    :param stream: Binary stream of the XML file
+    :param epoch: Whether to keep dates as seconds since epoch rather than datetime objects
+    """
+    parser = expat.ParserCreate(encoding=ENCODING)
+    parser.buffer_text = True
+    handler = SalePointHandler(parser, epoch)
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        parser.Parse(chunk, len(chunk) == 0)
+        yield from handler.ready
+        handler.ready.clear()
+        if len(chunk) == 0:
+            return
+
+
+# Backends by name, as functions of a binary stream and ``epoch``
+PARSERS: Dict[str, Callable[..., Iterator[SalePoint]]] = {
+    "etree": iter_etree,
+    "expat": iter_expat,
+    "lxml": iter_lxml,
+}
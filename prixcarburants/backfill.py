@@ -0,0 +1,136 @@
+"""
+Backfill of a history store from the annual archives.
+
+Each year is read from its archive, either downloaded from ``fetch.ARCHIVE_URL``
+or found in a local directory of ZIP files, and parsed in a separate process.
+Only the daily records of each year are sent back, then written in the store in year order.
+Years written are recorded in a checkpoint next to the store,
+so an interrupted backfill resumes with the first year missing.
+"""
+
+import contextlib
+import glob
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import IO, Iterator, List, Optional, Tuple
+
+from . import fetch, history, instrument, parse
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+
+
+class Checkpoint:  # pylint: disable=too-few-public-methods
+    """On-disk record of the years already written in a history store"""
+
+    def __init__(self, store: str):
+        """
+        :param store: Path to the history store. The checkpoint is saved next to it,
+            and ignored if the store does not exist.
+        """
+        self.path = f"{store}.backfill.json"
+        self.years: List[int] = []
+        if os.path.isfile(store) and os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf8") as stream:
+                self.years = json.load(stream)["years"]
+
+    def add(self, year: int):
+        """Record that ``year`` is written, replacing the previous checkpoint at once"""
+        self.years = sorted(set(self.years) | {year})
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf8") as stream:
+            json.dump({"years": self.years}, stream)
+        os.replace(temporary, self.path)
+
+
+def find_archive(directory: str, year: int) -> str:
+    """
+    Return the path to the ZIP of ``year`` in ``directory``,
+    i.e. the one whose name contains the year, such as ``PrixCarburants_annuel_2022.zip``
+    """
+    paths = sorted(glob.glob(os.path.join(directory, f"*{year}*.zip")))
+    if len(paths) == 0:
+        raise FileNotFoundError(f"No archive of {year} in {directory}")
+    return paths[0]
+
+
+@contextlib.contextmanager
+def open_archive(year: int, directory: Optional[str] = None) -> Iterator[IO[bytes]]:
+    """
+    Open the XML file of the archive of ``year`` as a stream, decompressed on the fly
+    :param year: Year of the archive
+    :param directory: Directory of the local archives. Default to downloading the archive.
+    """
+    if directory is None:
+        with fetch.open_zip_member(fetch.ARCHIVE_URL.format(year=year)) as member:
+            yield member
+        return
+    with zipfile.ZipFile(find_archive(directory, year)) as zip_file:
+        names = zip_file.namelist()
+        assert len(names) == 1
+        with zip_file.open(names[0]) as member:
+            yield member
+
+
+def build_year(job: Tuple[int, Optional[str]]) -> Tuple[int, Optional[int], list]:
+    """
+    Worker building the daily records of a year
+    :param job: Year, and directory of the local archives if any
+    :return: Year, then first day and records, as returned by ``HistoryBuilder.records()``,
+        restricted to the days of the year
+    """
+    year, directory = job
+    builder = history.HistoryBuilder()
+    with open_archive(year, directory) as member:
+        for _ in builder.feed(parse.iter_sale_points(member, epoch=True)):
+            pass
+    first_day, records = builder.records()
+    if first_day is None:
+        return year, None, []
+    # Archives may hold a few prices of the neighbouring years, which belong to their archives
+    start = max(first_day, history.to_day(date(year, 1, 1)))
+    end = min(first_day + len(records), history.to_day(date(year + 1, 1, 1)))
+    if start >= end:
+        return year, None, []
+    return year, start, records[start - first_day : end - first_day]
+
+
+def backfill(
+    store: str, first_year: int, last_year: int, directory: Optional[str] = None, jobs: int = 1
+) -> List[int]:
+    """
+    Fill ``store`` with the daily averages of the years from ``first_year`` to ``last_year``.
+    The archives hold complete years, so their averages replace the days already stored.
+    :param store: Path to the history store, created if needed
+    :param first_year: First year to backfill
+    :param last_year: Last year to backfill, included
+    :param directory: Directory of the local archives. Default to downloading them.
+    :param jobs: Number of years parsed in parallel, each one by a separate process
+    :return: Years written by this run
+    """
+    checkpoint = Checkpoint(store)
+    years = [year for year in range(first_year, last_year + 1) if year not in checkpoint.years]
+    skipped = last_year - first_year + 1 - len(years)
+    if skipped > 0:
+        LOGGER.info("%s years already backfilled, resuming", skipped)
+    if len(years) == 0:
+        return years
+    if directory is not None:
+        for year in years:
+            find_archive(directory, year)  # Fail before any work if an archive is missing
+    history_store = history.HistoryStore(store)
+    with instrument.stage("backfill"), ProcessPoolExecutor(min(jobs, len(years))) as executor:
+        for year, first_day, records in executor.map(
+            build_year, [(year, directory) for year in years]
+        ):
+            if first_day is None:
+                LOGGER.warning("No prices found in the archive of %s", year)
+            else:
+                history_store.write(first_day, records, overwrite=True)
+            checkpoint.add(year)
+            instrument.count("years", 1)
+            LOGGER.info("Year %s backfilled", year)
+    return years
@@ -0,0 +1,41 @@
+"""
+Bitsets of sale points, bit ``n`` standing for the ``n``-th sale point.
+Built in byte arrays, where setting a bit is cheap, then held by integers,
+on which unions and intersections are single operations.
+"""
+
+from typing import List
+
+# Positions of the bits set in each byte value
+BYTE_POSITIONS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+
+def empty(size: int) -> bytearray:
+    """Return an empty bitset of ``size`` bits, to build"""
+    return bytearray((size + 7) // 8)
+
+
+def toggle(bitset: bytearray, position: int):
+    """Toggle the bit at ``position`` in ``bitset``"""
+    bitset[position >> 3] ^= 1 << (position & 7)
+
+
+def to_int(bitset: bytearray) -> int:
+    """Return the integer holding ``bitset``"""
+    return int.from_bytes(bitset, "little")
+
+
+def full(size: int) -> int:
+    """Return the integer holding a bitset of ``size`` bits, all set"""
+    return (1 << size) - 1
+
+
+def positions(bitset: int, size: int) -> List[int]:
+    """Return the positions of the bits set in the integer ``bitset`` of ``size`` bits, in order"""
+    content = bitset.to_bytes((size + 7) // 8, "little")
+    return [
+        index * 8 + bit
+        for index, value in enumerate(content)
+        if value
+        for bit in BYTE_POSITIONS[value]
+    ]
@@ -0,0 +1,26 @@
+"""
+Base of the builders collecting sale points one at a time, such as the history,
+opening hours or services builders, fed together in a single pass over the sale points.
+"""
+
+import abc
+from typing import Iterable, Iterator
+
+from .models import SalePoint
+
+
+class SalePointBuilder(abc.ABC):
+    """Builder collecting sale points one at a time with ``add()``"""
+
+    @abc.abstractmethod
+    def add(self, sale_point: SalePoint):
+        """Add ``sale_point``"""
+
+    def feed(self, sale_points: Iterable[SalePoint]) -> Iterator[SalePoint]:
+        """
+        Add every sale point of ``sale_points`` while passing them through,
+        so that several builders are fed in a single pass over the sale points
+        """
+        for sale_point in sale_points:
+            self.add(sale_point)
+            yield sale_point
@@ -0,0 +1,97 @@
+"""
+Differences between consecutive snapshots.
+
+A diff lists, between two snapshots degraded by ``parse.degrade_to_latest()``,
+the sale points added and removed, and the values that changed for the others,
+so that clients can patch their local copy instead of downloading the whole snapshot.
+Snapshots are identified by ``metrics.snapshot_digest()``.
+"""
+
+import logging
+import os
+from typing import Dict, List
+
+from .metrics import snapshot_digest
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+
+
+def diff(previous: Dict[str, List], current: Dict[str, List]) -> dict:
+    """
+    Compute the changes from the ``previous`` snapshot to the ``current`` one
+    :param previous: Previous sale points, degraded by ``parse.degrade_to_latest()``
+    :param current: Current sale points, degraded by ``parse.degrade_to_latest()``
+    :return: Diff, with:
+        - ``from`` and ``to``: digests of the snapshots
+        - ``keys``: names of the values of the rows
+        - ``added``: ``[id, row]`` of the sale points added
+        - ``removed``: ids of the sale points removed
+        - ``changed``: values that changed, by key name, by sale point id
+        - ``order``: ids of every sale point, only when ``apply()`` would not keep their order
+    """
+    keys = list(current["keys"])
+    previous_rows = dict(zip(previous["ids"], previous["data"]))
+    added, changed = [], {}
+    for station_id, row in zip(current["ids"], current["data"]):
+        previous_row = previous_rows.get(station_id)
+        if previous_row is None:
+            added.append([station_id, row])
+        elif previous_row != row:
+            changed[station_id] = {
+                key: value
+                for key, value, previous_value in zip(keys, row, previous_row)
+                if value != previous_value
+            }
+    current_ids = set(current["ids"])
+    removed = [station_id for station_id in previous["ids"] if station_id not in current_ids]
+    patch = {
+        "from": snapshot_digest(previous),
+        "to": snapshot_digest(current),
+        "keys": keys,
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+    }
+    kept = [station_id for station_id in previous["ids"] if station_id in current_ids]
+    if kept + [station_id for station_id, _ in added] != list(current["ids"]):
+        patch["order"] = list(current["ids"])
+    LOGGER.info(
+        "%s sale points added, %s removed and %s changed",
+        len(added),
+        len(removed),
+        len(changed),
+    )
+    return patch
+
+
+def apply(previous: Dict[str, List], patch: dict) -> Dict[str, List]:
+    """
+    Apply a ``patch`` built by ``diff()`` on the ``previous`` snapshot
+    :param previous: Snapshot the patch was computed from
+    :param patch: Diff to apply
+    :return: Patched snapshot, identical to the one the patch was computed to
+    """
+    if snapshot_digest(previous) != patch["from"]:
+        raise ValueError("Snapshot is not the one the diff was computed from")
+    if list(previous["keys"]) != patch["keys"]:
+        raise ValueError("Snapshot and diff have different keys")
+    positions = {key: position for position, key in enumerate(patch["keys"])}
+    removed = set(patch["removed"])
+    rows = {}
+    for station_id, row in zip(previous["ids"], previous["data"]):
+        if station_id in removed:
+            continue
+        row = list(row)
+        for key, value in patch["changed"].get(station_id, {}).items():
+            row[positions[key]] = value
+        rows[station_id] = row
+    rows.update((station_id, row) for station_id, row in patch["added"])
+    ids = patch.get("order", list(rows))
+    current = {
+        "keys": previous["keys"],
+        "data": [rows[station_id] for station_id in ids],
+        "ids": ids,
+    }
+    if snapshot_digest(current) != patch["to"]:
+        raise ValueError("Patched snapshot does not match the diff")
+    return current
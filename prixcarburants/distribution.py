@@ -0,0 +1,159 @@
+"""
+Distribution of the latest prices per fuel type and department:
+number of stations, minimum, 10th percentile, median, 90th percentile and maximum.
+
+Computed with NumPy when it is installed, in a few vectorized passes over all the sale points,
+otherwise with a pure-Python fallback giving the same results.
+Percentiles interpolate linearly between the closest prices, as ``numpy.percentile()`` does.
+"""
+
+import logging
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .models import FuelType
+from .parse import DEPARTMENTS, get_department_index
+
+try:
+    import numpy
+except ImportError:  # Optional dependency
+    numpy = None
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+# Statistics of each distribution, in order
+STATISTICS = ("count", "min", "p10", "median", "p90", "max")
+QUANTILES = (0.1, 0.5, 0.9)
+DECIMALS = 4
+
+
+def _format(statistics: Sequence[float]) -> list:
+    """Format the ``statistics`` of a distribution, ``-1`` standing for missing values"""
+    count = int(statistics[0])
+    if count == 0:
+        return [0] + [-1] * (len(STATISTICS) - 1)
+    return [count] + [round(float(value), DECIMALS) for value in statistics[1:]]
+
+
+def _python_statistics(groups: List[int], prices: List[float], group_count: int) -> List[list]:
+    """
+    Compute the distribution of ``prices`` of each group, with Python loops
+    :param groups: Group of each price, in ``[0, group_count)``
+    :param prices: Prices
+    :param group_count: Number of groups
+    :return: Statistics of each group, see ``STATISTICS``
+    """
+    grouped: List[List[float]] = [[] for _ in range(group_count)]
+    for group, price in zip(groups, prices):
+        grouped[group].append(price)
+    results = []
+    for values in grouped:
+        values.sort()
+        count = len(values)
+        if count == 0:
+            results.append([0] * len(STATISTICS))
+            continue
+        statistics = [count, values[0]]
+        for quantile in QUANTILES:
+            position = quantile * (count - 1)
+            lower = math.floor(position)
+            low, high = values[lower], values[min(lower + 1, count - 1)]
+            statistics.append(low + (high - low) * (position - lower))
+        statistics.append(values[-1])
+        results.append(statistics)
+    return results
+
+
+def _numpy_statistics(groups, prices, group_count: int):
+    """
+    Compute the distribution of ``prices`` of each group, with vectorized NumPy passes:
+    prices are sorted by group then value, so that each group is a contiguous slice
+    whose statistics are read at computed offsets.
+    Same arguments and results as ``_python_statistics()``, as NumPy arrays.
+    """
+    prices = prices[numpy.lexsort((prices, groups))]
+    counts = numpy.bincount(groups, minlength=group_count)
+    starts = numpy.cumsum(counts) - counts
+    results = numpy.zeros((group_count, len(STATISTICS)))
+    results[:, 0] = counts
+    present = counts > 0
+    counts, starts = counts[present], starts[present]
+    results[present, 1] = prices[starts]
+    for column, quantile in enumerate(QUANTILES, 2):
+        position = quantile * (counts - 1)
+        lower = numpy.floor(position).astype(numpy.int64)
+        low = prices[starts + lower]
+        high = prices[starts + numpy.minimum(lower + 1, counts - 1)]
+        results[present, column] = low + (high - low) * (position - lower)
+    results[present, len(STATISTICS) - 1] = prices[starts + counts - 1]
+    return results
+
+
+def _distributions_python(sale_points: List[list]) -> Dict[str, List]:
+    """Compute the distributions with Python loops, see ``build_distributions()``"""
+    departments = [get_department_index(sale_point[3]) for sale_point in sale_points]
+    by_departments, national = [], []
+    for fuel in range(len(FuelType)):
+        groups, prices = [], []
+        for department, sale_point in zip(departments, sale_points):
+            if sale_point[5 + fuel] != -1:  # [5+] for prices
+                groups.append(department)
+                prices.append(sale_point[5 + fuel])
+        by_departments.append(_python_statistics(groups, prices, len(DEPARTMENTS)))
+        national.append(_python_statistics([0] * len(prices), prices, 1)[0])
+    return {"by_departments": by_departments, "national": national}
+
+
+def _distributions_numpy(sale_points: List[list]) -> Dict[str, List]:
+    """Compute the distributions with NumPy, see ``build_distributions()``"""
+    departments = numpy.fromiter(
+        (get_department_index(sale_point[3]) for sale_point in sale_points),
+        dtype=numpy.int64,
+        count=len(sale_points),
+    )
+    prices = numpy.array([sale_point[5:] for sale_point in sale_points], dtype=numpy.float64)
+    prices = prices.reshape(len(sale_points), len(FuelType))
+    by_departments, national = [], []
+    for fuel in range(len(FuelType)):
+        present = prices[:, fuel] != -1
+        fuel_prices = prices[present, fuel]
+        by_departments.append(
+            _numpy_statistics(departments[present], fuel_prices, len(DEPARTMENTS))
+        )
+        national.append(
+            _numpy_statistics(numpy.zeros(len(fuel_prices), dtype=numpy.int64), fuel_prices, 1)[0]
+        )
+    return {"by_departments": by_departments, "national": national}
+
+
+def build_distributions(sale_points: Iterable[list], vectorized: Optional[bool] = None) -> dict:
+    """
+    Compute the distribution of the latest prices per fuel type and department, and nationally.
+    :param sale_points: Sale points degraded by ``parse.degrade_to_latest()``,
+        or a dict containing them under ``data`` attribute
+    :param vectorized: Whether to compute with NumPy. Default to whether NumPy is installed.
+    :return: Dictionary of metrics, to merge with the ones of ``parse.build_metrics()``:
+        ``distributions_by_departments`` as ``[fuel_type -> [department -> statistics]]``,
+        ``distributions_global`` as ``[fuel_type -> statistics]``,
+        and the names of the ``statistics``. Missing statistics are ``-1``.
+    """
+    if isinstance(sale_points, dict):
+        sale_points = sale_points["data"]
+    sale_points = list(sale_points)
+    if vectorized is None:
+        vectorized = numpy is not None
+    if vectorized and numpy is None:
+        raise ImportError("NumPy is required to compute distributions vectorized")
+    LOGGER.debug("Building distributions %s NumPy", "with" if vectorized else "without")
+    if vectorized:
+        distributions = _distributions_numpy(sale_points)
+    else:
+        distributions = _distributions_python(sale_points)
+    return {
+        "distributions_by_departments": [
+            [_format(statistics) for statistics in fuel_statistics]
+            for fuel_statistics in distributions["by_departments"]
+        ],
+        "distributions_global": [_format(statistics) for statistics in distributions["national"]],
+        "statistics": STATISTICS,
+    }
@@ -0,0 +1,122 @@
+"""
+Stream of the price changes of the feed, sorted by time.
+
+Every ``<prix>`` of a sale point is a price change event. Events are collected sale point
+after sale point, so they come grouped by sale point, and sorted with an external sort:
+chunks of ``chunk_size`` events are sorted in memory and spilled in temporary files,
+then merged lazily. Memory stays bounded whatever the number of events, such as the
+millions of the year file.
+"""
+
+import heapq
+import logging
+import os
+import struct
+import tempfile
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional
+
+from .builders import SalePointBuilder
+from .models import FuelType, SalePoint, as_epoch
+from .parse import PRICE_SCALE, get_department_index
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+CHUNK_SIZE = 1 << 18  # Events sorted in memory at once
+# Event in the temporary files: time, station, fuel type, department, price
+RECORD = struct.Struct("<qqBBi")
+READ_RECORDS = 1 << 12  # Events read at once from the temporary files
+
+
+class PriceChange(NamedTuple):
+    """Change of the price of a fuel type at a sale point"""
+
+    time: int  # Seconds since epoch
+    station: int  # Id of the sale point
+    fuel_type: int  # Value of the ``FuelType``
+    department: int  # Index in ``parse.DEPARTMENTS``
+    price: int  # In ``1 / PRICE_SCALE`` euros, to compare exactly
+
+
+def price_changes(sale_point: SalePoint) -> Iterator[PriceChange]:
+    """Return the price changes of ``sale_point``, in the order of the feed"""
+    station = int(sale_point.id)
+    department = get_department_index(sale_point.address.postcode)
+    for fuel_type in FuelType:
+        for date, price in sale_point.prices.get(fuel_type.value, []):
+            yield PriceChange(
+                as_epoch(date), station, fuel_type.value, department, round(price * PRICE_SCALE)
+            )
+
+
+def _spill(events: List[PriceChange], directory: str) -> str:
+    """Sort ``events`` and write them in a new temporary file of ``directory``"""
+    events.sort()
+    descriptor, path = tempfile.mkstemp(suffix=".events", dir=directory)
+    with os.fdopen(descriptor, "wb") as stream:
+        for event in events:
+            stream.write(RECORD.pack(*event))
+    LOGGER.debug("Spilled %s events in %s", len(events), path)
+    return path
+
+
+def _read(stream: IO[bytes]) -> Iterator[PriceChange]:
+    """Read the events written by ``_spill()`` in ``stream``"""
+    while True:
+        content = stream.read(RECORD.size * READ_RECORDS)
+        if len(content) == 0:
+            return
+        for record in RECORD.iter_unpack(content):
+            yield PriceChange(*record)
+
+
+class EventSorter(SalePointBuilder):
+    """
+    Collect the price changes of sale points, to stream them sorted by time with ``events()``.
+    Sale points are not kept, only their events.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, directory: Optional[str] = None):
+        """
+        :param chunk_size: Number of events sorted in memory at once
+        :param directory: Directory of the temporary files. Default to the system's one.
+        """
+        self.chunk_size = chunk_size
+        self.directory = tempfile.TemporaryDirectory(  # pylint: disable=consider-using-with
+            prefix="prixcarburants-", dir=directory
+        )
+        self.chunk: List[PriceChange] = []
+        self.files: List[str] = []
+        self.count = 0
+
+    def add(self, sale_point: SalePoint):
+        """Add the price changes of ``sale_point``"""
+        for event in price_changes(sale_point):
+            self.chunk.append(event)
+            self.count += 1
+            if len(self.chunk) >= self.chunk_size:
+                self.files.append(_spill(self.chunk, self.directory.name))
+                self.chunk = []
+
+    def events(self) -> Iterator[PriceChange]:
+        """
+        Stream the events collected, sorted by time, then sale point and fuel type.
+        Temporary files are removed once the stream is consumed or closed.
+        """
+        self.chunk.sort()
+        LOGGER.debug("Merging %s sorted chunks of events", len(self.files) + 1)
+        streams = [open(path, "rb") for path in self.files]  # pylint: disable=consider-using-with
+        try:
+            yield from heapq.merge(*(_read(stream) for stream in streams), self.chunk)
+        finally:
+            for stream in streams:
+                stream.close()
+            self.directory.cleanup()
+
+
+def sorted_events(
+    sale_points: Iterable[SalePoint], chunk_size: int = CHUNK_SIZE
+) -> Iterator[PriceChange]:
+    """Stream the price changes of ``sale_points`` sorted by time, see ``EventSorter``"""
+    sorter = EventSorter(chunk_size)
+    for sale_point in sale_points:
+        sorter.add(sale_point)
+    yield from sorter.events()
@@ -3,71 +3,239 @@ Module containing utilities to fetch information from
 https://www.prix-carburants.gouv.fr/rubrique/opendata/ data
 """
 
-import io
+import contextlib
+import hashlib
+import json
 import logging
 import os
+import tempfile
 import zipfile
-from typing import List
+from typing import IO, BinaryIO, Dict, Iterator, List, Optional
 
 import requests
 
+from . import instrument
+
 INSTANTANEOUS_URL = "https://donnees.roulez-eco.fr/opendata/instantane"
 DAY_URL = "https://donnees.roulez-eco.fr/opendata/jour"
 YEAR_URL = "https://donnees.roulez-eco.fr/opendata/annee"
+DATA_URLS = {"now": INSTANTANEOUS_URL, "day": DAY_URL, "year": YEAR_URL}
+ARCHIVE_URL = YEAR_URL + "/{year}"  # Data of a past year
+CHUNK_SIZE = 1 << 16  # Bytes read from the network at a time
+TIMEOUT = 60  # Seconds without data before giving up a download
 
 LOGGER = logging.getLogger(os.path.basename(__file__))
 
 
-def download_zip(url: str, output_directory: str = "tmp") -> List[str]:
+class CacheManifest:
+    """
+    On-disk record of the last download of each url.
+    Keeps ``etag``, ``last_modified`` and ``sha256`` of the content,
+    used to send conditional requests and detect unchanged content.
+    Downloads are only recorded on ``save()``, once what was downloaded is processed,
+    so that a failure in-between leaves the content to download again.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path to the JSON file holding the manifest. Created on ``save()``.
+        """
+        self.path = path
+        self.entries: Dict[str, Dict[str, str]] = {}
+        self.pending: Dict[str, Dict[str, str]] = {}  # Downloads not saved yet
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf8") as stream:
+                self.entries = json.load(stream)
+
+    def headers(self, url: str) -> Dict[str, str]:
+        """Return the headers making a request to ``url`` conditional"""
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_unchanged(self, url: str, sha256: str) -> bool:
+        """Whether ``sha256`` is the digest recorded for the last content of ``url``"""
+        return self.entries.get(url, {}).get("sha256") == sha256
+
+    def update(self, url: str, response: requests.Response, sha256: str):
+        """Record the ``response`` downloaded from ``url`` with its content digest, until saved"""
+        self.pending[url] = {
+            "url": url,
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "sha256": sha256,
+        }
+
+    def save(self, path: Optional[str] = None):
+        """
+        Record the downloads since the last save, and write the manifest on disk,
+        replacing the previous one at once
+        :param path: Path to write the manifest to. Default to the one it was read from.
+        """
+        path = path or self.path
+        self.entries.update(self.pending)
+        self.pending.clear()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf8") as stream:
+            json.dump(self.entries, stream, indent=2)
+        os.replace(temporary, path)
+
+
+def download_to(
+    url: str,
+    stream: BinaryIO,
+    session: Optional[requests.Session] = None,
+    headers: Optional[Dict[str, str]] = None,
+    digest=None,
+) -> requests.Response:
+    """
+    Download the content at ``url`` into ``stream``, chunk by chunk,
+    so that the response is never fully held in memory.
+    :param url: Url to download the content from
+    :param stream: Binary stream to write the content in
+    :param session: Session to send the request with. Default to a one-shot request.
+    :param headers: Additional request headers, e.g. to make a conditional request
+    :param digest: ``hashlib`` object updated with the content downloaded
+    :return: The response. Nothing is written when its status is ``304 Not Modified``.
+    """
+    size = 0
+    with instrument.stage("download"), (session or requests).get(
+        url, stream=True, timeout=TIMEOUT, headers=headers
+    ) as response:
+        response.raise_for_status()
+        if response.status_code == 304:
+            LOGGER.debug("Content at %s not modified", url)
+            return response
+        for chunk in response.iter_content(CHUNK_SIZE):
+            stream.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            size += len(chunk)
+    instrument.count("bytes_downloaded", size)
+    LOGGER.debug("Downloaded %s bytes from %s", size, url)
+    return response
+
+
+def download_zip(
+    url: str,
+    output_directory: str = "tmp",
+    session: Optional[requests.Session] = None,
+    manifest: Optional[CacheManifest] = None,
+) -> Optional[List[str]]:
     """
-    Download a ZIP from ``url`` and extract it in ``output_directory``
+    Download a ZIP from ``url`` and extract it in ``output_directory``.
+    The archive is spooled to a temporary file, then extracted member by member.
     :param url: Url to download the ZIP from
     :param output_directory: Directory to extract the ZIP file in
-    :return: Names of the files extracted in ``output_directory``
+    :param session: Session to send the request with
+    :param manifest: Cache manifest. When given, the request is conditional and
+        nothing is extracted if the content did not change since last download.
+        The download is recorded in the manifest, but not saved.
+    :return: Names of the files extracted in ``output_directory``,
+        or None if the content did not change
     """
     LOGGER.debug("Download ZIP from %s into %s", url, output_directory)
     LOGGER.info("Downloading ZIP into %s directory...", output_directory)
-    response = requests.get(url)
-    with io.BytesIO(response.content) as stream, zipfile.ZipFile(stream) as zip_file:
-        names = zip_file.namelist()
-        zip_file.extractall(output_directory)
+    headers = manifest.headers(url) if manifest is not None else None
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile() as archive:
+        response = download_to(url, archive, session, headers, digest)
+        if response.status_code == 304:
+            LOGGER.info("Content at %s not modified, nothing downloaded", url)
+            return None
+        if manifest is not None:
+            if manifest.is_unchanged(url, digest.hexdigest()):
+                LOGGER.info("Content at %s unchanged, nothing extracted", url)
+                return None
+            manifest.update(url, response, digest.hexdigest())
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zip_file:
+            names = zip_file.namelist()
+            zip_file.extractall(output_directory)
     LOGGER.info("Files downloaded and extracted as: %s", ", ".join(names))
     return names
 
 
+@contextlib.contextmanager
+def open_zip_member(url: str, session: Optional[requests.Session] = None) -> Iterator[IO[bytes]]:
+    """
+    Download a ZIP holding a single file from ``url``
+    and open this file as a stream, decompressed on the fly.
+    Only the compressed archive is written, in a temporary file.
+    :param url: Url to download the ZIP from
+    :param session: Session to send the request with
+    :return: Context manager providing the binary stream of the file.
+        Its ``name`` attribute is the name of the file in the archive.
+    """
+    LOGGER.info("Streaming ZIP from %s...", url)
+    with tempfile.TemporaryFile() as archive:
+        download_to(url, archive, session)
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zip_file:
+            names = zip_file.namelist()
+            assert len(names) == 1
+            with zip_file.open(names[0]) as member:
+                yield member
+
+
 class DataFechter:
     """Fetcher of fuel prices"""
 
-    def __init__(self, output_directory=".tmp"):
+    def __init__(self, output_directory=".tmp", cache_file: Optional[str] = None):
         """
         :param output_directory: Direcotry to save data in
+        :param cache_file: Path to the cache manifest.
+            When given, downloads are skipped if the remote data did not change.
         """
         self.output_directory = output_directory
         os.makedirs(self.output_directory, exist_ok=True)
+        self.session = requests.Session()
+        self.manifest = CacheManifest(cache_file) if cache_file is not None else None
 
-    def download_instantaneous_data(self) -> str:
+    def _download(self, url: str) -> Optional[str]:
         """
-        Download newest data available. Uses INSTANTANEOUS_URL.
-        :return: Path to the file downloaded
+        Download and extract the single file of the ZIP at ``url``
+        :return: Path to the file downloaded, or None if it did not change
         """
-        filenames = download_zip(INSTANTANEOUS_URL, self.output_directory)
+        filenames = download_zip(url, self.output_directory, self.session, self.manifest)
+        if filenames is None:
+            return None
         assert len(filenames) == 1
         return os.path.join(self.output_directory, filenames[0])
 
-    def download_year_data(self) -> str:
+    def save_manifest(self, path: Optional[str] = None):
+        """
+        Save the cache manifest, if any, once the files downloaded are processed.
+        Until then, they are downloaded again by the next runs.
+        :param path: Path to write the manifest to. Default to the cache file.
+        """
+        if self.manifest is not None:
+            self.manifest.save(path)
+
+    def download_instantaneous_data(self) -> Optional[str]:
+        """
+        Download newest data available. Uses INSTANTANEOUS_URL.
+        :return: Path to the file downloaded, or None if it did not change
+        """
+        return self._download(INSTANTANEOUS_URL)
+
+    def download_year_data(self) -> Optional[str]:
         """
         Download current year's data. Uses YEAR_URL.
-        :return: Path to the file downloaded
+        :return: Path to the file downloaded, or None if it did not change
         """
-        filenames = download_zip(YEAR_URL, self.output_directory)
-        assert len(filenames) == 1
-        return os.path.join(self.output_directory, filenames[0])
+        return self._download(YEAR_URL)
 
-    def download_day_data(self) -> str:
+    def download_day_data(self) -> Optional[str]:
         """
         Download today's data. Uses DAY_URL.
-        :return: Path to the file downloaded
+        :return: Path to the file downloaded, or None if it did not change
         """
-        filenames = download_zip(DAY_URL, self.output_directory)
-        assert len(filenames) == 1
-        return os.path.join(self.output_directory, filenames[0])
+        return self._download(DAY_URL)
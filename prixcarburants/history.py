@@ -0,0 +1,278 @@
+"""
+Historical store of daily average prices.
+
+The store is a binary, append-only file: a header followed by one fixed-size record per day.
+A record holds, for every fuel type, the average price in every department then nationally,
+as little-endian 32-bit floats, ``-1`` standing for missing averages.
+Days are counted since epoch, so the record of a day is found at a fixed offset.
+"""
+
+import logging
+import mmap
+import os
+import shutil
+import struct
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .builders import SalePointBuilder
+from .models import FuelType, SalePoint, to_epoch
+from .parse import DEPARTMENTS, PRICE_SCALE, get_department_index
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MAGIC = b"PCHS"
+VERSION = 1
+# magic, version, fuel types, columns, first day (days since epoch), number of days
+HEADER = struct.Struct("<4sHHHiI")
+# Columns of a record, for each fuel type: departments, then the national average
+COLUMNS = tuple(DEPARTMENTS) + ("FR",)
+SECONDS_PER_DAY = 24 * 3600
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def to_day(value: date) -> int:
+    """Return the number of days between epoch and ``value``"""
+    return (value - EPOCH_DATE).days
+
+
+def from_day(day: int) -> date:
+    """Return the date ``day`` days after epoch. Inverse of ``to_day()``"""
+    return EPOCH_DATE + timedelta(days=day)
+
+
+def _positions(fuel_type: Optional[FuelType], column: Optional[str]) -> List[int]:
+    """Return the positions, in a record, of a fuel type and a column, or of all of them"""
+    fuel_indexes = range(len(FuelType)) if fuel_type is None else [fuel_type.value - 1]
+    column_indexes = range(len(COLUMNS)) if column is None else [COLUMNS.index(column)]
+    return [fuel * len(COLUMNS) + col for fuel in fuel_indexes for col in column_indexes]
+
+
+class HistoryStore:
+    """
+    Daily averages per fuel type and department, stored in a binary file.
+    Records are read through a memory map, so range queries only touch the days asked for.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path to the store. Created, empty, if it does not exist.
+        """
+        self.path = path
+        self.width = len(FuelType) * len(COLUMNS)
+        self.record = struct.Struct(f"<{self.width}f")
+        if not os.path.isfile(path):
+            self._write_header(0, 0)
+        with open(path, "rb") as stream:
+            magic, version, fuel_types, columns, first_day, days = HEADER.unpack(
+                stream.read(HEADER.size)
+            )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a history store of version {VERSION}")
+        if fuel_types != len(FuelType) or columns != len(COLUMNS):
+            raise ValueError(f"{path} was built with other fuel types or departments")
+        self.first_day = first_day
+        self.days = days
+
+    def _write_header(self, first_day: int, days: int):
+        """Write the header, creating the file if needed"""
+        with open(self.path, "r+b" if os.path.isfile(self.path) else "wb") as stream:
+            stream.write(HEADER.pack(MAGIC, VERSION, len(FuelType), len(COLUMNS), first_day, days))
+
+    @property
+    def last_day(self) -> Optional[int]:
+        """Last day stored, in days since epoch, if any"""
+        return self.first_day + self.days - 1 if self.days > 0 else None
+
+    def _prepend(self, days: int):
+        """
+        Move the first day of the store ``days`` earlier, with missing averages.
+        The file is rewritten next to the store, then replaces it at once.
+        """
+        first_day, total = self.first_day - days, self.days + days
+        LOGGER.info("Moving the first day of %s to %s", self.path, from_day(first_day))
+        header = HEADER.pack(MAGIC, VERSION, len(FuelType), len(COLUMNS), first_day, total)
+        empty = self.record.pack(*([-1.0] * self.width))
+        temporary = self.path + ".tmp"
+        with open(self.path, "rb") as source, open(temporary, "wb") as target:
+            source.seek(HEADER.size)
+            target.write(header)
+            for _ in range(days):
+                target.write(empty)
+            shutil.copyfileobj(source, target)
+        os.replace(temporary, self.path)
+        self.first_day, self.days = first_day, total
+
+    def write(self, first_day: int, records: List[array], overwrite: bool = False):
+        """
+        Write daily ``records`` starting at ``first_day``.
+        Days already stored are kept unless ``overwrite``, since the averages of a partial feed,
+        such as the instantaneous one, would replace complete ones.
+        Other days are written, and missing days in-between are filled with missing averages.
+        :param first_day: Day of the first record, in days since epoch.
+            If before the first day of the store, the store is rewritten to start there.
+        :param records: Records, as built by ``HistoryBuilder.records()``
+        :param overwrite: Whether to replace the days already stored
+        """
+        if overwrite or self.days == 0:
+            self._write(first_day, records)
+            return
+        stored_first, stored_end = self.first_day, self.first_day + self.days
+        before = records[: max(0, stored_first - first_day)]
+        after = records[max(0, stored_end - first_day) :]
+        kept = len(records) - len(before) - len(after)
+        if kept > 0:
+            LOGGER.info("Keeping %s days already stored in %s", kept, self.path)
+        self._write(first_day, before)
+        self._write(max(first_day, stored_end), after)
+
+    def _write(self, first_day: int, records: List[array]):
+        """Write daily ``records`` starting at ``first_day``, overwriting days already stored"""
+        if len(records) == 0:
+            return
+        if self.days == 0:
+            self.first_day = first_day
+        elif first_day < self.first_day:
+            self._prepend(self.first_day - first_day)
+        empty = self.record.pack(*([-1.0] * self.width))
+        with open(self.path, "r+b") as stream:
+            stream.seek(HEADER.size + self.days * self.record.size)
+            for _ in range(self.days, first_day - self.first_day):
+                stream.write(empty)
+            stream.seek(HEADER.size + (first_day - self.first_day) * self.record.size)
+            for record in records:
+                stream.write(self.record.pack(*record))
+        self.days = max(self.days, first_day - self.first_day + len(records))
+        self._write_header(self.first_day, self.days)
+        LOGGER.info("History stored from %s to %s", from_day(first_day), from_day(self.last_day))
+
+    def query(  # pylint: disable=too-many-arguments
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        fuel_type: Optional[FuelType] = None,
+        column: Optional[str] = None,
+        step: int = 1,
+    ) -> Tuple[List[int], List[List[float]]]:
+        """
+        Read averages over a range of days, optionally downsampled.
+        :param start: First day to read, in days since epoch. Default to the first day stored.
+        :param end: Last day to read, included. Default to the last day stored.
+        :param fuel_type: Only read this fuel type. Default to every fuel type.
+        :param column: Only read this department code, or ``FR`` for national averages.
+            Default to every column.
+        :param step: Number of days averaged together, missing averages being skipped
+        :return: First day of each step, and the values of each step,
+            flat ``fuel type -> column`` lists restricted to the selected ones
+        """
+        days, values = [], []
+        if self.days == 0:
+            return days, values
+        start = self.first_day if start is None else max(start, self.first_day)
+        end = self.last_day if end is None else min(end, self.last_day)
+        positions = _positions(fuel_type, column)
+        with open(self.path, "rb") as stream, mmap.mmap(
+            stream.fileno(), 0, access=mmap.ACCESS_READ
+        ) as content:
+            for step_start in range(start, end + 1, step):
+                step_end = min(step_start + step, end + 1)
+                days.append(step_start)
+                values.append(self._average(content, range(step_start, step_end), positions))
+        return days, values
+
+    def _average(self, content: mmap.mmap, days: range, positions: List[int]) -> List[float]:
+        """Average the values at ``positions`` of the records of ``days``, skipping missing ones"""
+        sums = [0.0] * len(positions)
+        counts = [0] * len(positions)
+        for day in days:
+            offset = HEADER.size + (day - self.first_day) * self.record.size
+            record = self.record.unpack_from(content, offset)
+            for index, position in enumerate(positions):
+                if record[position] >= 0:
+                    sums[index] += record[position]
+                    counts[index] += 1
+        return [total / count if count > 0 else -1 for total, count in zip(sums, counts)]
+
+
+class HistoryBuilder(SalePointBuilder):
+    """
+    Build daily averages from the price histories of sale points, such as the year file's.
+    A price is in effect from the day it is set until the day it changes,
+    or until the last day of the feed.
+    Only running differences per day are kept, so memory does not depend on the number of
+    sale points.
+    """
+
+    def __init__(self):
+        # [position in a record -> {day: difference}], for price sums and counts
+        self.total_changes: List[Dict[int, int]] = [{} for _ in range(len(FuelType) * len(COLUMNS))]
+        self.count_changes: List[Dict[int, int]] = [{} for _ in range(len(FuelType) * len(COLUMNS))]
+        self.first_day: Optional[int] = None
+        self.last_day: Optional[int] = None
+
+    def _change(self, position: int, day: int, total: int, count: int):
+        """Record that the sums at ``position`` in the records change from ``day`` on"""
+        totals = self.total_changes[position]
+        counts = self.count_changes[position]
+        totals[day] = totals.get(day, 0) + total
+        counts[day] = counts.get(day, 0) + count
+
+    def add(self, sale_point: SalePoint):
+        """Add the price history of ``sale_point``"""
+        department = get_department_index(sale_point.address.postcode)
+        national = len(COLUMNS) - 1
+        for fuel, fuel_type in enumerate(FuelType):
+            daily: Dict[int, Tuple[int, int]] = {}  # day -> (time, price) of the day's last change
+            for time, price in sale_point.prices.get(fuel_type.value, []):
+                seconds = time if isinstance(time, int) else to_epoch(time)
+                day = seconds // SECONDS_PER_DAY
+                if day not in daily or daily[day][0] <= seconds:
+                    daily[day] = (seconds, round(price * PRICE_SCALE))
+            # The first price is counted, the next ones replace the previous one in the sums
+            previous, count = 0, 1
+            for day in sorted(daily):
+                price = daily[day][1]
+                for column in (department, national):
+                    self._change(fuel * len(COLUMNS) + column, day, price - previous, count)
+                previous, count = price, 0
+                self.first_day = day if self.first_day is None else min(self.first_day, day)
+                self.last_day = day if self.last_day is None else max(self.last_day, day)
+
+    def records(self) -> Tuple[Optional[int], List[array]]:
+        """
+        Compute the daily records, with running sums over the days
+        :return: First day, in days since epoch, and one record per day up to the last one
+        """
+        if self.first_day is None:
+            return None, []
+        records = [
+            array("f", [-1.0]) * (len(FuelType) * len(COLUMNS))
+            for _ in range(self.last_day - self.first_day + 1)
+        ]
+        for position, (totals, counts) in enumerate(zip(self.total_changes, self.count_changes)):
+            total, count = 0, 0
+            for index, record in enumerate(records):
+                day = self.first_day + index
+                total += totals.get(day, 0)
+                count += counts.get(day, 0)
+                if count > 0:
+                    record[position] = total / count / PRICE_SCALE
+        return self.first_day, records
+
+
+def export(store: HistoryStore, **query) -> dict:
+    """
+    Export a range of the ``store`` as a JSON-serializable dictionary, for trend charts.
+    :param query: Arguments of ``HistoryStore.query()``
+    :return: Dictionary with ``days`` as ISO dates, ``values`` for each day,
+        and the ``fuel_types`` and ``columns`` of the values
+    """
+    days, values = store.query(**query)
+    fuel_type = query.get("fuel_type")
+    column = query.get("column")
+    return {
+        "days": [from_day(day).isoformat() for day in days],
+        "fuel_types": [fuel.name for fuel in FuelType] if fuel_type is None else [fuel_type.name],
+        "columns": list(COLUMNS) if column is None else [column],
+        "values": [[round(value, 4) for value in row] for row in values],
+    }
@@ -0,0 +1,219 @@
+"""
+Instrumentation of the stages of a run.
+
+Like ``logging``, measures are recorded in a module-level registry, so that any module
+can time a stage or increment a counter without the registry being passed around.
+Stages may be nested, the time of a stage excluding the time of the stages run inside it.
+Measures are emitted as JSON lines or in the Prometheus text format.
+"""
+
+import io
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+PREFIX = "prixcarburants"  # Prefix of the Prometheus metrics, and default name of reports
+FORMATS = ("jsonl", "prometheus")
+PROFILERS = ("cprofile", "tracemalloc")
+REPORT_LINES = 40  # Number of entries written in profiling reports
+
+Item = TypeVar("Item")
+
+# Time spent in each stage, in seconds, excluding the time of nested stages
+STAGES: Dict[str, float] = {}
+# Counters, by name
+COUNTERS: Dict[str, int] = {}
+# Stages running, as [name, start time, time of nested stages]
+_RUNNING: List[list] = []
+
+
+def reset():
+    """Forget every measure"""
+    STAGES.clear()
+    COUNTERS.clear()
+    _RUNNING.clear()
+
+
+def count(name: str, value: int = 1):
+    """Add ``value`` to the counter ``name``"""
+    COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def count_file(path: str, name: str = "bytes_written"):
+    """Add the size of the file at ``path``, or of the files under it, to the counter ``name``"""
+    if os.path.isdir(path):
+        for directory, _, filenames in os.walk(path):
+            for filename in filenames:
+                count(name, os.path.getsize(os.path.join(directory, filename)))
+    elif os.path.isfile(path):
+        count(name, os.path.getsize(path))
+
+
+def _enter(name: str):
+    _RUNNING.append([name, time.perf_counter(), 0.0])
+
+
+def _exit():
+    name, start, nested = _RUNNING.pop()
+    elapsed = time.perf_counter() - start
+    STAGES[name] = STAGES.get(name, 0.0) + elapsed - nested
+    if len(_RUNNING) > 0:
+        _RUNNING[-1][2] += elapsed
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the code run in this context as the stage ``name``"""
+    _enter(name)
+    try:
+        yield
+    finally:
+        _exit()
+
+
+def timed(iterable: Iterable[Item], name: str, counter: Optional[str] = None) -> Iterator[Item]:
+    """
+    Pass the items of ``iterable`` through, timing the production of each item as the stage
+    ``name``. Useful for lazy stages, whose work happens while consumers iterate.
+    :param counter: Counter of the items produced, if any
+    """
+    iterator = iter(iterable)
+    while True:
+        _enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _exit()
+        if counter is not None:
+            count(counter)
+        yield item
+
+
+def peak_memory() -> Optional[int]:
+    """Return the peak resident memory of the process, in bytes, if it can be known"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Kilobytes on Linux
+
+
+def snapshot(command: Optional[str] = None) -> dict:
+    """Return every measure, as a JSON-serializable dictionary"""
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "command": command,
+        "stages": {name: round(seconds, 6) for name, seconds in STAGES.items()},
+        "counters": dict(COUNTERS),
+        "peak_memory_bytes": peak_memory(),
+    }
+
+
+def to_prometheus(measures: dict) -> str:
+    """Format the ``measures`` of ``snapshot()`` in the Prometheus text format"""
+    lines = [
+        f"# HELP {PREFIX}_stage_seconds Time spent in each stage of the last run",
+        f"# TYPE {PREFIX}_stage_seconds gauge",
+    ]
+    for name, seconds in measures["stages"].items():
+        lines.append(f'{PREFIX}_stage_seconds{{stage="{name}"}} {seconds}')
+    for name, value in measures["counters"].items():
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.append(f"{PREFIX}_{name} {value}")
+    if measures["peak_memory_bytes"] is not None:
+        lines.append(f"# TYPE {PREFIX}_peak_memory_bytes gauge")
+        lines.append(f"{PREFIX}_peak_memory_bytes {measures['peak_memory_bytes']}")
+    return "\n".join(lines) + "\n"
+
+
+def save(path: str, output_format: str = "jsonl", command: Optional[str] = None):
+    """
+    Save the measures at ``path``
+    :param output_format: ``jsonl`` to append a line to ``path``,
+        or ``prometheus`` to overwrite it, e.g. for a textfile collector
+    :param command: Name of the command run, saved along the measures
+    """
+    measures = snapshot(command)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if output_format == "jsonl":
+        with open(path, "a", encoding="utf8") as stream:
+            stream.write(json.dumps(measures) + "\n")
+    else:
+        with open(path, "w", encoding="utf8") as stream:
+            stream.write(to_prometheus(measures))
+    LOGGER.debug("Measures saved in %s", path)
+
+
+class Profiler:
+    """
+    Profile a run with ``cProfile`` (time) or ``tracemalloc`` (memory).
+    Reporting modules are only imported when profiling, as they are slow to import.
+    """
+
+    def __init__(self, kind: str):
+        """
+        :param kind: Profiler to use, in ``PROFILERS``
+        """
+        self.kind = kind
+        self.profile = None
+        if kind == "cprofile":
+            import cProfile  # pylint: disable=import-outside-toplevel
+
+            self.profile = cProfile.Profile()
+
+    def start(self):
+        """Start profiling"""
+        if self.profile is not None:
+            self.profile.enable()
+        else:
+            import tracemalloc  # pylint: disable=import-outside-toplevel
+
+            tracemalloc.start()
+
+    def stop(self) -> str:
+        """Stop profiling and return the report"""
+        # pylint: disable=import-outside-toplevel
+        import pstats
+        import tracemalloc
+
+        stream = io.StringIO()
+        if self.profile is not None:
+            self.profile.disable()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+        else:
+            current, peak = tracemalloc.get_traced_memory()
+            allocations = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            stream.write(f"Current traced memory: {current} bytes, peak: {peak} bytes\n\n")
+            stream.write(f"Top {REPORT_LINES} lines by memory still allocated:\n")
+            for statistic in allocations[:REPORT_LINES]:
+                stream.write(f"{statistic}\n")
+        return stream.getvalue()
+
+    def save(self, report: str, output_file: Optional[str]) -> str:
+        """
+        Save ``report`` next to ``output_file``
+        :param output_file: Output of the run. Default to the current directory.
+        :return: Path to the report
+        """
+        base = output_file if output_file is not None else PREFIX
+        if os.path.isdir(base):
+            base = os.path.join(base, PREFIX)
+        path = f"{base}.{self.kind}.txt"
+        with open(path, "w", encoding="utf8") as stream:
+            stream.write(report)
+        LOGGER.info("Profiling report saved in %s", path)
+        return path
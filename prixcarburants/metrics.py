@@ -0,0 +1,116 @@
+"""
+Incremental metrics.
+
+Keeps running counts and sums of prices per fuel type and department in a small state file,
+so that hourly updates only apply the sale points that changed since the previous snapshot.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from . import parse
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+
+
+def snapshot_digest(degraded: Dict[str, List]) -> str:
+    """Return a digest identifying a snapshot degraded by ``parse.degrade_to_latest()``"""
+    content = json.dumps([degraded["ids"], degraded["data"]], separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+
+class MetricsStore:
+    """
+    Running counts and sums of prices per fuel type and department.
+    See ``parse.sum_prices()``.
+    """
+
+    def __init__(self, counts=None, totals=None, snapshot: Optional[str] = None):
+        """
+        :param counts: Counts of prices, as ``[fuel_type -> [department -> value]]``
+        :param totals: Sums of prices, as ``[fuel_type -> [department -> value]]``
+        :param snapshot: Digest of the snapshot the sums were computed on
+        """
+        if counts is None or totals is None:
+            counts, totals = parse.sum_prices([])
+        self.counts = counts
+        self.totals = totals
+        self.snapshot = snapshot
+
+    @staticmethod
+    def load(path: str) -> "MetricsStore":
+        """Load the store saved at ``path``, or return an empty one if there is none"""
+        if not os.path.isfile(path):
+            LOGGER.info("No metrics state at %s, starting from scratch", path)
+            return MetricsStore()
+        with open(path, "r", encoding="utf8") as stream:
+            state = json.load(stream)
+        return MetricsStore(state["counts"], state["totals"], state["snapshot"])
+
+    def save(self, path: str):
+        """Save the store at ``path``"""
+        with open(path, "w", encoding="utf8") as stream:
+            json.dump(
+                {"counts": self.counts, "totals": self.totals, "snapshot": self.snapshot},
+                stream,
+                separators=(",", ":"),
+            )
+
+    def rebuild(self, current: Dict[str, List]):
+        """Compute the sums from scratch on the ``current`` snapshot"""
+        self.counts, self.totals = parse.sum_prices(current["data"])
+        self.snapshot = snapshot_digest(current)
+
+    def apply(self, previous: Dict[str, List], current: Dict[str, List]) -> int:
+        """
+        Update the sums from the ``previous`` snapshot to the ``current`` one.
+        Sale points are matched on their ids, only the ones that changed update the sums.
+        Both snapshots are degraded by ``parse.degrade_to_latest()``,
+        and the store must hold the sums of ``previous``.
+        :return: Number of sale points added, removed or changed
+        """
+        previous_rows = dict(zip(previous["ids"], previous["data"]))
+        changes = 0
+        for station_id, row in zip(current["ids"], current["data"]):
+            previous_row = previous_rows.pop(station_id, None)
+            if previous_row == row:
+                continue
+            if previous_row is not None:
+                parse.add_prices(self.counts, self.totals, previous_row, -1)
+            parse.add_prices(self.counts, self.totals, row)
+            changes += 1
+        for row in previous_rows.values():
+            parse.add_prices(self.counts, self.totals, row, -1)
+            changes += 1
+        self.snapshot = snapshot_digest(current)
+        return changes
+
+    def metrics(self) -> dict:
+        """Return the metrics, as ``parse.build_metrics()`` does"""
+        return parse.metrics_from_sums(self.counts, self.totals)
+
+
+def update_metrics(
+    state_file: str, current: Dict[str, List], previous: Optional[Dict[str, List]] = None
+) -> dict:
+    """
+    Update the metrics state saved in ``state_file`` with the ``current`` snapshot.
+    Only applies the changes since ``previous`` when the state was computed on it,
+    otherwise computes the sums from scratch.
+    :param state_file: Path to the state file. Created if needed.
+    :param current: Latest sale points, degraded by ``parse.degrade_to_latest()``
+    :param previous: Previous snapshot, as saved by the previous transformation
+    :return: Metrics of the ``current`` snapshot. Same as ``parse.build_metrics(current)``.
+    """
+    store = MetricsStore.load(state_file)
+    if previous is not None and "ids" in previous and store.snapshot == snapshot_digest(previous):
+        changes = store.apply(previous, current)
+        LOGGER.info("Metrics updated with %s changed sale points", changes)
+    else:
+        LOGGER.info("Metrics state not matching previous snapshot, rebuilding it")
+        store.rebuild(current)
+    store.save(state_file)
+    return store.metrics()
@@ -2,11 +2,22 @@
 Models
 """
 
-import xml.etree.ElementTree as ET
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Set, Tuple
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+if TYPE_CHECKING:  # Only needed to parse, not to use the models
+    import xml.etree.ElementTree as ET
+
+EPOCH = datetime(1970, 1, 1)
+DATE_CACHE_SIZE = 1 << 16  # Distinct date strings remembered by the date parsers
+# Names of the services met, so that sale points share a single string per service
+SERVICE_NAMES: Dict[str, str] = {}
+
+# A date, either as a datetime or as seconds since epoch (see ``to_epoch()``)
+Date = Union[datetime, int]
 
 
 class WeekDay(Enum):
@@ -36,6 +47,7 @@ class FuelType(Enum):
 class Location:
     """GPS location"""
 
+    __slots__ = ("latitude", "longitude")
     latitude: float
     longitude: float
 
@@ -44,6 +56,7 @@ class Location:
 class Address:
     """Human-readable address"""
 
+    __slots__ = ("postcode", "address", "city")
     postcode: int
     address: str
     city: str
@@ -54,16 +67,20 @@ class OutOfOrder:
     """Fuel out of order"""
 
     fuel_type: FuelType
-    start_time: datetime
-    end_time: Optional[datetime] = None
+    start_time: Date
+    end_time: Optional[Date] = None
 
     @staticmethod
-    def build(element: ET.Element):
-        """Build an OutOfOrder from an XML element"""
+    def build(element: "ET.Element", epoch: bool = False):
+        """
+        Build an OutOfOrder from an XML element
+        :param epoch: Whether to keep dates as seconds since epoch
+        """
+        parse_date = parse_iso_timestamp if epoch else parse_iso_datetime
         fuel_type = FuelType[element.get("nom").upper()]
-        start_time = parse_iso_datetime(element.get("debut"))
+        start_time = parse_date(element.get("debut"))
         end_time_str = element.get("fin", "")
-        end_time = None if len(end_time_str) == 0 else parse_iso_datetime(end_time_str)
+        end_time = None if len(end_time_str) == 0 else parse_date(end_time_str)
         return OutOfOrder(fuel_type, start_time, end_time)
 
 
@@ -71,17 +88,20 @@ class OutOfOrder:
 class ClosingTime:
     """Period where the sale point is closed"""
 
-    start_time: datetime
-    end_time: Optional[datetime] = None
+    start_time: Date
+    end_time: Optional[Date] = None
 
     @staticmethod
-    def build(element: ET.Element):
-        """Build an ClosingTime from an XML element"""
-        temporary = element.get("type") == "T"
+    def build(element: "ET.Element", epoch: bool = False):
+        """
+        Build an ClosingTime from an XML element
+        :param epoch: Whether to keep dates as seconds since epoch
+        """
+        parse_date = parse_iso_timestamp if epoch else parse_iso_datetime
         end_time = None
-        if not temporary and len(element.get("fin", "")) > 0:
-            end_time = parse_iso_datetime(element.get("fin"))
-        start_time = parse_iso_datetime(element.get("debut"))
+        if len(element.get("fin", "")) > 0:
+            end_time = parse_date(element.get("fin"))
+        start_time = parse_date(element.get("debut"))
         return ClosingTime(start_time, end_time)
 
 
@@ -94,19 +114,30 @@ class WorkDay:
     opening_hours: List[Tuple[int, int]]
 
     @staticmethod
-    def build(element: ET.Element):
+    def build(element: "ET.Element"):
         """Build an OpeningDay from an XML element"""
-        closed = element.get("ferme", 0) == 1
-        day = int(element.get("id"))
+        closed = element.get("ferme", "") == "1"
+        day = WeekDay(int(element.get("id")))
         opening_hours = []
         for hours in element:
             assert hours.tag == "horaire"
-            start_hour = (hour(hours.get("ouverture")),)
+            start_hour = hour(hours.get("ouverture"))
             end_hour = hour(hours.get("fermeture"))
             opening_hours.append((start_hour, end_hour))
         return WorkDay(day, closed, opening_hours)
 
 
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping ``(start, end)`` intervals, returned sorted"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
 def hour(text: str) -> int:
     """
     Parse an hour with format "hh.mm" into an integer
@@ -117,16 +148,21 @@ def hour(text: str) -> int:
     return int(hours) * 60 + int(minutes)
 
 
-def parse_services(services: ET.Element) -> Set[str]:
+def intern_service(name: str) -> str:
+    """Return the string shared by every sale point for the service ``name``"""
+    return SERVICE_NAMES.setdefault(name, name)
+
+
+def parse_services(services: "ET.Element") -> Set[str]:
     """
     Parse <services> tag.
     :param services: The element services
-    :return: The list of services parsed
+    :return: The list of services parsed, as interned strings
     """
-    return {service.text for service in services}
+    return {intern_service(service.text) for service in services}
 
 
-def parse_work_days(element: ET.Element) -> List[WorkDay]:
+def parse_work_days(element: "ET.Element") -> List[WorkDay]:
     """
     Parse <horaires> tag.
     :param element: The element horaires
@@ -135,22 +171,49 @@ def parse_work_days(element: ET.Element) -> List[WorkDay]:
     return [WorkDay.build(child) for child in element]
 
 
+@lru_cache(maxsize=DATE_CACHE_SIZE)
 def parse_iso_datetime(date_str: str) -> datetime:
-    """Parse an ISO datetime, handling without T"""
-    if "T" in date_str:
-        return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-    return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+    """
+    Parse an ISO datetime, handling without T.
+    The feed only uses ``YYYY-MM-DDTHH:MM:SS`` and ``YYYY-MM-DD HH:MM:SS``,
+    both handled by the C implementation of ``datetime.fromisoformat()``.
+    Results are cached, as the same dates are repeated across the feed.
+    """
+    return datetime.fromisoformat(date_str)
+
+
+def to_epoch(date: datetime) -> int:
+    """Convert a naive ``date`` into seconds since epoch, without any timezone shift"""
+    return (date - EPOCH) // timedelta(seconds=1)
+
+
+def as_epoch(value: Date) -> int:
+    """Return ``value`` as seconds since epoch, whether it is a datetime or already seconds"""
+    return value if isinstance(value, int) else to_epoch(value)
+
+
+def from_epoch(seconds: int) -> datetime:
+    """Convert ``seconds`` since epoch back into a naive datetime. Inverse of ``to_epoch()``"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_iso_timestamp(date_str: str) -> int:
+    """Parse an ISO datetime, like ``parse_iso_datetime()``, into seconds since epoch"""
+    return to_epoch(datetime.fromisoformat(date_str))
 
 
-def parse_price(element: ET.Element) -> Tuple[FuelType, datetime, float]:
+def parse_price(element: "ET.Element", epoch: bool = False) -> Tuple[FuelType, Date, float]:
     """
     Parse <prix> tag.
     :param element: The element <prix> to parse
+    :param epoch: Whether to keep the update date as seconds since epoch
     :return: fuel type, update date, price
     """
+    parse_date = parse_iso_timestamp if epoch else parse_iso_datetime
     return (
         FuelType[element.get("nom").upper()],
-        parse_iso_datetime(element.get("maj")),
+        parse_date(element.get("maj")),
         float(element.get("valeur")),
     )
 
@@ -162,7 +225,7 @@ class SalePoint:  # pylint: disable=too-many-instance-attributes
     id: str
     location: Location
     address: Address
-    prices: Dict[FuelType, List[Tuple[datetime, float]]]
+    prices: Dict[FuelType, List[Tuple[Date, float]]]
     out_of_orders: List[OutOfOrder]
     closing_times: List[ClosingTime]
     services: Optional[Set[str]] = None
@@ -170,8 +233,11 @@ class SalePoint:  # pylint: disable=too-many-instance-attributes
     opening_days: Optional[List[WorkDay]] = None
 
     @staticmethod
-    def build(element: ET.Element):
-        """Build a SalePoint from an XML element"""
+    def build(element: "ET.Element", epoch: bool = False):
+        """
+        Build a SalePoint from an XML element
+        :param epoch: Whether to keep dates as seconds since epoch rather than datetime objects
+        """
         prices = {key.value: [] for key in FuelType}
         services = None
         automate_24h = False
@@ -185,19 +251,19 @@ class SalePoint:  # pylint: disable=too-many-instance-attributes
                 city = child.text
             elif child.tag == "prix":
                 if len(child.attrib) > 0:
-                    fuel_type, date, price = parse_price(child)
+                    fuel_type, date, price = parse_price(child, epoch)
                     prices[fuel_type.value].append((date, price))
             elif child.tag == "services":
                 services = parse_services(child)
             elif child.tag == "horaires":
-                automate_24h = child.get("automate-24-24", 0) == 1
+                automate_24h = child.get("automate-24-24", "") == "1"
                 opening_days = parse_work_days(child)
             elif child.tag == "rupture":
                 if len(child.attrib) > 0:
-                    out_of_orders.append(OutOfOrder.build(child))
+                    out_of_orders.append(OutOfOrder.build(child, epoch))
             elif child.tag == "fermeture":
                 if len(child.attrib) > 0:
-                    closing_times.append(ClosingTime.build(child))
+                    closing_times.append(ClosingTime.build(child, epoch))
             else:
                 raise Exception("Unhandled tag " + child.tag + " in " + child)
         return SalePoint(
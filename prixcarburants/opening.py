@@ -0,0 +1,180 @@
+"""
+Opening hours of the sale points, and index of the sale points open at a given time.
+
+Opening hours are stored as intervals of minutes of the week, Monday 00:00 being ``0``,
+merged per sale point. Sale points with the 24/7 automaton are always open,
+the ones without opening hours are never considered open.
+Times are local times of the feed, i.e. of France.
+
+The export interns the schedules, as many sale points share the same one:
+``schedules`` holds flat ``[start, end, start, end...]`` lists,
+and ``stations`` the index of the schedule of each sale point, ``-1`` when unknown.
+"""
+
+import logging
+import os
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import bitsets, parse
+from .builders import SalePointBuilder
+from .models import FuelType, SalePoint, merge_intervals
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+ALWAYS_OPEN = (0, MINUTES_PER_WEEK)
+
+
+def minute_of_week(moment: datetime) -> int:
+    """Return the number of minutes between the Monday before ``moment`` and ``moment``"""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def merge_weekly(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merge overlapping intervals of minutes of the week.
+    Intervals ending after the end of the week are wrapped to its beginning.
+    """
+    pieces = []
+    for start, end in intervals:
+        if end > MINUTES_PER_WEEK:
+            pieces.append((start, MINUTES_PER_WEEK))
+            pieces.append((0, end - MINUTES_PER_WEEK))
+        else:
+            pieces.append((start, end))
+    return merge_intervals(pieces)
+
+
+def weekly_intervals(sale_point: SalePoint) -> Optional[List[Tuple[int, int]]]:
+    """
+    Return the intervals of minutes of the week ``sale_point`` is open,
+    or None if its opening hours are unknown.
+    Hours closing before they open close the next day, the ones closing when they open
+    last the whole day.
+    """
+    if sale_point.automate_24h:
+        return [ALWAYS_OPEN]
+    if sale_point.opening_days is None:
+        return None
+    intervals = []
+    for work_day in sale_point.opening_days:
+        if work_day.closed:
+            continue
+        offset = (work_day.day.value - 1) * MINUTES_PER_DAY
+        for start, end in work_day.opening_hours:
+            if end <= start:
+                end += MINUTES_PER_DAY
+            intervals.append((offset + start, offset + end))
+    return merge_weekly(intervals)
+
+
+def fuel_mask(sale_point: SalePoint) -> int:
+    """Return the fuel types sold by ``sale_point``, bit ``n`` standing for the value ``n + 1``"""
+    mask = 0
+    for fuel_type in FuelType:
+        if len(sale_point.prices.get(fuel_type.value, [])) > 0:
+            mask |= 1 << (fuel_type.value - 1)
+    return mask
+
+
+class OpeningHoursBuilder(SalePointBuilder):
+    """Collect the opening hours and fuel types of sale points, for ``export()``"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.stations: List[int] = []
+        self.fuels: List[int] = []
+        # Index of each distinct schedule, as flat ``[start, end...]`` tuples
+        self.schedules: Dict[Tuple[int, ...], int] = {}
+
+    def add(self, sale_point: SalePoint):
+        """Add the opening hours of ``sale_point``"""
+        intervals = weekly_intervals(sale_point)
+        if intervals is None:
+            schedule = -1
+        else:
+            flat = tuple(minute for interval in intervals for minute in interval)
+            schedule = self.schedules.setdefault(flat, len(self.schedules))
+        self.ids.append(sale_point.id)
+        self.stations.append(schedule)
+        self.fuels.append(fuel_mask(sale_point))
+
+    def export(self) -> dict:
+        """Export the opening hours as a JSON-serializable dictionary, see ``OpeningIndex``"""
+        LOGGER.debug("%s distinct schedules for %s sale points", len(self.schedules), len(self.ids))
+        return {
+            "ids": self.ids,
+            "schedules": [list(schedule) for schedule in self.schedules],
+            "stations": self.stations,
+            "fuels": self.fuels,
+            "fuel_types": [fuel_type.name for fuel_type in FuelType],
+        }
+
+
+class OpeningIndex:
+    """
+    Sale points open at any minute of the week.
+    The week is split on the boundaries of every schedule, so that the sale points open
+    are the same during each segment. They are stored once per segment, as a bitset
+    (see ``bitsets``).
+    A query is then a binary search of the segment and a few bitwise operations.
+    """
+
+    def __init__(self, opening_hours: dict):
+        """
+        :param opening_hours: Opening hours exported by ``OpeningHoursBuilder.export()``
+        """
+        self.ids: List[str] = opening_hours["ids"]
+        size = len(self.ids)
+        schedules = opening_hours["schedules"]
+        toggles = {0: bitsets.empty(size)}
+        for schedule in schedules:
+            for minute in schedule:
+                toggles.setdefault(minute, bitsets.empty(size))
+        fuels = [bitsets.empty(size) for _ in FuelType]
+        for position, (schedule, mask) in enumerate(
+            zip(opening_hours["stations"], opening_hours["fuels"])
+        ):
+            for fuel, bitset in enumerate(fuels):
+                if mask >> fuel & 1:
+                    bitsets.toggle(bitset, position)
+            if schedule < 0:
+                continue
+            for minute in schedules[schedule]:
+                if minute < MINUTES_PER_WEEK:
+                    bitsets.toggle(toggles[minute], position)
+        self.boundaries = sorted(minute for minute in toggles if minute < MINUTES_PER_WEEK)
+        self.segments: List[int] = []
+        current = 0
+        for minute in self.boundaries:
+            current ^= bitsets.to_int(toggles[minute])
+            self.segments.append(current)
+        self.fuels = [bitsets.to_int(bitset) for bitset in fuels]
+        LOGGER.debug("Opening index of %s sale points in %s segments", size, len(self.segments))
+
+    @staticmethod
+    def load(path: str) -> "OpeningIndex":
+        """Load the opening hours saved at ``path`` by ``transform --opening-hours``"""
+        return OpeningIndex(parse.load_json(path))
+
+    def open_at(self, moment: datetime, fuel_type: Optional[FuelType] = None) -> int:
+        """
+        Return the bitset of the sale points open at ``moment``
+        :param moment: Local time
+        :param fuel_type: Only keep the sale points selling this fuel type
+        """
+        segment = bisect_right(self.boundaries, minute_of_week(moment)) - 1
+        bitset = self.segments[segment]
+        if fuel_type is not None:
+            bitset &= self.fuels[fuel_type.value - 1]
+        return bitset
+
+    def positions(self, bitset: int) -> List[int]:
+        """Return the positions of the sale points of ``bitset``, in order"""
+        return bitsets.positions(bitset, len(self.ids))
+
+    def open_stations(self, moment: datetime, fuel_type: Optional[FuelType] = None) -> List[str]:
+        """Return the ids of the sale points open at ``moment``, see ``open_at()``"""
+        return [self.ids[position] for position in self.positions(self.open_at(moment, fuel_type))]
@@ -0,0 +1,238 @@
+"""
+Output formats of the transformed data.
+
+Besides JSON, data can be saved in a compact binary format: a columnar layout where
+strings (addresses, cities, postcodes) are stored once in a string table,
+and prices are stored as integers. See ``encode()`` for the layout.
+Pre-compressed variants can be written next to any output, to be served as is.
+"""
+
+import gzip
+import logging
+import os
+import struct
+import sys
+from array import array
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Tuple
+
+from .parse import LATEST_KEYS, PRICE_SCALE, save_as_json
+
+if TYPE_CHECKING:  # Only imported to save or load the full layout, as it may import NumPy
+    from .table import SalePointTable
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MAGIC = b"PCBF"
+VERSION = 1
+# magic, version, layout, number of strings, number of columns
+HEADER = struct.Struct("<4sHHII")
+COLUMN_HEADER = struct.Struct("<HcI")  # name length, type code, number of items
+STRING_LENGTH = struct.Struct("<H")
+LAYOUT_LATEST = 0  # Sale points degraded by ``parse.degrade_to_latest()``
+LAYOUT_TABLE = 1  # Columns of a ``table.SalePointTable``
+# Type codes of the columns, with their ``array`` type codes.
+# ``s`` columns are indexes in the string table,
+# ``p`` columns are prices in ``1 / PRICE_SCALE`` euros, ``-1`` standing for missing prices.
+TYPES = {b"d": "d", b"i": "i", b"q": "q", b"b": "b", b"s": "I", b"p": "i"}
+
+Column = Tuple[str, bytes, Sequence]
+
+
+def encode(layout: int, columns: List[Column]) -> bytes:
+    """
+    Encode columns in the binary format. Every value is little-endian:
+    - header: magic, version, layout, number of strings and number of columns
+    - string table: for each string, its length as ``uint16`` then its UTF-8 bytes
+    - columns: for each column, the length of its name as ``uint16``, its type code,
+      its number of items as ``uint32``, its UTF-8 name and then its packed items
+    :param layout: Layout of the columns, ``LAYOUT_LATEST`` or ``LAYOUT_TABLE``
+    :param columns: ``(name, type code, values)`` of each column. See ``TYPES``.
+    :return: Encoded content
+    """
+    strings: Dict[str, int] = {}
+    packed = []
+    for name, code, values in columns:
+        if code == b"s":
+            values = [strings.setdefault(value, len(strings)) for value in values]
+        elif code == b"p":
+            values = [-1 if value == -1 else round(value * PRICE_SCALE) for value in values]
+        items = array(TYPES[code], values)
+        if sys.byteorder == "big":
+            items.byteswap()
+        encoded_name = name.encode("utf8")
+        packed.append(COLUMN_HEADER.pack(len(encoded_name), code, len(items)))
+        packed.append(encoded_name)
+        packed.append(items.tobytes())
+    table = []
+    for string in strings:
+        encoded = string.encode("utf8")
+        table.append(STRING_LENGTH.pack(len(encoded)))
+        table.append(encoded)
+    header = HEADER.pack(MAGIC, VERSION, layout, len(strings), len(columns))
+    return b"".join([header] + table + packed)
+
+
+def _decode_strings(content: bytes, offset: int, count: int) -> Tuple[List[str], int]:
+    """
+    Decode the string table of ``count`` strings starting at ``offset`` of ``content``
+    :return: Strings, and the offset following the table
+    """
+    strings = []
+    for _ in range(count):
+        (length,) = STRING_LENGTH.unpack_from(content, offset)
+        offset += STRING_LENGTH.size
+        strings.append(content[offset : offset + length].decode("utf8"))
+        offset += length
+    return strings, offset
+
+
+def _decode_column(content: bytes, offset: int, strings: List[str]) -> Tuple[str, list, int]:
+    """
+    Decode the column starting at ``offset`` of ``content``
+    :param strings: String table, see ``_decode_strings()``
+    :return: Name and values of the column, and the offset following it
+    """
+    name_length, code, count = COLUMN_HEADER.unpack_from(content, offset)
+    offset += COLUMN_HEADER.size
+    name = content[offset : offset + name_length].decode("utf8")
+    offset += name_length
+    items = array(TYPES[code])
+    items.frombytes(content[offset : offset + count * items.itemsize])
+    offset += count * items.itemsize
+    if sys.byteorder == "big":
+        items.byteswap()
+    if code == b"s":
+        return name, [strings[index] for index in items], offset
+    if code == b"p":
+        return name, [-1 if value == -1 else value / PRICE_SCALE for value in items], offset
+    return name, items.tolist(), offset
+
+
+def decode(content: bytes) -> Tuple[int, Dict[str, list]]:
+    """
+    Decode the content encoded by ``encode()``
+    :return: Layout and values of each column, by name
+    """
+    magic, version, layout, string_count, column_count = HEADER.unpack_from(content)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Content is not in binary format of version {VERSION}")
+    strings, offset = _decode_strings(content, HEADER.size, string_count)
+    columns = {}
+    for _ in range(column_count):
+        name, values, offset = _decode_column(content, offset, strings)
+        columns[name] = values
+    return layout, columns
+
+
+def latest_columns(degraded: Dict[str, List]) -> List[Column]:
+    """Return the columns of sale points degraded by ``parse.degrade_to_latest()``"""
+    rows = degraded["data"]
+    columns: List[Column] = [
+        ("id", b"q", [int(station_id) for station_id in degraded["ids"]]),
+        ("latitude", b"d", [row[0] for row in rows]),
+        ("longitude", b"d", [row[1] for row in rows]),
+        ("address", b"s", [row[2] for row in rows]),
+        ("postcode", b"s", [row[3] for row in rows]),
+        ("city", b"s", [row[4] for row in rows]),
+    ]
+    for index, key in enumerate(LATEST_KEYS[5:]):
+        columns.append((key, b"p", [row[5 + index] for row in rows]))
+    return columns
+
+
+def table_columns(table: "SalePointTable") -> List[Column]:
+    """Return the columns of a ``table.SalePointTable``"""
+    return [
+        ("id", b"q", table.ids),
+        ("latitude", b"d", table.latitudes),
+        ("longitude", b"d", table.longitudes),
+        ("postcode", b"i", table.postcodes),
+        ("address", b"s", table.addresses),
+        ("city", b"s", table.cities),
+        ("price_station", b"i", table.price_stations),
+        ("price_fuel", b"b", table.price_fuels),
+        ("price_time", b"q", table.price_times),
+        ("price_value", b"p", table.price_values),
+    ]
+
+
+def save_as_binary(obj, output_file: str):
+    """
+    Save ``obj`` in ``output_file`` in the binary format.
+    :param obj: Either sale points degraded by ``parse.degrade_to_latest()``,
+        or an iterable of sale points, stored as a ``table.SalePointTable``
+        (i.e. without out of orders, closing times, services and opening days)
+    :param output_file: Path to the file to write in
+    """
+    LOGGER.debug("Saving a binary in %s", output_file)
+    if isinstance(obj, dict):
+        content = encode(LAYOUT_LATEST, latest_columns(obj))
+    else:
+        from .table import SalePointTable  # pylint: disable=import-outside-toplevel
+
+        content = encode(LAYOUT_TABLE, table_columns(SalePointTable.from_sale_points(obj)))
+    with open(output_file, "wb") as stream:
+        stream.write(content)
+
+
+def load_binary(input_file: str):
+    """
+    Load a file saved by ``save_as_binary()``
+    :return: Degraded sale points, like ``parse.degrade_to_latest()`` returns,
+        or a ``table.SalePointTable``, depending on what was saved
+    """
+    with open(input_file, "rb") as stream:
+        layout, columns = decode(stream.read())
+    if layout == LAYOUT_LATEST:
+        keys = ("latitude", "longitude", "address", "postcode", "city") + LATEST_KEYS[5:]
+        return {
+            "keys": LATEST_KEYS,
+            "data": [list(row) for row in zip(*(columns[key] for key in keys))],
+            "ids": [str(station_id) for station_id in columns["id"]],
+        }
+    from .table import SalePointTable  # pylint: disable=import-outside-toplevel
+
+    table = SalePointTable()
+    for name, _, values in table_columns(table):
+        values.extend(columns[name])
+    table.index_prices()
+    return table
+
+
+# Functions saving transformed data, by format name
+WRITERS: Dict[str, Callable[[object, str], None]] = {
+    "json": save_as_json,
+    "bin": save_as_binary,
+}
+
+
+def save(obj, output_file: str, output_format: str = "json"):
+    """
+    Save ``obj`` in ``output_file``
+    :param obj: Transformed data, degraded or not
+    :param output_file: Path to the file to write in
+    :param output_format: Name of the format to use, in ``WRITERS``
+    """
+    WRITERS[output_format](obj, output_file)
+
+
+def compress(path: str) -> List[str]:
+    """
+    Write pre-compressed variants of ``path`` next to it:
+    ``.gz`` with gzip, and ``.br`` with brotli if the ``brotli`` package is installed
+    :return: Paths to the variants written
+    """
+    with open(path, "rb") as stream:
+        content = stream.read()
+    variants = {path + ".gz": lambda data: gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants[path + ".br"] = brotli.compress
+    for variant, compressor in variants.items():
+        with open(variant, "wb") as stream:
+            stream.write(compressor(content))
+    LOGGER.debug("Compressed %s into %s", path, ", ".join(variants))
+    return list(variants)
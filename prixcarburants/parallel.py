@@ -0,0 +1,114 @@
+"""
+Parallel transformation of large XML files.
+
+The file is split into byte ranges on ``<pdv`` boundaries, each range (shard)
+being parsed by a separate process. Processes only send back compact results,
+degraded rows or JSON text, never the full sale points.
+"""
+
+import io
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+from . import backends, parse
+from .models import SalePoint
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+PDV_START = b"<pdv "
+ROOT_START = b"<pdv_liste>"
+ROOT_END = b"</pdv_liste>"
+
+
+def split_shards(filename: str, count: int) -> List[Tuple[int, int]]:
+    """
+    Split ``filename`` in at most ``count`` byte ranges of similar sizes,
+    each one starting on a ``<pdv`` element.
+    :param filename: Path to the XML file
+    :param count: Number of shards wanted
+    :return: List of ``(start, end)`` byte offsets, ``end`` being excluded
+    """
+    with open(filename, "rb") as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            start = content.find(PDV_START)
+            end = content.rfind(ROOT_END)
+            if start == -1 or end < start:
+                return []
+            boundaries = [start]
+            for index in range(1, count):
+                offset = start + (end - start) * index // count
+                position = content.find(PDV_START, max(offset, boundaries[-1] + 1), end)
+                if position == -1:
+                    break
+                boundaries.append(position)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _iter_shard(filename: str, start: int, end: int, parser: str) -> Iterator[SalePoint]:
+    """
+    Lazily build the sale points of the byte range ``[start, end)`` of ``filename``
+    with the XML ``parser``
+    """
+    with open(filename, "rb") as stream:
+        stream.seek(start)
+        content = stream.read(end - start)
+    yield from parse.iter_sale_points(io.BytesIO(ROOT_START + content + ROOT_END), parser=parser)
+
+
+def _degrade_shard(shard: Tuple[str, int, int, str]) -> Dict[str, List]:
+    """Worker degrading the sale points of a shard. See ``degrade_to_latest()``"""
+    return parse.degrade_to_latest(_iter_shard(*shard))
+
+
+def _encode_shard(shard: Tuple[str, int, int, str]) -> str:
+    """Worker encoding the sale points of a shard as JSON array items, without brackets"""
+    encoder = parse.ClassEncoder(ensure_ascii=False)
+    return ", ".join(encoder.encode(sale_point) for sale_point in _iter_shard(*shard))
+
+
+def degrade_to_latest(filename: str, jobs: int, parser: str = backends.DEFAULT) -> Dict[str, List]:
+    """
+    Parse ``filename`` with ``jobs`` processes and degrade its sale points.
+    Same result as ``parse.degrade_to_latest(parse.iter_sale_points(filename))``.
+    Metrics can then be built with ``parse.build_metrics()``, as rows are merged in order.
+    :param filename: Path to the XML file
+    :param jobs: Number of processes to use
+    :param parser: Name of the XML parser to use, see ``backends.PARSERS``
+    """
+    shards = [(filename, start, end, parser) for start, end in split_shards(filename, jobs)]
+    LOGGER.info("Degrading %s to latest in %s shards", filename, len(shards))
+    results = {"keys": parse.LATEST_KEYS, "data": [], "ids": []}
+    with ProcessPoolExecutor(jobs) as executor:
+        for degraded in executor.map(_degrade_shard, shards):
+            results["data"].extend(degraded["data"])
+            results["ids"].extend(degraded["ids"])
+    return results
+
+
+def save_as_json(filename: str, output_file: str, jobs: int, parser: str = backends.DEFAULT):
+    """
+    Parse ``filename`` with ``jobs`` processes and save its sale points in ``output_file``.
+    Same result as ``parse.save_as_json(parse.iter_sale_points(filename), output_file)``.
+    :param filename: Path to the XML file
+    :param output_file: Path to the JSON file to write in
+    :param jobs: Number of processes to use
+    :param parser: Name of the XML parser to use, see ``backends.PARSERS``
+    """
+    shards = [(filename, start, end, parser) for start, end in split_shards(filename, jobs)]
+    LOGGER.info("Saving %s as JSON in %s shards", filename, len(shards))
+    with ProcessPoolExecutor(jobs) as executor, open(output_file, "w", encoding="utf8") as stream:
+        stream.write("[")
+        first = True
+        for chunk in executor.map(_encode_shard, shards):
+            if len(chunk) == 0:
+                continue
+            if not first:
+                stream.write(", ")
+            stream.write(chunk)
+            first = False
+        stream.write("]")
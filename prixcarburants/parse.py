@@ -5,30 +5,57 @@ Parser of data from https://www.prix-carburants.gouv.fr/rubrique/opendata/
 import json
 import logging
 import os
-import xml.etree.ElementTree as ET
+from dataclasses import fields, is_dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List
+from typing import IO, Dict, Iterable, Iterator, List, Tuple, Union
 
+from . import backends
 from .models import FuelType, SalePoint
 
 LOGGER = logging.getLogger(os.path.basename(__file__))
 DEPARTMENTS = (
     [f"{dept:02}" for dept in range(1, 20)] + ["2A", "2B"] + [str(dept) for dept in range(21, 96)]
 )
+PRICE_SCALE = 1000  # Prices are given in euros with 3 decimals
+# Names of the fields of the sale points degraded by ``degrade_to_latest()``
+LATEST_KEYS = ("latitude", "longitude", "address", "postcode", "city") + tuple(
+    fuel_type.name for fuel_type in FuelType
+)
 
 
-def build_sale_points(filename: str) -> List[SalePoint]:
+def iter_sale_points(
+    source: Union[str, IO[bytes]], epoch: bool = False, parser: str = backends.DEFAULT
+) -> Iterator[SalePoint]:
+    """
+    Lazily build sale points from file, one ``<pdv>`` element at a time.
+    :param source: Name of the file to parse, or binary stream of its content,
+        such as the one opened by ``fetch.open_zip_member()``
+    :param epoch: Whether to keep dates as seconds since epoch rather than datetime objects
+    :param parser: Name of the XML parser to use, see ``backends.PARSERS``
+    :return: Iterator over the sale points parsed
+    """
+    iter_backend = backends.PARSERS[parser]
+    if isinstance(source, str):
+        LOGGER.info("Streaming sale points from %s with %s", source, parser)
+        with open(source, "rb") as stream:
+            yield from iter_backend(stream, epoch)
+    else:
+        LOGGER.info(
+            "Streaming sale points from %s with %s", getattr(source, "name", "stream"), parser
+        )
+        yield from iter_backend(source, epoch)
+
+
+def build_sale_points(filename: str, parser: str = backends.DEFAULT) -> List[SalePoint]:
     """
     Build sale points from file
     :param filename: Name of the file to parse
+    :param parser: Name of the XML parser to use, see ``backends.PARSERS``
     :return: Sale points parsed
     """
     LOGGER.info("Building sale points from %s", filename)
-    with open(filename, "r", encoding="windows-1252") as stream:
-        tree = ET.parse(stream, ET.XMLParser(encoding="windows-1252"))
-    root = tree.getroot()
-    return [SalePoint.build(element) for element in root]
+    return list(iter_sale_points(filename, parser=parser))
 
 
 def get_department_index(postcode: int) -> int:
@@ -43,27 +70,43 @@ def get_department_index(postcode: int) -> int:
     return int(postcode / 1000)  # After Corsica
 
 
-def build_metrics(sale_points: List[dict]) -> dict:
+def add_prices(counts: List[List[int]], totals: List[List[int]], sale_point: list, sign: int = 1):
     """
-    Extract metrics from latest data.
-    Given ``sale_points`` should have been extracted using ``degrade_to_latest()`` function.
-    :param sale_points: List of degraded sale points or
-        a dict containing this list under ``data`` attribute.
-    :return: Dictionary of metrics
+    Count and sum the prices of a degraded sale point in ``counts`` and ``totals``.
+    Prices are summed as integers, in ``1 / PRICE_SCALE`` euros, so that sums stay exact
+    when prices are later removed from them.
+    :param counts: Counts of prices, as ``[fuel_type -> [department -> value]]``
+    :param totals: Sums of prices, as ``[fuel_type -> [department -> value]]``
+    :param sale_point: Degraded sale point
+    :param sign: ``1`` to add the prices, ``-1`` to remove them
+    """
+    department = get_department_index(sale_point[3])  # [3] for postcode
+    for fuel_type, price in enumerate(sale_point[5:]):  # [5+] for prices
+        if price == -1:
+            continue
+        totals[fuel_type][department] += sign * round(price * PRICE_SCALE)
+        counts[fuel_type][department] += sign
+
+
+def sum_prices(sale_points: Iterable[list]) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Count and sum prices of degraded sale points, per fuel type and department.
+    :param sale_points: Iterable of degraded sale points
+    :return: ``counts`` and ``totals``, as ``[fuel_type -> [department -> value]]``.
+        See ``add_prices()``.
     """
-    if isinstance(sale_points, dict):
-        sale_points = sale_points["data"]
-    LOGGER.debug("Building metrics over %s sale points", len(sale_points))
-    # [fuel_type -> [department -> value]]
     counts = [[0] * len(DEPARTMENTS) for _ in range(len(FuelType))]
-    totals = [[-1] * len(DEPARTMENTS) for _ in range(len(FuelType))]
+    totals = [[0] * len(DEPARTMENTS) for _ in range(len(FuelType))]
     for sale_point in sale_points:
-        department = get_department_index(sale_point[3])  # [3] for postcode
-        for fuel_type, price in enumerate(sale_point[5:]):  # [5+] for prices
-            if price == -1:
-                continue
-            totals[fuel_type][department] += price
-            counts[fuel_type][department] += 1
+        add_prices(counts, totals, sale_point)
+    return counts, totals
+
+
+def metrics_from_sums(counts: List[List[int]], totals: List[List[int]]) -> dict:
+    """
+    Build metrics from prices counted and summed by ``sum_prices()``
+    :return: Dictionary of metrics, ``-1`` standing for missing averages
+    """
     averages = []
     averages_global = []
     for fuel_type in range(len(FuelType)):
@@ -73,11 +116,11 @@ def build_metrics(sale_points: List[dict]) -> dict:
             if number == 0:
                 fuel_type_averages.append(-1)
             else:
-                fuel_type_averages.append(totals[fuel_type][department] / number)
+                fuel_type_averages.append(totals[fuel_type][department] / number / PRICE_SCALE)
         averages.append(fuel_type_averages)
-        count = sum(counts[fuel_type][dept] for dept in range(len(DEPARTMENTS)))
-        total = sum(max(0, totals[fuel_type][dept]) for dept in range(len(DEPARTMENTS)))
-        averages_global.append(total / count)
+        count = sum(counts[fuel_type])
+        total = sum(totals[fuel_type])
+        averages_global.append(-1 if count == 0 else total / count / PRICE_SCALE)
     return {
         "averages_by_departments": averages,
         "averages_global": averages_global,
@@ -86,17 +129,36 @@ def build_metrics(sale_points: List[dict]) -> dict:
     }
 
 
-def degrade_to_latest(sale_points: List[SalePoint]) -> Dict[str, List]:
+def build_metrics(sale_points: Iterable[list]) -> dict:
+    """
+    Extract metrics from latest data.
+    Given ``sale_points`` should have been extracted using ``degrade_to_latest()`` function.
+    :param sale_points: Iterable of degraded sale points or
+        a dict containing this list under ``data`` attribute.
+    :return: Dictionary of metrics
     """
-    Degrade sales points to keep only meaningful latest data.
-    :param sale_points: List of sale points to degrade
+    if isinstance(sale_points, dict):
+        sale_points = sale_points["data"]
+    LOGGER.debug("Building metrics")
+    return metrics_from_sums(*sum_prices(sale_points))
+
+
+def degrade_to_latest(sale_points: Iterable[SalePoint]) -> Dict[str, List]:
+    """
+    Degrade sales points to keep only meaningful latest data:
+    the price of each fuel type is the one of the newest date.
+    :param sale_points: Iterable of sale points to degrade, such as ``iter_sale_points()``.
+        Consumed only once, so the full sale points never need to be held together.
     :return: List of degraded sale points.
         ``keys`` attribute provides names of the fields.
         ``data`` attributes contains a list of degraded sale points, as lists.
+        ``ids`` attribute contains the identifiers of the sale points, in the same order.
     """
-    LOGGER.debug("Degrading to latest %s points", len(sale_points))
+    LOGGER.debug("Degrading sale points to latest")
     results = []
+    ids = []
     for sale_point in sale_points:
+        ids.append(sale_point.id)
         degraded = [
             float(sale_point.location.latitude),
             float(sale_point.location.longitude),
@@ -107,37 +169,59 @@ def degrade_to_latest(sale_points: List[SalePoint]) -> Dict[str, List]:
         for fuel_type in FuelType:
             fuel_prices = sale_point.prices.get(fuel_type.value, [])
             if len(fuel_prices) > 0:
-                degraded.append(max(fuel_prices, key=lambda price: price[1])[1])  # Newer
+                degraded.append(max(fuel_prices, key=lambda price: price[0])[1])  # Newest
             else:
                 degraded.append(-1)
         results.append(degraded)
-    return {
-        "keys": ("latitude", "longitude", "address", "postcode", "city")
-        + tuple((fuel_type.name for fuel_type in FuelType)),
-        "data": results,
-    }
+    LOGGER.debug("Degraded %s sale points to latest", len(results))
+    return {"keys": LATEST_KEYS, "data": results, "ids": ids}
 
 
 class ClassEncoder(json.JSONEncoder):
     """Encoder that handles custom classes"""
 
     def default(self, o):
-        if isinstance(o, set):
-            return list(o)
+        if isinstance(o, set):  # Sorted, not in the order of the hash seed of the process
+            return sorted(o)
         if isinstance(o, datetime):
             return str(o)
         if isinstance(o, Enum):
             return o.value
+        if is_dataclass(o):
+            return {field.name: getattr(o, field.name) for field in fields(o)}
         return o.__dict__
 
 
 def save_as_json(obj, output_file: str):
     """
     Save ``obj`` in ``output_file`` as a json.
+    An iterator (e.g. from ``iter_sale_points()``) is written as a JSON array,
+    item after item, without being loaded in memory first.
     :param obj: Object to save
     :param output_file: Path to the file to write in.
         May create a file or override the existing file
     """
     LOGGER.debug("Saving a json in %s", output_file)
     with open(output_file, "w", encoding="utf8") as stream:
-        json.dump(obj, stream, cls=ClassEncoder, ensure_ascii=False)
+        if not isinstance(obj, Iterator):
+            json.dump(obj, stream, cls=ClassEncoder, ensure_ascii=False)
+            return
+        encoder = ClassEncoder(ensure_ascii=False)
+        stream.write("[")
+        for index, item in enumerate(obj):
+            if index > 0:
+                stream.write(", ")
+            for chunk in encoder.iterencode(item):
+                stream.write(chunk)
+        stream.write("]")
+
+
+def load_json(input_file: str):
+    """
+    Load a json saved by ``save_as_json()``
+    :param input_file: Path to the file to read
+    :return: Object loaded
+    """
+    LOGGER.debug("Loading a json from %s", input_file)
+    with open(input_file, "r", encoding="utf8") as stream:
+        return json.load(stream)
@@ -0,0 +1,149 @@
+"""
+Publish files to a branch of a GitHub repository.
+
+Every changed file is pushed in a single commit through the Git Data API:
+blobs are created concurrently, then a tree, a commit, and finally the branch reference is moved.
+Files whose git blob hash already matches the remote tree are skipped.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePath
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+API_URL = "https://api.github.com"
+REPOSITORY = "Doreapp/prix-carburants"
+BRANCH = "gh-pages"
+WORKERS = 8  # Number of blobs created concurrently
+TIMEOUT = 60
+FILE_MODE = "100644"
+
+
+def blob_sha(content: bytes) -> str:
+    """Return the hash git gives to a blob of ``content``"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def collect_files(directory: str, prefix: str = "assets") -> Dict[str, str]:
+    """
+    List the files under ``directory``, recursively
+    :param directory: Local directory, relative to the current directory
+    :param prefix: Remote directory the local paths are put in
+    :return: Local paths, by remote path
+    """
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            files[PurePath(prefix, path).as_posix()] = path
+    return files
+
+
+def changed_files(files: Dict[str, str], remote: Dict[str, str]) -> Dict[str, str]:
+    """
+    Select the ``files`` whose content is not already in ``remote``
+    :param files: Local paths, by remote path. See ``collect_files()``.
+    :param remote: Sha of the remote blobs, by path
+    :return: Local paths of the changed files, by remote path
+    """
+    changed = {}
+    for remote_path, path in files.items():
+        with open(path, "rb") as stream:
+            if remote.get(remote_path) != blob_sha(stream.read()):
+                changed[remote_path] = path
+    return changed
+
+
+class Publisher:
+    """Publish files to a branch, through the Git Data API of GitHub or a compatible server"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        token: str,
+        repository: str = REPOSITORY,
+        branch: str = BRANCH,
+        api_url: str = API_URL,
+        workers: int = WORKERS,
+    ):
+        """
+        :param token: Token authorized to push to ``repository``
+        :param repository: Repository, as ``owner/name``
+        :param branch: Branch to commit on
+        :param api_url: Base URL of the API, such as a local stub server
+        :param workers: Number of concurrent requests
+        """
+        self.branch = branch
+        self.base_url = f"{api_url.rstrip('/')}/repos/{repository}/git"
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            }
+        )
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        """Send a request to the Git Data API and return its JSON response"""
+        response = self.session.request(
+            method, f"{self.base_url}/{path}", json=body, timeout=TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def head(self) -> Tuple[str, str]:
+        """Return the sha of the last commit of the branch, and of its tree"""
+        commit = self._request("GET", f"ref/heads/{self.branch}")["object"]["sha"]
+        tree = self._request("GET", f"commits/{commit}")["tree"]["sha"]
+        return commit, tree
+
+    def remote_blobs(self, tree: str) -> Dict[str, str]:
+        """Return the sha of every blob of ``tree``, by path"""
+        response = self._request("GET", f"trees/{tree}?recursive=1")
+        if response.get("truncated", False):
+            LOGGER.warning("Remote tree is truncated, some unchanged files may be uploaded")
+        return {item["path"]: item["sha"] for item in response["tree"] if item["type"] == "blob"}
+
+    def create_blob(self, path: str) -> str:
+        """Upload the content of the local file at ``path``, and return the sha of its blob"""
+        with open(path, "rb") as stream:
+            content = base64.b64encode(stream.read()).decode("ascii")
+        return self._request("POST", "blobs", {"content": content, "encoding": "base64"})["sha"]
+
+    def publish(self, files: Dict[str, str], message: str = "Update data") -> Optional[str]:
+        """
+        Commit ``files`` on the branch, in a single commit
+        :param files: Local paths, by remote path. See ``collect_files()``.
+        :param message: Message of the commit
+        :return: Sha of the commit, or None if every file was already up to date
+        """
+        parent, base_tree = self.head()
+        changed = changed_files(files, self.remote_blobs(base_tree))
+        LOGGER.info("%s files changed over %s", len(changed), len(files))
+        if len(changed) == 0:
+            return None
+        with ThreadPoolExecutor(self.workers) as executor:
+            shas = list(executor.map(self.create_blob, changed.values()))
+        entries: List[dict] = [
+            {"path": remote_path, "mode": FILE_MODE, "type": "blob", "sha": sha}
+            for remote_path, sha in zip(changed, shas)
+        ]
+        tree = self._request("POST", "trees", {"base_tree": base_tree, "tree": entries})["sha"]
+        commit = self._request(
+            "POST", "commits", {"message": message, "tree": tree, "parents": [parent]}
+        )["sha"]
+        self._request("PATCH", f"refs/heads/{self.branch}", {"sha": commit})
+        LOGGER.info("Published %s files in commit %s", len(changed), commit)
+        return commit
@@ -0,0 +1,249 @@
+"""
+Registry of the stations seen across files and runs.
+
+Each station id is given a dense integer index, stable over updates: new stations are
+appended, known ones keep their index. The registry keeps the coordinates and address of
+every station, and is saved as a binary file with an open-addressing hash table of the ids,
+so that it can be memory-mapped and queried without being fully loaded.
+"""
+
+import logging
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .models import SalePoint
+from .sections import map_sections, write_sections
+from .spatial import COORDINATE_SCALE
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MAGIC = b"PCSR"
+VERSION = 1
+# magic, version, stations, slots of the hash table, size of the strings
+HEADER = struct.Struct("<4sHxxIIQ")
+# Columns saved after the header, with their type codes, each one aligned on 8 bytes
+SECTIONS = (
+    ("ids", "q"),
+    ("latitudes", "d"),
+    ("longitudes", "d"),
+    ("offsets", "Q"),
+    ("slots", "I"),
+    ("strings", "B"),
+)
+STRINGS_PER_STATION = 3  # Address, postcode and city
+EMPTY_SLOT = 0  # Slots hold the index of a station plus one
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+MASK = (1 << 64) - 1
+
+
+def _slot_count(size: int) -> int:
+    """Return the number of slots of the hash table of ``size`` stations, at most half full"""
+    slots = 8
+    while slots < 2 * size:
+        slots *= 2
+    return slots
+
+
+def _first_slot(station_id: int, slots: int) -> int:
+    """Return the first slot to probe for ``station_id``, ``slots`` being a power of two"""
+    return ((station_id * HASH_MULTIPLIER) & MASK) >> (64 - slots.bit_length() + 1)
+
+
+class StationRegistry:  # pylint: disable=too-many-instance-attributes
+    """
+    Dense index, coordinates and address of stations, by id.
+    Either loaded from a file, memory-mapped and read-only (see ``load()``),
+    or in memory and updatable (see ``open()``).
+    """
+
+    def __init__(self):
+        self.ids: Sequence[int] = array("q")
+        self.latitudes: Sequence[float] = array("d")
+        self.longitudes: Sequence[float] = array("d")
+        # Offsets of the strings of each station in ``strings``, when memory-mapped
+        self.offsets: Sequence[int] = array("Q", [0])
+        self.slots: Sequence[int] = array("I", [EMPTY_SLOT] * _slot_count(0))
+        self.strings: Sequence[int] = b""
+        # Address, postcode and city of each station, when in memory
+        self.addresses: Optional[List[List[str]]] = []
+        self._positions: Optional[Dict[int, int]] = {}
+        self._mapping: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index(self, station_id) -> Optional[int]:
+        """Return the index of the station ``station_id``, or None if it is unknown"""
+        station_id = int(station_id)
+        if self._positions is not None:
+            return self._positions.get(station_id)
+        mask = len(self.slots) - 1
+        slot = _first_slot(station_id, len(self.slots))
+        while self.slots[slot] != EMPTY_SLOT:
+            position = self.slots[slot] - 1
+            if self.ids[position] == station_id:
+                return position
+            slot = (slot + 1) & mask
+        return None
+
+    def address(self, index: int) -> List[str]:
+        """Return the address, postcode and city of the station at ``index``"""
+        if self.addresses is not None:
+            return self.addresses[index]
+        first = index * STRINGS_PER_STATION
+        return [
+            bytes(self.strings[self.offsets[i] : self.offsets[i + 1]]).decode("utf8")
+            for i in range(first, first + STRINGS_PER_STATION)
+        ]
+
+    def station(self, index: int) -> dict:
+        """Describe the station at ``index``"""
+        address, postcode, city = self.address(index)
+        return {
+            "index": index,
+            "id": str(self.ids[index]),
+            "latitude": self.latitudes[index],
+            "longitude": self.longitudes[index],
+            "address": address,
+            "postcode": postcode,
+            "city": city,
+        }
+
+    def add(  # pylint: disable=too-many-arguments
+        self,
+        station_id,
+        latitude: float,
+        longitude: float,
+        address: str,
+        postcode: str,
+        city: str,
+    ) -> int:
+        """
+        Register a station, or update the coordinates and address of a known one
+        :param latitude: Latitude, in degrees
+        :param longitude: Longitude, in degrees
+        :return: Index of the station
+        """
+        if self._positions is None:
+            raise ValueError("Registry is read-only, use StationRegistry.open() to update it")
+        station_id = int(station_id)
+        index = self._positions.get(station_id)
+        if index is None:
+            index = len(self.ids)
+            self._positions[station_id] = index
+            self.ids.append(station_id)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.addresses.append([address, postcode, city])
+        else:
+            self.latitudes[index] = latitude
+            self.longitudes[index] = longitude
+            self.addresses[index] = [address, postcode, city]
+        return index
+
+    def update(self, degraded: Dict[str, List]) -> List[int]:
+        """
+        Register the sale points degraded by ``parse.degrade_to_latest()``
+        :return: Index of each sale point
+        """
+        known = len(self)
+        indexes = [
+            self.add(
+                station_id,
+                row[0] / COORDINATE_SCALE,
+                row[1] / COORDINATE_SCALE,
+                row[2],
+                row[3],
+                row[4],
+            )
+            for station_id, row in zip(degraded["ids"], degraded["data"])
+        ]
+        LOGGER.info("%s new stations registered, %s in total", len(self) - known, len(self))
+        return indexes
+
+    def feed(self, sale_points: Iterable[SalePoint]) -> Iterator[SalePoint]:
+        """Register every sale point of ``sale_points`` while passing them through"""
+        for sale_point in sale_points:
+            self.add(
+                sale_point.id,
+                float(sale_point.location.latitude) / COORDINATE_SCALE,
+                float(sale_point.location.longitude) / COORDINATE_SCALE,
+                sale_point.address.address,
+                sale_point.address.postcode,
+                sale_point.address.city,
+            )
+            yield sale_point
+
+    def _pack_strings(self):
+        """Build the string section and the hash table of the stations in memory"""
+        offsets = array("Q", [0])
+        strings = bytearray()
+        for address in self.addresses:
+            for string in address:
+                strings.extend(string.encode("utf8"))
+                offsets.append(len(strings))
+        slots = array("I", [EMPTY_SLOT]) * _slot_count(len(self))
+        mask = len(slots) - 1
+        for position, station_id in enumerate(self.ids):
+            slot = _first_slot(station_id, len(slots))
+            while slots[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & mask
+            slots[slot] = position + 1
+        self.offsets, self.strings, self.slots = offsets, bytes(strings), slots
+
+    def save(self, path: str):
+        """Save the registry at ``path``, atomically, in a format readable by ``load()``"""
+        if self.addresses is not None:
+            self._pack_strings()
+        header = HEADER.pack(MAGIC, VERSION, len(self), len(self.slots), len(self.strings))
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as stream:
+            stream.write(header)
+            write_sections(stream, self, SECTIONS)
+        os.replace(temporary, path)
+        LOGGER.debug("Station registry saved at %s", path)
+
+    @staticmethod
+    def load(path: str) -> "StationRegistry":
+        """
+        Load the registry saved at ``path``, read-only.
+        The file is memory-mapped, and its columns are views on the mapping.
+        """
+        with open(path, "rb") as stream:
+            mapping = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, slots, strings = HEADER.unpack_from(mapping)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a station registry of version {VERSION}")
+        registry = StationRegistry()
+        registry.addresses = None
+        registry._positions = None  # pylint: disable=protected-access
+        registry._mapping = mapping  # pylint: disable=protected-access
+        lengths = {
+            "ids": size,
+            "latitudes": size,
+            "longitudes": size,
+            "offsets": size * STRINGS_PER_STATION + 1,
+            "slots": slots,
+            "strings": strings,
+        }
+        map_sections(memoryview(mapping), HEADER.size, registry, SECTIONS, lengths)
+        return registry
+
+    @staticmethod
+    def open(path: str) -> "StationRegistry":
+        """Load the registry saved at ``path`` in memory, to update it, or an empty one"""
+        registry = StationRegistry()
+        if not os.path.isfile(path):
+            LOGGER.info("No station registry at %s, starting from scratch", path)
+            return registry
+        mapped = StationRegistry.load(path)
+        registry.ids = array("q", mapped.ids)
+        registry.latitudes = array("d", mapped.latitudes)
+        registry.longitudes = array("d", mapped.longitudes)
+        registry.addresses = [mapped.address(index) for index in range(len(mapped))]
+        registry._positions = {  # pylint: disable=protected-access
+            station_id: index for index, station_id in enumerate(registry.ids)
+        }
+        return registry
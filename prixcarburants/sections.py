@@ -0,0 +1,38 @@
+"""
+Binary files made of a header followed by columns, or sections, each one aligned on 8 bytes.
+Used by the binary stores, which memory-map them and read their columns in place.
+"""
+
+from array import array
+from typing import BinaryIO, Dict, Sequence, Tuple
+
+# Name and ``array`` type code of each section of a file
+Sections = Sequence[Tuple[str, str]]
+
+
+def padding(size: int) -> int:
+    """Number of bytes to add after ``size`` bytes to align the next section on 8 bytes"""
+    return -size % 8
+
+
+def write_sections(stream: BinaryIO, obj, sections: Sections):
+    """Write the ``sections`` of ``obj``, i.e. its attributes of the same names, in ``stream``"""
+    for name, _ in sections:
+        content = bytes(getattr(obj, name))
+        stream.write(content)
+        stream.write(b"\0" * padding(len(content)))
+
+
+def map_sections(view: memoryview, offset: int, obj, sections: Sections, lengths: Dict[str, int]):
+    """
+    Set the ``sections`` of ``obj`` as views on ``view``
+    :param view: Content of the file, usually memory-mapped
+    :param offset: Offset of the first section, i.e. size of the header
+    :param obj: Object to set the sections of, as attributes
+    :param sections: Sections of the file
+    :param lengths: Number of items of each section
+    """
+    for name, typecode in sections:
+        end = offset + lengths[name] * array(typecode).itemsize
+        setattr(obj, name, view[offset:end].cast(typecode))
+        offset = end + padding(end - offset)
@@ -0,0 +1,261 @@
+"""
+Long-running server of the latest data.
+
+Keeps the latest snapshot, its metrics and its spatial index in memory, refreshes them
+on a schedule, and serves them over a small local HTTP API:
+- ``/latest``: sale points degraded to latest, like ``transform --latest``
+- ``/metrics``: metrics of the latest snapshot, like ``transform --metrics``
+- ``/nearest?latitude=&longitude=&fuel=[&radius=][&count=]``: cheapest sale points around a point
+- ``/status``: version and date of the snapshot served
+
+Refreshes are conditional requests, so an unchanged feed is neither downloaded nor parsed,
+and metrics are only updated with the sale points that changed.
+Responses carry an ``ETag``, and are cached until the next snapshot.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import distribution, fetch, parse
+from .metrics import MetricsStore
+from .models import FuelType
+from .spatial import SpatialIndex
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MAX_CACHED_RESPONSES = 1024
+MAX_REQUEST_SIZE = 8192
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """Error answered to a request, with its status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class State:
+    """Snapshot served, with its metrics, spatial index and cached responses"""
+
+    def __init__(self):
+        self.degraded: Optional[Dict[str, List]] = None
+        self.store = MetricsStore()
+        self.index: Optional[SpatialIndex] = None
+        self.distributions: dict = {}
+        self.version = 0
+        self.updated: Optional[datetime] = None
+        # Encoded body and ETag of the responses, by request target
+        self.responses: Dict[str, Tuple[bytes, str]] = {}
+
+    def update(self, degraded: Dict[str, List], index: SpatialIndex) -> int:
+        """
+        Serve a new snapshot
+        :param degraded: Sale points degraded by ``parse.degrade_to_latest()``
+        :param index: Spatial index of ``degraded``
+        :return: Number of sale points added, removed or changed since the previous snapshot
+        """
+        if self.degraded is None:
+            self.store.rebuild(degraded)
+            changes = len(degraded["data"])
+        else:
+            changes = self.store.apply(self.degraded, degraded)
+        self.degraded = degraded
+        self.distributions = distribution.build_distributions(degraded)
+        self.index = index
+        self.version += 1
+        self.updated = datetime.now()
+        self.responses.clear()
+        return changes
+
+    def nearest(self, query: Dict[str, List[str]]) -> List[dict]:
+        """Answer a ``/nearest`` query, like the ``query nearest`` command"""
+        try:
+            latitude = float(query["latitude"][0])
+            longitude = float(query["longitude"][0])
+            fuel_type = FuelType[query["fuel"][0].upper()]
+            radius = float(query.get("radius", ["10"])[0])
+            count = int(query.get("count", ["10"])[0])
+        except (KeyError, ValueError) as error:
+            raise HttpError(400, f"Invalid query: {error}") from error
+        results = []
+        for position, _, kilometers in self.index.nearest_cheapest(
+            latitude, longitude, fuel_type, radius, count
+        ):
+            station = self.index.station(position)
+            station["distance"] = round(kilometers, 3)
+            results.append(station)
+        return results
+
+    def content(self, path: str, query: Dict[str, List[str]]):
+        """Return the JSON-serializable content of the resource at ``path``"""
+        if path == "/status":
+            return {
+                "version": self.version,
+                "updated": None if self.updated is None else self.updated.isoformat(),
+                "sale_points": 0 if self.degraded is None else len(self.degraded["data"]),
+            }
+        if path not in ("/latest", "/metrics", "/nearest"):
+            raise HttpError(404, f"No resource at {path}")
+        if self.degraded is None:
+            raise HttpError(503, "No data loaded yet")
+        if path == "/latest":
+            return self.degraded
+        if path == "/metrics":
+            return {**self.store.metrics(), **self.distributions}
+        return self.nearest(query)
+
+    def respond(self, target: str) -> Tuple[bytes, str]:
+        """
+        Return the encoded body and the ETag of the response to ``target``, cached
+        :param target: Request target, i.e. path and query string
+        """
+        if target in self.responses:
+            return self.responses[target]
+        url = urlsplit(target)
+        content = self.content(url.path, parse_qs(url.query))
+        body = json.dumps(content, cls=parse.ClassEncoder).encode("utf8")
+        etag = f'"{self.version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        if len(self.responses) >= MAX_CACHED_RESPONSES:
+            self.responses.clear()
+        if url.path != "/status":
+            self.responses[target] = (body, etag)
+        return body, etag
+
+
+class Refresher:  # pylint: disable=too-few-public-methods
+    """Load new snapshots, either from the instantaneous feed or from a local file"""
+
+    def __init__(self, directory: str, source: Optional[str] = None):
+        """
+        :param directory: Directory to download the feed in, with its cache manifest
+        :param source: Local XML file to reload when it is modified, instead of downloading
+        """
+        self.source = source
+        self.modified: Optional[float] = None
+        self.fetcher = fetch.DataFechter(directory, os.path.join(directory, "fetch.json"))
+
+    def fetch(self) -> Optional[Tuple[Dict[str, List], SpatialIndex]]:
+        """
+        Load the snapshot if it changed since the previous call. Blocking.
+        :return: Sale points degraded to latest and their spatial index, or None if unchanged
+        """
+        if self.source is not None:
+            modified = os.path.getmtime(self.source)
+            if modified == self.modified:
+                return None
+            self.modified = modified
+            path = self.source
+        else:
+            path = self.fetcher.download_instantaneous_data()
+            if path is None:
+                return None
+        degraded = parse.degrade_to_latest(parse.iter_sale_points(path))
+        if self.source is None:
+            os.remove(path)
+            self.fetcher.save_manifest()
+        return degraded, SpatialIndex.build(degraded)
+
+
+async def refresh_periodically(state: State, refresher: Refresher, interval: float):
+    """Refresh ``state`` every ``interval`` seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            snapshot = await loop.run_in_executor(None, refresher.fetch)
+            if snapshot is None:
+                LOGGER.info("Data unchanged, version %s still served", state.version)
+            else:
+                changes = state.update(*snapshot)
+                LOGGER.info("Serving version %s, %s sale points changed", state.version, changes)
+        except Exception:  # pylint: disable=broad-except
+            # Any failure, such as a truncated archive or a malformed feed, must not stop serving
+            LOGGER.exception("Refresh failed, keeping version %s", state.version)
+        await asyncio.sleep(interval)
+
+
+def build_response(status: int, body: bytes = b"", etag: Optional[str] = None) -> bytes:
+    """Build an HTTP response"""
+    headers = [
+        f"HTTP/1.1 {status} {REASONS[status]}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Cache-Control: no-cache",
+        "Connection: close",
+    ]
+    if etag is not None:
+        headers.append(f"ETag: {etag}")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("ascii") + body
+
+
+def answer(state: State, request: bytes) -> bytes:
+    """Answer an HTTP ``request`` from the ``state``"""
+    lines = request.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ")
+    except ValueError:
+        return build_response(400, b'{"error": "Malformed request"}')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if method != "GET":
+        return build_response(405, b'{"error": "Only GET is allowed"}')
+    try:
+        body, etag = state.respond(target)
+    except HttpError as error:
+        return build_response(error.status, json.dumps({"error": str(error)}).encode("utf8"))
+    if headers.get("if-none-match") == etag:
+        return build_response(304, etag=etag)
+    return build_response(200, body, etag)
+
+
+async def handle(state: State, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Handle a connection: answer a single request then close it"""
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        if len(request) <= MAX_REQUEST_SIZE:
+            writer.write(answer(state, request))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, interval: float, source: Optional[str] = None):
+    """
+    Serve the latest data until cancelled
+    :param host: Address to listen on
+    :param port: Port to listen on
+    :param interval: Number of seconds between refreshes
+    :param source: Local XML file to serve instead of the instantaneous feed
+    """
+    state = State()
+    with tempfile.TemporaryDirectory() as directory:
+        refresher = Refresher(directory, source)
+        server = await asyncio.start_server(
+            lambda reader, writer: handle(state, reader, writer),
+            host,
+            port,
+            limit=MAX_REQUEST_SIZE,
+        )
+        LOGGER.info("Serving on http://%s:%s", host, port)
+        async with server:
+            await asyncio.gather(
+                server.serve_forever(), refresh_periodically(state, refresher, interval)
+            )
@@ -0,0 +1,174 @@
+"""
+Services of the sale points, such as ``Lavage automatique`` or ``Boutique alimentaire``,
+and index of the sale points by service, fuel type and department.
+
+The same few dozen service names are repeated by every sale point: the catalog gives each
+of them an identifier, in order of appearance, and the services of a sale point are
+a bitmask, bit ``n`` standing for the service of identifier ``n``.
+The export holds the names once, then the services, fuel types and department of each
+sale point as integers, so that filters are bitwise operations.
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from . import bitsets, parse
+from .builders import SalePointBuilder
+from .models import FuelType, SalePoint
+from .opening import fuel_mask
+from .parse import DEPARTMENTS, get_department_index
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+# Bits of the masks exactly represented by JSON numbers in JavaScript
+JAVASCRIPT_BITS = 53
+
+
+class ServiceCatalog:
+    """Identifiers of the service names, in order of appearance"""
+
+    def __init__(self, names: Iterable[str] = ()):
+        """
+        :param names: Names of the first services, in order of identifier
+        """
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in names:
+            self.identifier(name)
+
+    def identifier(self, name: str) -> int:
+        """Return the identifier of the service ``name``, given one if it is new"""
+        identifier = self.ids.get(name)
+        if identifier is None:
+            identifier = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return identifier
+
+    def mask(self, names: Optional[Iterable[str]]) -> int:
+        """
+        Return the bitmask of the services ``names``, ``0`` for None.
+        New names are given identifiers in alphabetical order, not in the order of ``names``,
+        such as the order of a set, so that identifiers do not depend on the hash seed.
+        """
+        mask = 0
+        for name in sorted(names or (), key=str):
+            mask |= 1 << self.identifier(name)
+        return mask
+
+    def names_of(self, mask: int) -> List[str]:
+        """Return the names of the services of ``mask``, in order of identifier"""
+        return [name for identifier, name in enumerate(self.names) if mask >> identifier & 1]
+
+
+class ServicesBuilder(SalePointBuilder):
+    """Collect the services, fuel types and departments of sale points, for ``export()``"""
+
+    def __init__(self):
+        self.catalog = ServiceCatalog()
+        self.ids: List[str] = []
+        self.services: List[int] = []
+        self.fuels: List[int] = []
+        self.departments: List[int] = []
+
+    def add(self, sale_point: SalePoint):
+        """Add the services of ``sale_point``"""
+        self.ids.append(sale_point.id)
+        self.services.append(self.catalog.mask(sale_point.services))
+        self.fuels.append(fuel_mask(sale_point))
+        self.departments.append(get_department_index(sale_point.address.postcode))
+
+    def export(self) -> dict:
+        """
+        Export the services as a JSON-serializable dictionary, see ``ServiceIndex``:
+        ``ids``, ``services``, ``fuels`` and ``departments`` of each sale point,
+        as bitmasks of the ``service_names``, of the ``fuel_types``
+        and indexes in ``department_names``
+        """
+        LOGGER.debug("%s services for %s sale points", len(self.catalog.names), len(self.ids))
+        if len(self.catalog.names) > JAVASCRIPT_BITS:
+            LOGGER.warning(
+                "%s services, the masks are not exact in JavaScript", len(self.catalog.names)
+            )
+        return {
+            "ids": self.ids,
+            "services": self.services,
+            "fuels": self.fuels,
+            "departments": self.departments,
+            "service_names": self.catalog.names,
+            "fuel_types": [fuel_type.name for fuel_type in FuelType],
+            "department_names": DEPARTMENTS,
+        }
+
+
+def _bitsets(masks: Iterable[int], count: int, size: int) -> List[int]:
+    """
+    Transpose the bitmasks of ``size`` sale points into one bitset of sale points per bit
+    :param count: Number of bits of the masks
+    """
+    built = [bitsets.empty(size) for _ in range(count)]
+    for position, mask in enumerate(masks):
+        while mask:
+            bit = mask.bit_length() - 1
+            bitsets.toggle(built[bit], position)
+            mask ^= 1 << bit
+    return [bitsets.to_int(bitset) for bitset in built]
+
+
+class ServiceIndex:
+    """
+    Sale points offering each service, selling each fuel type and in each department,
+    as bitsets (see ``bitsets``): a filter is the intersection of a few of them.
+    """
+
+    def __init__(self, services: dict):
+        """
+        :param services: Services exported by ``ServicesBuilder.export()``
+        """
+        self.ids: List[str] = services["ids"]
+        self.catalog = ServiceCatalog(services["service_names"])
+        size = len(self.ids)
+        self.services = _bitsets(services["services"], len(self.catalog.names), size)
+        self.fuels = _bitsets(services["fuels"], len(FuelType), size)
+        self.departments = _bitsets(
+            (1 << department for department in services["departments"]), len(DEPARTMENTS), size
+        )
+        LOGGER.debug("Service index of %s sale points", size)
+
+    @staticmethod
+    def load(path: str) -> "ServiceIndex":
+        """Load the services saved at ``path`` by ``transform --services``"""
+        return ServiceIndex(parse.load_json(path))
+
+    def select(
+        self,
+        services: Iterable[str] = (),
+        fuel_type: Optional[FuelType] = None,
+        department: Optional[str] = None,
+    ) -> int:
+        """
+        Return the bitset of the sale points matching every filter given
+        :param services: Names of the services offered. Unknown services match no sale point.
+        :param fuel_type: Fuel type sold
+        :param department: Department, such as ``"2A"`` or ``"75"``
+        """
+        selected = bitsets.full(len(self.ids))
+        for name in services:
+            identifier = self.catalog.ids.get(name)
+            if identifier is None:
+                return 0
+            selected &= self.services[identifier]
+        if fuel_type is not None:
+            selected &= self.fuels[fuel_type.value - 1]
+        if department is not None:
+            selected &= self.departments[DEPARTMENTS.index(department)]
+        return selected
+
+    def stations(
+        self,
+        services: Iterable[str] = (),
+        fuel_type: Optional[FuelType] = None,
+        department: Optional[str] = None,
+    ) -> List[str]:
+        """Return the ids of the sale points matching every filter given, see ``select()``"""
+        selected = self.select(services, fuel_type, department)
+        return [self.ids[position] for position in bitsets.positions(selected, len(self.ids))]
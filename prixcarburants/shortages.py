@@ -0,0 +1,185 @@
+"""
+Shortages of fuel and closures of the sale points.
+
+Out of orders (``rupture``) and closures (``fermeture``) are collected per kind of event,
+i.e. per fuel type or closure, and per department, as intervals of seconds since epoch,
+merged per sale point so that they never overlap for a single sale point.
+The interval index keeps the sorted starts and ends of each kind and department:
+the number of sale points affected at a time is the number of intervals started
+minus the number of intervals ended, i.e. two binary searches.
+"""
+
+import logging
+import os
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .builders import SalePointBuilder
+from .history import SECONDS_PER_DAY
+from .models import FuelType, SalePoint, as_epoch, from_epoch, merge_intervals
+from .parse import DEPARTMENTS, get_department_index
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+# Kinds of events: out of order of each fuel type, then closure
+KINDS = tuple(fuel_type.name for fuel_type in FuelType) + ("CLOSED",)
+CLOSED = len(KINDS) - 1
+# Columns of the metrics: departments, then the whole country
+COLUMNS = tuple(DEPARTMENTS) + ("FR",)
+NATIONAL = len(COLUMNS) - 1
+OPEN_END = 1 << 62  # End of the events without end
+
+
+class ShortageIndex:
+    """
+    Number of sale points out of each fuel type or closed, per department, at any time.
+    Built by ``ShortageBuilder.index()``.
+    """
+
+    def __init__(self, starts: List[List[array]], ends: List[List[array]], stations, latest):
+        """
+        :param starts: Sorted starts of the intervals, as ``[kind -> [column -> starts]]``
+        :param ends: Sorted ends of the intervals, as ``[kind -> [column -> ends]]``
+        :param stations: Number of sale points concerned, as ``[kind -> [column -> count]]``:
+            the ones selling the fuel type, or every one for closures
+        :param latest: Latest time of the data, in seconds since epoch, if known
+        """
+        self.starts = starts
+        self.ends = ends
+        self.stations = stations
+        self.latest: Optional[int] = latest
+
+    def affected(self, moment: int, kind: int, column: int = NATIONAL) -> int:
+        """
+        Return the number of sale points affected at ``moment``
+        :param moment: Time, in seconds since epoch
+        :param kind: Index of the kind of event in ``KINDS``
+        :param column: Index of the department in ``COLUMNS``. Default to the whole country.
+        """
+        return bisect_right(self.starts[kind][column], moment) - bisect_right(
+            self.ends[kind][column], moment
+        )
+
+    def shares(self, moment: int) -> List[List[float]]:
+        """
+        Return the share of sale points affected at ``moment``, ``-1`` standing for columns
+        without any sale point concerned
+        :return: Shares, as ``[kind -> [column -> share]]``
+        """
+        return [
+            [
+                -1 if total == 0 else self.affected(moment, kind, column) / total
+                for column, total in enumerate(self.stations[kind])
+            ]
+            for kind in range(len(KINDS))
+        ]
+
+    def timeline(self, first: int, last: int, step: int = SECONDS_PER_DAY) -> List[List[List[int]]]:
+        """
+        Return the number of sale points affected every ``step`` seconds
+        from ``first`` to ``last`` included, in seconds since epoch
+        :return: Counts, as ``[kind -> [column -> [count at each step]]]``
+        """
+        moments = range(first, last + 1, step)
+        return [
+            [
+                [self.affected(moment, kind, column) for moment in moments]
+                for column in range(len(COLUMNS))
+            ]
+            for kind in range(len(KINDS))
+        ]
+
+
+class ShortageBuilder(SalePointBuilder):
+    """
+    Collect the out of orders and closures of sale points, such as the ones of the year file.
+    Only their intervals are kept, not the sale points.
+    """
+
+    def __init__(self):
+        # [kind -> [department -> [(start, end)]]]
+        self.intervals: List[List[List[Tuple[int, int]]]] = [
+            [[] for _ in DEPARTMENTS] for _ in KINDS
+        ]
+        self.stations = [[0] * len(COLUMNS) for _ in KINDS]
+        self.latest: Optional[int] = None
+
+    def add(self, sale_point: SalePoint):
+        """Add the out of orders and closures of ``sale_point``"""
+        department = get_department_index(sale_point.address.postcode)
+        events: Dict[int, List[Tuple[int, int]]] = {}
+        for out_of_order in sale_point.out_of_orders:
+            events.setdefault(out_of_order.fuel_type.value - 1, []).append(
+                (
+                    as_epoch(out_of_order.start_time),
+                    OPEN_END if out_of_order.end_time is None else as_epoch(out_of_order.end_time),
+                )
+            )
+        for closing_time in sale_point.closing_times:
+            events.setdefault(CLOSED, []).append(
+                (
+                    as_epoch(closing_time.start_time),
+                    OPEN_END if closing_time.end_time is None else as_epoch(closing_time.end_time),
+                )
+            )
+        for kind, intervals in events.items():
+            # Events ending before they start are inconsistent, and ignored
+            valid = [(start, end) for start, end in intervals if start < end]
+            self.intervals[kind][department].extend(merge_intervals(valid))
+        for fuel_type in FuelType:
+            prices = sale_point.prices.get(fuel_type.value, [])
+            for time, _ in prices:
+                seconds = as_epoch(time)
+                self.latest = seconds if self.latest is None else max(self.latest, seconds)
+            if len(prices) > 0 or fuel_type.value - 1 in events:
+                self.stations[fuel_type.value - 1][department] += 1
+                self.stations[fuel_type.value - 1][NATIONAL] += 1
+        self.stations[CLOSED][department] += 1
+        self.stations[CLOSED][NATIONAL] += 1
+
+    def index(self) -> ShortageIndex:
+        """Build the interval index of the events collected"""
+        starts, ends = [], []
+        for by_department in self.intervals:
+            everywhere = [interval for intervals in by_department for interval in intervals]
+            columns = by_department + [everywhere]
+            starts.append([array("q", sorted(start for start, _ in column)) for column in columns])
+            ends.append([array("q", sorted(end for _, end in column)) for column in columns])
+        return ShortageIndex(starts, ends, self.stations, self.latest)
+
+
+def export(index: ShortageIndex, moment: Optional[int] = None, days: int = 30) -> dict:
+    """
+    Export the shortage metrics as a JSON-serializable dictionary
+    :param index: Interval index of the events
+    :param moment: Time of the metrics, in seconds since epoch.
+        Default to the latest time of the data.
+    :param days: Number of days of the timeline, ending at ``moment``
+    :return: Dictionary with the ``time`` of the metrics, the ``kinds`` of events,
+        the ``departments``, the number of ``stations`` concerned, the ``affected`` ones
+        and their ``shares`` at that time, as ``[kind -> [column -> value]]``,
+        and the ``timeline`` of the number of sale points affected each day,
+        as ``{days, affected: [kind -> [column -> [count at each day]]]}``
+    """
+    if moment is None:
+        moment = index.latest if index.latest is not None else 0
+    first = moment - (days - 1) * SECONDS_PER_DAY
+    LOGGER.debug("Exporting shortages at %s, over %s days", from_epoch(moment), days)
+    return {
+        "time": from_epoch(moment).isoformat(),
+        "kinds": KINDS,
+        "departments": COLUMNS,
+        "stations": index.stations,
+        "affected": [
+            [index.affected(moment, kind, column) for column in range(len(COLUMNS))]
+            for kind in range(len(KINDS))
+        ],
+        "shares": [[round(share, 4) for share in shares] for shares in index.shares(moment)],
+        "timeline": {
+            "days": [
+                (from_epoch(first) + timedelta(days=day)).date().isoformat() for day in range(days)
+            ],
+            "affected": index.timeline(first, moment),
+        },
+    }
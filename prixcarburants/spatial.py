@@ -0,0 +1,247 @@
+"""
+Spatial index over sale points.
+
+Sale points are bucketed in a regular grid of latitude and longitude cells,
+stored cell after cell so that each cell is a contiguous range of sale points.
+The index is saved as a binary file and memory-mapped when loaded,
+so that queries only read the cells they need.
+"""
+
+import heapq
+import logging
+import math
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .models import FuelType
+from .sections import map_sections, write_sections
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MAGIC = b"PCSI"
+VERSION = 1
+# magic, version, fuel types, sale points, cell size, south, west, rows, columns
+HEADER = struct.Struct("<4sHHIdddII4x")
+COORDINATE_SCALE = 100000  # Coordinates are given in degrees multiplied by this scale
+# Columns saved after the header, with their type codes, each one aligned on 8 bytes
+SECTIONS = (
+    ("cells", "I"),
+    ("latitudes", "d"),
+    ("longitudes", "d"),
+    ("ids", "q"),
+    ("rows", "I"),
+    ("prices", "f"),
+)
+EARTH_RADIUS = 6371.0  # In kilometers
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def distance(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Return the great-circle distance, in kilometers, between two points given in degrees"""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(longitude2 - longitude1) / 2
+    chord = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(chord)))
+
+
+class SpatialIndex:  # pylint: disable=too-many-instance-attributes
+    """
+    Grid index over sale points, answering bounding box and nearest cheapest queries.
+    Sale points are referred to by their position in the index.
+    ``rows`` gives, for each position, the index of the sale point in the indexed snapshot.
+    """
+
+    def __init__(self, cell_size: float, south: float, west: float, shape: Tuple[int, int]):
+        """
+        :param cell_size: Size of the cells, in degrees
+        :param south: Latitude of the southern edge of the grid
+        :param west: Longitude of the western edge of the grid
+        :param shape: Number of rows (latitudes) and columns (longitudes) of the grid
+        """
+        self.cell_size = cell_size
+        self.south = south
+        self.west = west
+        self.shape = shape
+        self.cells: Sequence[int] = array("I", [0] * (shape[0] * shape[1] + 1))
+        self.latitudes: Sequence[float] = array("d")
+        self.longitudes: Sequence[float] = array("d")
+        self.ids: Sequence[int] = array("q")
+        self.rows: Sequence[int] = array("I")
+        self.prices: Sequence[float] = array("f")
+        self._mapping: Optional[mmap.mmap] = None
+
+    @staticmethod
+    def build(degraded: Dict[str, List], cell_size: float = 0.1) -> "SpatialIndex":
+        """
+        Build the index of sale points degraded by ``parse.degrade_to_latest()``
+        :param degraded: Degraded sale points, with their ``ids``
+        :param cell_size: Size of the cells of the grid, in degrees
+        """
+        points = [
+            (row[0] / COORDINATE_SCALE, row[1] / COORDINATE_SCALE, index)
+            for index, row in enumerate(degraded["data"])
+        ]
+        if len(points) == 0:
+            return SpatialIndex(cell_size, 0.0, 0.0, (1, 1))
+        south = math.floor(min(point[0] for point in points) / cell_size) * cell_size
+        west = math.floor(min(point[1] for point in points) / cell_size) * cell_size
+        shape = (
+            int((max(point[0] for point in points) - south) / cell_size) + 1,
+            int((max(point[1] for point in points) - west) / cell_size) + 1,
+        )
+        index = SpatialIndex(cell_size, south, west, shape)
+        points.sort(key=lambda point: index.cell(point[0], point[1]))
+        counts = [0] * (shape[0] * shape[1])
+        for latitude, longitude, row in points:
+            counts[index.cell(latitude, longitude)] += 1
+            index.latitudes.append(latitude)
+            index.longitudes.append(longitude)
+            index.ids.append(int(degraded["ids"][row]))
+            index.rows.append(row)
+            index.prices.extend(float(price) for price in degraded["data"][row][5:])
+        for cell, count in enumerate(counts):
+            index.cells[cell + 1] = index.cells[cell] + count
+        LOGGER.debug("Built spatial index of %s sale points in %s cells", len(points), shape)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def cell(self, latitude: float, longitude: float) -> int:
+        """Return the cell containing a point, clamped to the grid"""
+        row = min(max(int((latitude - self.south) / self.cell_size), 0), self.shape[0] - 1)
+        column = min(max(int((longitude - self.west) / self.cell_size), 0), self.shape[1] - 1)
+        return row * self.shape[1] + column
+
+    def _candidates(self, south: float, west: float, north: float, east: float):
+        """Iterate over the positions of the sale points in cells overlapping a bounding box"""
+        first_row, first_column = divmod(self.cell(south, west), self.shape[1])
+        last_row, last_column = divmod(self.cell(north, east), self.shape[1])
+        for row in range(first_row, last_row + 1):
+            start = self.cells[row * self.shape[1] + first_column]
+            end = self.cells[row * self.shape[1] + last_column + 1]
+            yield from range(start, end)
+
+    def within_bbox(self, south: float, west: float, north: float, east: float) -> List[int]:
+        """Return the positions of the sale points inside a bounding box, in degrees"""
+        return [
+            position
+            for position in self._candidates(south, west, north, east)
+            if south <= self.latitudes[position] <= north
+            and west <= self.longitudes[position] <= east
+        ]
+
+    # pylint: disable=too-many-arguments
+    def nearest_cheapest(
+        self,
+        latitude: float,
+        longitude: float,
+        fuel_type: FuelType,
+        radius: float,
+        count: int = 10,
+    ) -> List[Tuple[int, float, float]]:
+        """
+        Find the cheapest sale points selling a fuel type around a point
+        :param latitude: Latitude of the point, in degrees
+        :param longitude: Longitude of the point, in degrees
+        :param fuel_type: Fuel type to find the price of
+        :param radius: Maximal distance to the point, in kilometers
+        :param count: Maximal number of sale points returned
+        :return: ``(position, price, distance)`` of the sale points,
+            cheapest first then nearest first
+        """
+        delta_latitude = radius / KM_PER_DEGREE
+        delta_longitude = radius / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        width = len(FuelType)
+        offset = fuel_type.value - 1
+        found = []
+        for position in self._candidates(
+            latitude - delta_latitude,
+            longitude - delta_longitude,
+            latitude + delta_latitude,
+            longitude + delta_longitude,
+        ):
+            price = self.prices[position * width + offset]
+            if price < 0:
+                continue
+            kilometers = distance(
+                latitude, longitude, self.latitudes[position], self.longitudes[position]
+            )
+            if kilometers <= radius:
+                found.append((position, price, kilometers))
+        return heapq.nsmallest(count, found, key=lambda item: (item[1], item[2]))
+
+    def station(self, position: int) -> dict:
+        """Describe the sale point at ``position``"""
+        width = len(FuelType)
+        prices = self.prices[position * width : (position + 1) * width]
+        return {
+            "id": str(self.ids[position]),
+            "row": self.rows[position],
+            "latitude": self.latitudes[position],
+            "longitude": self.longitudes[position],
+            "prices": {
+                fuel_type.name: round(price, 3)
+                for fuel_type, price in zip(FuelType, prices)
+                if price >= 0
+            },
+        }
+
+    def _lengths(self, size: int) -> Dict[str, int]:
+        """Return the number of items of each column, for ``size`` sale points"""
+        return {
+            "cells": self.shape[0] * self.shape[1] + 1,
+            "latitudes": size,
+            "longitudes": size,
+            "ids": size,
+            "rows": size,
+            "prices": size * len(FuelType),
+        }
+
+    def save(self, path: str):
+        """Save the index at ``path``, in a format readable by ``load()``"""
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(FuelType),
+            len(self),
+            self.cell_size,
+            self.south,
+            self.west,
+            self.shape[0],
+            self.shape[1],
+        )
+        with open(path, "wb") as stream:
+            stream.write(header)
+            write_sections(stream, self, SECTIONS)
+        LOGGER.debug("Spatial index saved at %s", path)
+
+    @staticmethod
+    def load(path: str) -> "SpatialIndex":
+        """
+        Load the index saved at ``path``.
+        The file is memory-mapped, and its columns are views on the mapping.
+        """
+        with open(path, "rb") as stream:
+            mapping = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            fuel_types,
+            size,
+            cell_size,
+            south,
+            west,
+            rows,
+            columns,
+        ) = HEADER.unpack_from(mapping)
+        if magic != MAGIC or version != VERSION or fuel_types != len(FuelType):
+            raise ValueError(f"{path} is not a spatial index of version {VERSION}")
+        index = SpatialIndex(cell_size, south, west, (rows, columns))
+        index._mapping = mapping  # pylint: disable=protected-access
+        lengths = index._lengths(size)  # pylint: disable=protected-access
+        map_sections(memoryview(mapping), HEADER.size, index, SECTIONS, lengths)
+        return index
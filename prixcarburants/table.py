@@ -0,0 +1,252 @@
+"""
+Columnar storage of sale points.
+Keeps every field in typed arrays rather than in millions of small Python objects.
+"""
+
+import logging
+import os
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .models import Address, FuelType, Location, SalePoint, as_epoch, from_epoch
+from .parse import DEPARTMENTS, LATEST_KEYS, PRICE_SCALE, get_department_index, metrics_from_sums
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+FUEL_TYPES = tuple(FuelType)
+NEVER = -(1 << 63)  # Time before every price
+
+try:
+    import numpy
+except ImportError:  # Optional dependency
+    numpy = None
+
+
+class SalePointTable:  # pylint: disable=too-many-instance-attributes
+    """
+    Compact store of sale points, as parallel columns.
+
+    Stations are identified by their index in the table.
+    Prices are stored as four parallel columns, one entry per price change:
+    ``(price_stations, price_fuels, price_times, price_values)``,
+    with fuel indexes in ``FUEL_TYPES`` and times in seconds since epoch.
+    Prices are sorted by station, those of station ``s`` starting at ``price_starts[s]``.
+
+    Out of orders, closing times, services and opening days are not stored.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.postcodes = array("i")
+        self.addresses: List[str] = []
+        self.cities: List[str] = []
+        self.price_starts = array("Q")
+        self.price_stations = array("I")
+        self.price_fuels = array("B")
+        self.price_times = array("q")
+        self.price_values = array("d")
+
+    @staticmethod
+    def from_sale_points(sale_points: Iterable[SalePoint]) -> "SalePointTable":
+        """
+        Build a table from ``sale_points``, consumed once.
+        Accepts an iterator such as ``parse.iter_sale_points()``,
+        preferably built with ``epoch=True`` to skip datetime objects.
+        """
+        table = SalePointTable()
+        for sale_point in sale_points:
+            table.append(sale_point)
+        LOGGER.debug("Built table of %s sale points, %s prices", len(table), table.price_count)
+        return table
+
+    def append(self, sale_point: SalePoint) -> int:
+        """
+        Add ``sale_point`` at the end of the table
+        :return: Index of the sale point in the table
+        """
+        index = len(self.ids)
+        self.ids.append(int(sale_point.id))
+        self.latitudes.append(float(sale_point.location.latitude))
+        self.longitudes.append(float(sale_point.location.longitude))
+        self.postcodes.append(int(sale_point.address.postcode))
+        self.addresses.append(sale_point.address.address)
+        self.cities.append(sale_point.address.city)
+        self.price_starts.append(len(self.price_values))
+        for fuel_index, fuel_type in enumerate(FUEL_TYPES):
+            for date, price in sale_point.prices.get(fuel_type.value, []):
+                self.price_stations.append(index)
+                self.price_fuels.append(fuel_index)
+                self.price_times.append(as_epoch(date))
+                self.price_values.append(price)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def price_count(self) -> int:
+        """Number of price entries in the table"""
+        return len(self.price_values)
+
+    def index_prices(self):
+        """
+        Sort the prices by station, keeping their order within a station, and compute
+        ``price_starts``. Needed once the columns are filled other than by ``append()``.
+        """
+        stations = self.price_stations
+        if any(stations[position - 1] > stations[position] for position in range(1, len(stations))):
+            order = sorted(range(len(stations)), key=stations.__getitem__)
+            for column in (
+                self.price_stations,
+                self.price_fuels,
+                self.price_times,
+                self.price_values,
+            ):
+                column[:] = array(column.typecode, [column[position] for position in order])
+        counts = [0] * len(self)
+        for station in self.price_stations:
+            counts[station] += 1
+        self.price_starts = array("Q")
+        start = 0
+        for count in counts:
+            self.price_starts.append(start)
+            start += count
+
+    def prices_of(self, index: int) -> range:
+        """Positions, in the price columns, of the prices of the sale point at ``index``"""
+        end = self.price_starts[index + 1] if index + 1 < len(self) else self.price_count
+        return range(self.price_starts[index], end)
+
+    def __getitem__(self, index: int) -> SalePoint:
+        """
+        Build an object view of the sale point at ``index``, reading only its prices.
+        Services, opening days, out of orders and closing times are not stored, so are empty.
+        """
+        prices: Dict[int, list] = {key.value: [] for key in FuelType}
+        for position in self.prices_of(index):
+            fuel_type = FUEL_TYPES[self.price_fuels[position]]
+            prices[fuel_type.value].append(
+                (from_epoch(self.price_times[position]), self.price_values[position])
+            )
+        return SalePoint(
+            id=str(self.ids[index]),
+            location=Location(self.latitudes[index], self.longitudes[index]),
+            address=Address(self.postcode(index), self.addresses[index], self.cities[index]),
+            prices=prices,
+            out_of_orders=[],
+            closing_times=[],
+        )
+
+    def postcode(self, index: int) -> str:
+        """Postcode of the sale point at ``index``, as written in the feed"""
+        return f"{self.postcodes[index]:05}"
+
+    def latest_prices(self, vectorized: Optional[bool] = None) -> array:
+        """
+        Select the newest price per sale point and fuel type, in a single pass over the prices.
+        Same selection as ``parse.degrade_to_latest()``, the first one of the newest date.
+        :param vectorized: Whether to select with NumPy. Default to whether NumPy is installed.
+        :return: Flat array of prices, ``-1`` when missing.
+            Price of fuel ``f`` at sale point ``s`` is at ``s * len(FUEL_TYPES) + f``.
+        """
+        if vectorized is None:
+            vectorized = numpy is not None
+        if vectorized and numpy is None:
+            raise ImportError("NumPy is required to select the latest prices vectorized")
+        if vectorized:
+            return self._latest_prices_numpy()
+        width = len(FUEL_TYPES)
+        latest = array("d", [-1.0]) * (len(self) * width)
+        times = array("q", [NEVER]) * (len(self) * width)
+        for station, fuel, time, value in zip(
+            self.price_stations, self.price_fuels, self.price_times, self.price_values
+        ):
+            position = station * width + fuel
+            if time > times[position]:
+                times[position] = time
+                latest[position] = value
+        return latest
+
+    def _latest_prices_numpy(self) -> array:
+        """
+        Select the latest prices with vectorized NumPy passes over the columns, read in place:
+        prices are sorted by sale point and fuel type, then newest first,
+        so that the latest price is the first of each group. See ``latest_prices()``.
+        """
+        width = len(FUEL_TYPES)
+        columns = [
+            numpy.frombuffer(column, dtype=column.typecode)
+            for column in (self.price_stations, self.price_fuels, self.price_times)
+        ]
+        positions = columns[0].astype(numpy.int64) * width + columns[1]
+        order = numpy.lexsort((-columns[2], positions))  # Stable: first of the newest date
+        positions = positions[order]
+        first = numpy.ones(len(positions), dtype=bool)
+        first[1:] = positions[1:] != positions[:-1]
+        latest = numpy.full(len(self) * width, -1.0)
+        latest[positions[first]] = numpy.frombuffer(self.price_values, dtype="d")[order][first]
+        return array("d", latest.tobytes())
+
+    def metrics(self, vectorized: Optional[bool] = None) -> dict:
+        """
+        Build the metrics of the latest prices from the columns,
+        same as ``parse.build_metrics()`` on ``degrade_to_latest()``
+        :param vectorized: Whether to compute with NumPy. Default to whether NumPy is installed.
+        """
+        if vectorized is None:
+            vectorized = numpy is not None
+        latest = self.latest_prices(vectorized)
+        departments = [get_department_index(postcode) for postcode in self.postcodes]
+        if vectorized:
+            return metrics_from_sums(*_sum_prices_numpy(latest, departments))
+        counts = [[0] * len(DEPARTMENTS) for _ in FUEL_TYPES]
+        totals = [[0] * len(DEPARTMENTS) for _ in FUEL_TYPES]
+        for position, price in enumerate(latest):
+            if price != -1:
+                station, fuel = divmod(position, len(FUEL_TYPES))
+                counts[fuel][departments[station]] += 1
+                totals[fuel][departments[station]] += round(price * PRICE_SCALE)
+        return metrics_from_sums(counts, totals)
+
+    def degrade_to_latest(self) -> Dict[str, List]:
+        """
+        Degrade the table to keep only meaningful latest data.
+        :return: Same structure as ``parse.degrade_to_latest()``
+        """
+        width = len(FUEL_TYPES)
+        latest = self.latest_prices()
+        results = []
+        for index in range(len(self)):
+            degraded = [
+                self.latitudes[index],
+                self.longitudes[index],
+                self.addresses[index],
+                self.postcode(index),
+                self.cities[index],
+            ]
+            for price in latest[index * width : (index + 1) * width]:
+                degraded.append(-1 if price == -1 else price)
+            results.append(degraded)
+        return {"keys": LATEST_KEYS, "data": results, "ids": [str(id) for id in self.ids]}
+
+
+def _sum_prices_numpy(
+    latest: array, departments: List[int]
+) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Count and sum the ``latest`` prices per fuel type and department, with NumPy,
+    like ``parse.sum_prices()``
+    :param latest: Latest prices, as returned by ``SalePointTable.latest_prices()``
+    :param departments: Department index of each sale point
+    """
+    prices = numpy.frombuffer(latest, dtype="d").reshape(len(departments), len(FUEL_TYPES))
+    groups = numpy.array(departments, dtype=numpy.int64)
+    counts, totals = [], []
+    for fuel in range(len(FUEL_TYPES)):
+        present = prices[:, fuel] != -1
+        scaled = numpy.rint(prices[present, fuel] * PRICE_SCALE)
+        counts.append(numpy.bincount(groups[present], minlength=len(DEPARTMENTS)).tolist())
+        sums = numpy.bincount(groups[present], scaled, minlength=len(DEPARTMENTS))
+        totals.append(sums.astype(numpy.int64).tolist())
+    return counts, totals
@@ -0,0 +1,64 @@
+"""
+Tiled output of the latest data.
+
+Degraded sale points are split into one tile per department, described by a small manifest,
+so that the website only fetches the tiles of the visible area.
+"""
+
+import logging
+import os
+from typing import Dict, List
+
+from .parse import DEPARTMENTS, get_department_index, save_as_json
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+MANIFEST = "manifest.json"
+
+
+def build_tiles(degraded: Dict[str, List]) -> Dict[str, Dict[str, List]]:
+    """
+    Split sale points degraded by ``parse.degrade_to_latest()`` by department
+    :param degraded: Degraded sale points
+    :return: Tiles by department code, each one having ``keys`` and ``data`` attributes
+        like ``degraded``
+    """
+    tiles: Dict[str, Dict[str, List]] = {}
+    for row in degraded["data"]:
+        code = DEPARTMENTS[get_department_index(row[3])]  # [3] for postcode
+        tiles.setdefault(code, {"keys": degraded["keys"], "data": []})["data"].append(row)
+    return tiles
+
+
+def bounds(rows: List[list]) -> List[float]:
+    """Return the bounding box of ``rows``, as ``[south, west, north, east]`` scaled coordinates"""
+    latitudes = [row[0] for row in rows]
+    longitudes = [row[1] for row in rows]
+    return [min(latitudes), min(longitudes), max(latitudes), max(longitudes)]
+
+
+def save_tiles(degraded: Dict[str, List], directory: str) -> str:
+    """
+    Save the tiles of ``degraded`` sale points in ``directory``, with their manifest.
+    The manifest lists, for each tile, its ``file``, its number of sale points (``count``)
+    and its ``bounds``, as ``[south, west, north, east]`` in the scale of the rows.
+    :param degraded: Sale points degraded by ``parse.degrade_to_latest()``
+    :param directory: Directory to save the tiles in. Created if needed.
+    :return: Path to the manifest
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"keys": degraded["keys"], "tiles": []}
+    for code, tile in sorted(build_tiles(degraded).items()):
+        filename = f"{code}.json"
+        save_as_json(tile, os.path.join(directory, filename))
+        manifest["tiles"].append(
+            {
+                "name": code,
+                "file": filename,
+                "count": len(tile["data"]),
+                "bounds": bounds(tile["data"]),
+            }
+        )
+    path = os.path.join(directory, MANIFEST)
+    save_as_json(manifest, path)
+    LOGGER.info("Saved %s tiles in %s", len(manifest["tiles"]), directory)
+    return path
@@ -0,0 +1,252 @@
+"""
+Transformation of the XML data, the ``transform`` command, with every output built on the way
+
+Modules of the outputs are only imported when their option is given, so that a plain
+transform does not pay for the imports of the others, such as NumPy.
+"""
+# pylint: disable=import-outside-toplevel
+
+import argparse
+import importlib
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional
+
+from . import instrument, output, parse
+from .models import SalePoint
+
+if TYPE_CHECKING:  # Only imported when a registry is given
+    from .registry import StationRegistry
+
+LOGGER = logging.getLogger(os.path.basename(__file__))
+# Builders collecting data from the sale points, as module and class, by name of their option
+BUILDERS = {
+    "history": ("history", "HistoryBuilder"),
+    "opening_hours": ("opening", "OpeningHoursBuilder"),
+    "shortages": ("shortages", "ShortageBuilder"),
+    "services": ("services", "ServicesBuilder"),
+    "anomalies": ("events", "EventSorter"),
+}
+
+
+def load_previous(arguments: argparse.Namespace) -> Optional[dict]:
+    """Load the previous snapshot given to the ``transform`` command, if any"""
+    if arguments.latest and arguments.previous is not None and os.path.isfile(arguments.previous):
+        return parse.load_json(arguments.previous)
+    return None
+
+
+def save_metrics(
+    arguments: argparse.Namespace, sale_points, directory: str, previous: Optional[dict] = None
+):
+    """
+    Build metrics of the transformed ``sale_points`` and save them in ``directory``
+    :param arguments: Parsed command line arguments of the ``transform`` command
+    :param sale_points: Sale points transformed
+    :param directory: Directory to save ``metrics.json`` in
+    :param previous: Previous snapshot, see ``load_previous()``
+    """
+    from . import distribution
+    from .metrics import update_metrics
+
+    with instrument.stage("metrics"):
+        if arguments.metrics_state is not None and arguments.latest:
+            metrics = update_metrics(arguments.metrics_state, sale_points, previous)
+        else:
+            metrics = parse.build_metrics(sale_points)
+        metrics.update(distribution.build_distributions(sale_points))
+        path = os.path.join(directory, "metrics.json")
+        parse.save_as_json(metrics, path)
+    instrument.count_file(path)
+
+
+def save_latest_outputs(
+    arguments: argparse.Namespace, degraded: dict, previous: Optional[dict] = None
+):
+    """
+    Save the outputs of the ``transform`` command only built from the latest data:
+    spatial index, tiles and diff
+    :param arguments: Parsed command line arguments of the ``transform`` command
+    :param degraded: Sale points degraded to latest
+    :param previous: Previous snapshot, see ``load_previous()``
+    """
+    if arguments.spatial_index is not None:
+        from . import spatial
+
+        with instrument.stage("spatial_index"):
+            spatial.SpatialIndex.build(degraded).save(arguments.spatial_index)
+        instrument.count_file(arguments.spatial_index)
+    if arguments.tiles is not None:
+        from . import tiles
+
+        with instrument.stage("tiles"):
+            tiles.save_tiles(degraded, arguments.tiles)
+        instrument.count_file(arguments.tiles)
+    if arguments.diff is not None:
+        if previous is None or "ids" not in previous:
+            LOGGER.warning("No previous snapshot with ids to compute a diff from")
+            return
+        from . import diff
+
+        with instrument.stage("diff"):
+            parse.save_as_json(diff.diff(previous, degraded), arguments.diff)
+        instrument.count_file(arguments.diff)
+
+
+def register(arguments: argparse.Namespace, sale_points):
+    """
+    Open the station registry of the ``transform`` command and register ``sale_points`` in it
+    :param arguments: Parsed command line arguments of the ``transform`` command
+    :param sale_points: Sale points transformed
+    :return: Registry and sale points, to use in place of ``sale_points``
+    """
+    from .registry import StationRegistry
+
+    registry = StationRegistry.open(arguments.registry)
+    if arguments.latest:
+        with instrument.stage("registry"):
+            sale_points["stations"] = registry.update(sale_points)
+        return registry, sale_points
+    return registry, registry.feed(sale_points)
+
+
+def output_path(arguments: argparse.Namespace, source_name: str) -> str:
+    """
+    Return the path to the output file of the ``transform`` command
+    :param arguments: Parsed command line arguments
+    :param source_name: Path or name of the XML file, used to name the default output
+    """
+    if arguments.output is not None:
+        return arguments.output
+    directory = os.path.dirname(source_name)
+    filename = os.path.splitext(os.path.basename(source_name))[0]
+    return os.path.join(directory, f"{filename}.{arguments.format}")
+
+
+def finish_output(arguments: argparse.Namespace, output_file: str):
+    """
+    Write pre-compressed variants of ``output_file``, if asked by ``arguments``,
+    and count the bytes written
+    """
+    paths = [output_file]
+    if arguments.compress:
+        with instrument.stage("compress"):
+            paths.extend(output.compress(output_file))
+    for path in paths:
+        instrument.count_file(path)
+
+
+def count_prices(sale_points: Iterable[SalePoint]) -> Iterator[SalePoint]:
+    """Pass ``sale_points`` through, counting their prices"""
+    for sale_point in sale_points:
+        instrument.count("prices", sum(len(prices) for prices in sale_point.prices.values()))
+        yield sale_point
+
+
+def create_builders(arguments: argparse.Namespace) -> Dict[str, object]:
+    """
+    Create the builders collecting data from the sale points while they are transformed,
+    as asked by ``arguments``
+    :return: Builders, by name of their argument, each with a ``feed()`` method
+    """
+    return {
+        name: getattr(importlib.import_module(f".{module}", __package__), builder)()
+        for name, (module, builder) in BUILDERS.items()
+        if getattr(arguments, name) is not None
+    }
+
+
+def save_collected(
+    arguments: argparse.Namespace,
+    registry: Optional["StationRegistry"],
+    builders: Dict[str, object],
+):
+    """
+    Save what was collected from the sale points while transforming them, if asked by
+    ``arguments``: station registry, history, opening hours, shortages, services
+    and anomalies
+    :param builders: Builders created by ``create_builders()``
+    """
+    if registry is not None:
+        registry.save(arguments.registry)
+        instrument.count_file(arguments.registry)
+    if "history" in builders:
+        from . import history
+
+        with instrument.stage("history"):
+            history.HistoryStore(arguments.history).write(
+                *builders["history"].records(), overwrite=arguments.history_overwrite
+            )
+    if "opening_hours" in builders:
+        parse.save_as_json(builders["opening_hours"].export(), arguments.opening_hours)
+        instrument.count_file(arguments.opening_hours)
+    if "shortages" in builders:
+        from . import shortages
+
+        with instrument.stage("shortages"):
+            exported = shortages.export(
+                builders["shortages"].index(), days=arguments.shortages_days
+            )
+            parse.save_as_json(exported, arguments.shortages)
+        instrument.count_file(arguments.shortages)
+    if "services" in builders:
+        parse.save_as_json(builders["services"].export(), arguments.services)
+        instrument.count_file(arguments.services)
+    if "anomalies" in builders:
+        from . import anomalies
+
+        with instrument.stage("anomalies"):
+            detector = anomalies.AnomalyDetector(arguments.anomaly_sigma, arguments.stale_days)
+            detected = detector.detect(builders["anomalies"].events())
+            parse.save_as_json(anomalies.export(detected, detector), arguments.anomalies)
+        instrument.count("events", builders["anomalies"].count)
+        instrument.count_file(arguments.anomalies)
+
+
+def transform(arguments: argparse.Namespace, source, source_name: str) -> str:
+    """
+    Run the ``transform`` command
+    :param arguments: Parsed command line arguments
+    :param source: Path to the XML file or binary stream of its content
+    :param source_name: Path or name of the XML file, used to name the default output
+    :return: Path to the output file
+    """
+    output_file = output_path(arguments, source_name)
+    builders = create_builders(arguments)
+    if arguments.jobs > 1 and isinstance(source, str) and len(builders) == 0:
+        from . import parallel
+
+        if arguments.latest:
+            with instrument.stage("parse"):
+                sale_points = parallel.degrade_to_latest(source, arguments.jobs, arguments.parser)
+            instrument.count("stations", len(sale_points["data"]))
+        elif arguments.format == "json" and arguments.registry is None:
+            with instrument.stage("parse"):
+                parallel.save_as_json(source, output_file, arguments.jobs, arguments.parser)
+            finish_output(arguments, output_file)
+            print(output_file)
+            return output_file
+        else:
+            sale_points = parse.iter_sale_points(source, parser=arguments.parser)
+    else:
+        sale_points = parse.iter_sale_points(source, parser=arguments.parser)
+        sale_points = count_prices(instrument.timed(sale_points, "parse", "stations"))
+        for builder in builders.values():
+            sale_points = builder.feed(sale_points)
+        if arguments.latest:
+            with instrument.stage("degrade"):
+                sale_points = parse.degrade_to_latest(sale_points)
+    registry = None
+    if arguments.registry is not None:
+        registry, sale_points = register(arguments, sale_points)
+    previous = load_previous(arguments)
+    if arguments.metrics:
+        save_metrics(arguments, sale_points, os.path.dirname(output_file), previous)
+    if arguments.latest:
+        save_latest_outputs(arguments, sale_points, previous)
+    with instrument.stage("save"):
+        output.save(sale_points, output_file, arguments.format)
+    finish_output(arguments, output_file)
+    save_collected(arguments, registry, builders)
+    print(output_file)
+    return output_file
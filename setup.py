@@ -9,7 +9,7 @@ with open("requirements.txt", "r") as f:
     requirements = f.read().splitlines()
 
 setup(
-    name="prixcarburant",
+    name="prixcarburants",
     version="0.0.1",
     description="Fetch french fuel prices",
     license="MIT",
@@ -17,9 +17,10 @@ setup(
     author="Antoine Mandin",
     author_email="doreapp.contact@gmail.com",
     url="https://github.com/Doreapp/prix-carburants",
-    packages=["prixcarburant"],
+    packages=["prixcarburants"],
     install_requires=requirements,
+    extras_require={"numpy": ["numpy"], "lxml": ["lxml"]},
     entry_points={
-        "console_scripts": ["prixcarburant=prixcarburant.__main__"],
+        "console_scripts": ["prixcarburants=prixcarburants.__main__:main"],
     },
 )
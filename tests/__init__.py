@@ -0,0 +1 @@
+"""Tests of the module, run with ``make test``"""
@@ -0,0 +1,20 @@
+"""
+Small synthetic feeds, generated with ``benchmarks/feed.py``,
+to check that the alternative implementations of a stage give the same results.
+"""
+
+import os
+
+from benchmarks import feed
+
+STATIONS = 80  # Sale points of the feeds
+
+
+def generate(directory: str, scale: str = "day", seed: int = 7) -> str:
+    """
+    Write a small feed at the ``scale`` of one of ``feed.SCALES`` in ``directory``
+    :return: Path to the XML file
+    """
+    path = os.path.join(directory, f"{scale}-{seed}.xml")
+    feed.generate(path, STATIONS, feed.SCALES[scale][1], seed)
+    return path
@@ -0,0 +1,69 @@
+"""
+Local HTTP server answering with canned responses, to test the network clients
+without reaching the real services.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+# Handler of a request: (method, path, headers, body) -> (status, headers, body)
+Route = Callable[[str, str, Dict[str, str], bytes], Tuple[int, Dict[str, str], bytes]]
+
+
+class StubServer:
+    """
+    Server on a free local port, answering every request with ``route``.
+    Requests are recorded in ``requests`` as ``(method, path, headers, body)``.
+    Use it as a context manager to start and stop it.
+    """
+
+    def __init__(self, route: Route):
+        self.route = route
+        self.requests: List[Tuple[str, str, Dict[str, str], bytes]] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handler forwarding every request to the route of the stub"""
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length > 0 else b""
+                request = (self.command, self.path, dict(self.headers), body)
+                stub.requests.append(request)
+                status, headers, content = stub.route(*request)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PATCH = _answer
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                """Keep the output of the tests quiet"""
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Base url of the server"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def json_response(status: int, content) -> Tuple[int, Dict[str, str], bytes]:
+    """Return a JSON response, for a route"""
+    return status, {"Content-Type": "application/json"}, json.dumps(content).encode("utf8")
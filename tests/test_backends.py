@@ -0,0 +1,50 @@
+"""Tests of the XML parsers of ``backends.PARSERS`` against each other"""
+
+import os
+import tempfile
+import unittest
+
+from prixcarburants import backends, parse
+
+from . import corpus
+
+
+class TestBackends(unittest.TestCase):
+    """Sale points built by every backend from the same feed"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.feed = corpus.generate(self.directory.name)
+
+    def saved(self, parser: str) -> bytes:
+        """Return the JSON saved from the sale points built by ``parser``"""
+        output = os.path.join(self.directory.name, f"{parser}.json")
+        parse.save_as_json(parse.iter_sale_points(self.feed, parser=parser), output)
+        with open(output, "rb") as stream:
+            return stream.read()
+
+    def assert_same_as_etree(self, parser: str):
+        """Check that ``parser`` builds and saves the same sale points as ``etree``"""
+        reference = parse.build_sale_points(self.feed, parser="etree")
+        self.assertEqual(len(reference), corpus.STATIONS)
+        self.assertEqual(parse.build_sale_points(self.feed, parser=parser), reference)
+        for epoch in (False, True):
+            with open(self.feed, "rb") as stream:
+                expected = list(backends.PARSERS["etree"](stream, epoch))
+            with open(self.feed, "rb") as stream:
+                self.assertEqual(list(backends.PARSERS[parser](stream, epoch)), expected)
+        self.assertEqual(self.saved(parser), self.saved("etree"))
+
+    def test_expat(self):
+        """expat builds the same sale points as etree"""
+        self.assert_same_as_etree("expat")
+
+    @unittest.skipUnless(backends.lxml_etree is not None, "lxml is not installed")
+    def test_lxml(self):
+        """lxml builds the same sale points as etree"""
+        self.assert_same_as_etree("lxml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""Tests of ``distribution.build_distributions()``, with and without NumPy"""
+
+import tempfile
+import unittest
+
+from prixcarburants import distribution, parse
+from prixcarburants.models import FuelType
+
+from . import corpus
+
+
+def degraded(postcode: str, price: float) -> list:
+    """Return a sale point degraded to latest, selling only diesel at ``price``"""
+    return [48.85, 2.35, "1 rue de Rivoli", postcode, "Paris", price] + [-1] * (len(FuelType) - 1)
+
+
+class TestDistributions(unittest.TestCase):
+    """Distributions of the latest prices"""
+
+    def test_percentiles(self):
+        """Percentiles interpolated linearly between the closest prices"""
+        sale_points = [degraded("75001", price) for price in (1.5, 1.2, 1.1, 1.4, 1.3)]
+        for vectorized in (False, True) if distribution.numpy is not None else (False,):
+            result = distribution.build_distributions(sale_points, vectorized=vectorized)
+            expected = [5, 1.1, 1.14, 1.3, 1.46, 1.5]
+            self.assertEqual(result["distributions_global"][0], expected)
+            department = parse.get_department_index(75001)
+            self.assertEqual(result["distributions_by_departments"][0][department], expected)
+            self.assertEqual(result["distributions_global"][1], [0, -1, -1, -1, -1, -1])
+
+    @unittest.skipUnless(distribution.numpy is not None, "NumPy is not installed")
+    def test_vectorized(self):
+        """Same distributions with NumPy as without, on a feed"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = corpus.generate(directory)
+            sale_points = parse.degrade_to_latest(parse.iter_sale_points(path))
+        self.assertEqual(
+            distribution.build_distributions(sale_points, vectorized=True),
+            distribution.build_distributions(sale_points, vectorized=False),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Tests of the conditional downloads of ``fetch.DataFechter``"""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from prixcarburants import fetch
+
+from .stub import StubServer
+
+
+def zip_of(name: str, content: bytes) -> bytes:
+    """Return a ZIP archive holding the single file ``name``"""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr(name, content)
+    return archive.getvalue()
+
+
+class TestCachedDownload(unittest.TestCase):
+    """Downloads with a cache manifest, from a stub of the feed"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.body = zip_of("PrixCarburants_instantane.xml", b"<pdv_liste/>")
+        self.etag = '"v1"'
+        self.honor_etag = True
+
+    def route(self, _method, _path, headers, _body):
+        """Answer like the feed, ``304`` when the ETag matches if ``honor_etag``"""
+        if self.honor_etag and headers.get("If-None-Match") == self.etag:
+            return 304, {"ETag": self.etag}, b""
+        return 200, {"ETag": self.etag, "Content-Type": "application/zip"}, self.body
+
+    def test_download_not_modified_then_changed(self):
+        """First download, then ``304``, then changed content with the same ETag"""
+        manifest_path = os.path.join(self.directory.name, "cache", "fetch.json")
+        output = os.path.join(self.directory.name, "data")
+        with StubServer(self.route) as server, mock.patch.object(
+            fetch, "INSTANTANEOUS_URL", server.url + "/instantane"
+        ):
+            fetcher = fetch.DataFechter(output, manifest_path)
+            path = fetcher.download_instantaneous_data()
+            self.assertEqual(path, os.path.join(output, "PrixCarburants_instantane.xml"))
+            fetcher.save_manifest()
+            with open(manifest_path, "r", encoding="utf8") as stream:
+                first = json.load(stream)[server.url + "/instantane"]
+            self.assertEqual(first["etag"], self.etag)
+            self.assertNotIn("If-None-Match", server.requests[0][2])
+
+            os.remove(path)
+            fetcher = fetch.DataFechter(output, manifest_path)  # Manifest read back from disk
+            self.assertIsNone(fetcher.download_instantaneous_data())
+            self.assertEqual(server.requests[1][2]["If-None-Match"], self.etag)
+            self.assertFalse(os.path.exists(path))
+
+            # Same content served again without honoring the ETag: skipped by its sha256
+            self.honor_etag = False
+            self.assertIsNone(fetcher.download_instantaneous_data())
+            self.assertFalse(os.path.exists(path))
+
+            # Changed content under the same ETag: detected by its sha256
+            self.body = zip_of("PrixCarburants_instantane.xml", b"<pdv_liste></pdv_liste>")
+            path = fetcher.download_instantaneous_data()
+            with open(path, "rb") as stream:
+                self.assertEqual(stream.read(), b"<pdv_liste></pdv_liste>")
+            fetcher.save_manifest()
+            with open(manifest_path, "r", encoding="utf8") as stream:
+                last = json.load(stream)[server.url + "/instantane"]
+            self.assertEqual(last["etag"], self.etag)
+            self.assertNotEqual(last["sha256"], first["sha256"])
+        self.assertEqual(len(server.requests), 4)
+
+    def test_download_not_saved(self):
+        """Downloads not saved in the manifest, e.g. after a failed transform, are done again"""
+        manifest_path = os.path.join(self.directory.name, "fetch.json")
+        pending_path = os.path.join(self.directory.name, "fetch.pending.json")
+        output = os.path.join(self.directory.name, "data")
+        with StubServer(self.route) as server, mock.patch.object(
+            fetch, "INSTANTANEOUS_URL", server.url + "/instantane"
+        ):
+            fetcher = fetch.DataFechter(output, manifest_path)
+            self.assertIsNotNone(fetcher.download_instantaneous_data())
+            self.assertFalse(os.path.exists(manifest_path))
+            # Neither the same fetcher nor a new one consider the content as seen
+            self.assertIsNotNone(fetcher.download_instantaneous_data())
+            self.assertNotIn("If-None-Match", server.requests[1][2])
+            fetcher = fetch.DataFechter(output, manifest_path)
+            self.assertIsNotNone(fetcher.download_instantaneous_data())
+            self.assertNotIn("If-None-Match", server.requests[2][2])
+
+            fetcher.save_manifest(pending_path)
+            self.assertFalse(os.path.exists(manifest_path))
+            os.replace(pending_path, manifest_path)
+            self.assertIsNone(
+                fetch.DataFechter(output, manifest_path).download_instantaneous_data()
+            )
+            self.assertEqual(server.requests[3][2]["If-None-Match"], self.etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests of the writes of ``history.HistoryStore`` over days already stored"""
+
+import os
+import tempfile
+import unittest
+from array import array
+from datetime import date
+
+from prixcarburants import history
+from prixcarburants.models import FuelType
+
+
+class TestHistoryWrite(unittest.TestCase):
+    """Writes of records over, before and after the days of a store"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "history.bin")
+
+    def record(self, value: float) -> array:
+        """Return a record holding ``value`` in every column"""
+        return array("f", [value] * history.HistoryStore(self.path).width)
+
+    def national(self, start: int, end: int) -> list:
+        """Return the national averages of diesel, from ``start`` to ``end``"""
+        days, averages = history.HistoryStore(self.path).query(start, end, FuelType.GAZOLE, "FR")
+        return list(zip(days, (values[0] for values in averages)))
+
+    def test_same_day_twice(self):
+        """A day written again is kept, unless overwritten"""
+        day = history.to_day(date(2022, 1, 10))
+        history.HistoryStore(self.path).write(day, [self.record(1.5)])
+        history.HistoryStore(self.path).write(day, [self.record(1.25)])
+        self.assertEqual(self.national(day, day), [(day, 1.5)])
+
+        history.HistoryStore(self.path).write(day, [self.record(1.25)], overwrite=True)
+        self.assertEqual(self.national(day, day), [(day, 1.25)])
+
+    def test_overlap(self):
+        """Only the days before and after the ones stored are written"""
+        day = history.to_day(date(2022, 1, 10))
+        history.HistoryStore(self.path).write(day, [self.record(1.5), self.record(1.75)])
+        records = [self.record(value) for value in (1.0, 1.25, 2.0, 2.25, 2.5)]
+        history.HistoryStore(self.path).write(day - 2, records)
+        self.assertEqual(
+            self.national(day - 2, day + 2),
+            [(day - 2, 1.0), (day - 1, 1.25), (day, 1.5), (day + 1, 1.75), (day + 2, 2.5)],
+        )
+        store = history.HistoryStore(self.path)
+        self.assertEqual((store.first_day, store.last_day), (day - 2, day + 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests of the sharded transform, ``transform --jobs``, against the serial one"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from prixcarburants import parallel, parse
+
+from . import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def transform(arguments: list, hash_seed: str) -> bytes:
+    """
+    Run the ``transform`` command with ``arguments`` in a separate interpreter,
+    whose sets are ordered by ``hash_seed``
+    :return: Content of the output file
+    """
+    output = arguments[arguments.index("-o") + 1]
+    subprocess.run(
+        [sys.executable, "-m", "prixcarburants", "transform", *arguments],
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONHASHSEED=hash_seed),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    with open(output, "rb") as stream:
+        return stream.read()
+
+
+class TestParallelTransform(unittest.TestCase):
+    """Outputs of ``transform --jobs 2`` and of the serial transform"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.feed = corpus.generate(self.directory.name)
+
+    def output(self, name: str) -> str:
+        """Return the path to the output ``name``"""
+        return os.path.join(self.directory.name, name)
+
+    def test_full_json(self):
+        """Same bytes, whatever the jobs and the hash seeds of the processes"""
+        serial = transform([self.feed, "-o", self.output("serial.json")], "1")
+        self.assertEqual(transform([self.feed, "-o", self.output("other.json")], "2"), serial)
+        sharded = transform([self.feed, "-j", "2", "-o", self.output("sharded.json")], "3")
+        self.assertEqual(sharded, serial)
+
+    def test_latest(self):
+        """Same latest data, whatever the jobs"""
+        serial = transform([self.feed, "--latest", "-o", self.output("serial.json")], "1")
+        arguments = [self.feed, "--latest", "-j", "2", "-o", self.output("sharded.json")]
+        self.assertEqual(transform(arguments, "2"), serial)
+
+    def test_degrade_to_latest(self):
+        """Same degraded sale points, in the same order, whatever the shards"""
+        serial = parse.degrade_to_latest(parse.iter_sale_points(self.feed))
+        for jobs in (1, 2, 3):
+            self.assertEqual(parallel.degrade_to_latest(self.feed, jobs), serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
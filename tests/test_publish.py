@@ -0,0 +1,110 @@
+"""Tests of ``publish.Publisher``, against a stub of the Git Data API"""
+
+import base64
+import json
+import os
+import tempfile
+import unittest
+
+from prixcarburants import publish
+
+from .stub import StubServer, json_response
+
+PREFIX = "/repos/owner/name/git/"
+
+
+def publisher_to(server: StubServer) -> publish.Publisher:
+    """Return a publisher to the branch of the ``server``"""
+    return publish.Publisher("token", "owner/name", "gh-pages", server.url, workers=2)
+
+
+class TestPublisher(unittest.TestCase):
+    """Publication of files through a stub of the Git Data API"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.files = {}
+        for name, content in (
+            ("same.json", b"[1]"),
+            ("changed.json", b"[2]"),
+            ("new.json", b"[3]"),
+        ):
+            path = os.path.join(self.directory.name, name)
+            with open(path, "wb") as stream:
+                stream.write(content)
+            self.files[f"assets/{name}"] = path
+        self.remote = {
+            "assets/same.json": publish.blob_sha(b"[1]"),
+            "assets/changed.json": publish.blob_sha(b"[0]"),
+            "index.html": publish.blob_sha(b"<html></html>"),
+        }
+
+    def route(self, method, path, _headers, body):
+        """Answer like the Git Data API, for a branch whose tree holds ``remote``"""
+        self.assertTrue(path.startswith(PREFIX), path)
+        path = path[len(PREFIX) :]
+        if (method, path) == ("POST", "blobs"):
+            content = base64.b64decode(json.loads(body)["content"])
+            return json_response(201, {"sha": publish.blob_sha(content)})
+        items = [{"path": key, "type": "blob", "sha": sha} for key, sha in self.remote.items()]
+        items.append({"path": "assets", "type": "tree", "sha": "tree1"})
+        answers = {
+            ("GET", "ref/heads/gh-pages"): {"object": {"sha": "commit0"}},
+            ("GET", "commits/commit0"): {"tree": {"sha": "tree0"}},
+            ("GET", "trees/tree0?recursive=1"): {"tree": items, "truncated": False},
+            ("POST", "trees"): {"sha": "tree2"},
+            ("POST", "commits"): {"sha": "commit1"},
+            ("PATCH", "refs/heads/gh-pages"): {"object": {"sha": "commit1"}},
+        }
+        if (method, path) not in answers:
+            return json_response(404, {"message": "Not Found"})
+        return json_response(201 if method == "POST" else 200, answers[(method, path)])
+
+    def test_publish_changed_files(self):
+        """Blobs of the changed files only, then a tree, a commit and the reference"""
+        with StubServer(self.route) as server:
+            self.assertEqual(publisher_to(server).publish(self.files, "Update"), "commit1")
+        requests = [(method, path[len(PREFIX) :]) for method, path, _, _ in server.requests]
+        self.assertEqual(
+            requests,
+            [
+                ("GET", "ref/heads/gh-pages"),
+                ("GET", "commits/commit0"),
+                ("GET", "trees/tree0?recursive=1"),
+                ("POST", "blobs"),
+                ("POST", "blobs"),
+                ("POST", "trees"),
+                ("POST", "commits"),
+                ("PATCH", "refs/heads/gh-pages"),
+            ],
+        )
+        self.assertEqual(server.requests[0][2]["Authorization"], "Bearer token")
+        uploaded = sorted(
+            base64.b64decode(json.loads(body)["content"]) for *_, body in server.requests[3:5]
+        )
+        self.assertEqual(uploaded, [b"[2]", b"[3]"])
+        tree = json.loads(server.requests[5][3])
+        self.assertEqual(tree["base_tree"], "tree0")
+        self.assertEqual(
+            {entry["path"]: entry["sha"] for entry in tree["tree"]},
+            {
+                "assets/changed.json": publish.blob_sha(b"[2]"),
+                "assets/new.json": publish.blob_sha(b"[3]"),
+            },
+        )
+        commit = json.loads(server.requests[6][3])
+        self.assertEqual(commit, {"message": "Update", "tree": "tree2", "parents": ["commit0"]})
+        self.assertEqual(json.loads(server.requests[7][3]), {"sha": "commit1"})
+
+    def test_publish_unchanged_files(self):
+        """Nothing is uploaded nor committed when every file is up to date"""
+        self.remote["assets/changed.json"] = publish.blob_sha(b"[2]")
+        self.remote["assets/new.json"] = publish.blob_sha(b"[3]")
+        with StubServer(self.route) as server:
+            self.assertIsNone(publisher_to(server).publish(self.files))
+        self.assertEqual([method for method, _, _, _ in server.requests], ["GET"] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
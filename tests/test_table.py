@@ -0,0 +1,40 @@
+"""Tests of the latest prices and metrics of ``table.SalePointTable`` against ``parse``"""
+
+import tempfile
+import unittest
+
+from prixcarburants import parse, table
+
+from . import corpus
+
+
+class TestSalePointTable(unittest.TestCase):
+    """Latest data of a table, with and without NumPy, and of the sale points it is built from"""
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as directory:
+            path = corpus.generate(directory, "year")
+            cls.degraded = parse.degrade_to_latest(parse.iter_sale_points(path))
+            cls.columns = table.SalePointTable.from_sale_points(
+                parse.iter_sale_points(path, epoch=True)
+            )
+
+    def test_degrade_to_latest(self):
+        """Same latest data as ``parse.degrade_to_latest()``"""
+        self.assertEqual(len(self.columns), corpus.STATIONS)
+        self.assertEqual(self.columns.degrade_to_latest(), self.degraded)
+
+    def test_metrics(self):
+        """Same metrics as ``parse.build_metrics()``"""
+        self.assertEqual(self.columns.metrics(False), parse.build_metrics(self.degraded))
+
+    @unittest.skipUnless(table.numpy is not None, "NumPy is not installed")
+    def test_vectorized(self):
+        """Same latest prices and metrics with NumPy as without"""
+        self.assertEqual(self.columns.latest_prices(True), self.columns.latest_prices(False))
+        self.assertEqual(self.columns.metrics(True), self.columns.metrics(False))
+
+
+if __name__ == "__main__":
+    unittest.main()